@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0002_remove_cliente_cpf_cnpj_remove_cliente_endereco'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='lavador',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='veiculo',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['atualizado_em', 'id'], name='cliente_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lavador',
+            index=models.Index(fields=['atualizado_em', 'id'], name='lavador_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='veiculo',
+            index=models.Index(fields=['atualizado_em', 'id'], name='veiculo_sync_idx'),
+        ),
+    ]
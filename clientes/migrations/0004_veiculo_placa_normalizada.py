@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:40
+
+import re
+
+from django.db import migrations, models
+
+# Cópia de clientes.placas.normalizar_placa no momento desta migração.
+_PLACA_BRASILEIRA = re.compile(r'^([A-Z]{3}\d)([A-Z0-9])(\d{2})$')
+_SEPARADORES = re.compile(r'[^A-Z0-9]')
+_DIGITO_MERCOSUL = {letra: str(digito) for digito, letra in enumerate('ABCDEFGHIJ')}
+
+
+def normalizar_placa(texto):
+    placa = _SEPARADORES.sub('', (texto or '').upper())
+    partes = _PLACA_BRASILEIRA.match(placa)
+    if partes and partes.group(2) in _DIGITO_MERCOSUL:
+        return partes.group(1) + _DIGITO_MERCOSUL[partes.group(2)] + partes.group(3)
+    return placa
+
+
+def preencher_placas(apps, schema_editor):
+    Veiculo = apps.get_model('clientes', 'Veiculo')
+    veiculos = list(Veiculo.objects.only('id', 'placa'))
+    for veiculo in veiculos:
+        veiculo.placa_normalizada = normalizar_placa(veiculo.placa)
+    Veiculo.objects.bulk_update(veiculos, ['placa_normalizada'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0003_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='veiculo',
+            name='placa_normalizada',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=10, verbose_name='Placa Normalizada'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(preencher_placas, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 
+from .placas import normalizar_placa
+
 
 class Cliente(models.Model):
     """
@@ -10,10 +12,12 @@ class Cliente(models.Model):
     email = models.EmailField('E-mail', blank=True)
     observacoes = models.TextField('Observações', blank=True)
     ativo = models.BooleanField('Ativo', default=True)
+    atualizado_em = models.DateTimeField('Atualizado em', auto_now=True)
 
     class Meta:
         verbose_name = 'Cliente'
         verbose_name_plural = 'Clientes'
+        indexes = [models.Index(fields=['atualizado_em', 'id'], name='cliente_sync_idx')]
         ordering = ['nome']
 
     def __str__(self):
@@ -36,6 +40,8 @@ class Veiculo(models.Model):
 
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='veiculos')
     placa = models.CharField('Placa', max_length=10, unique=True)
+    # Forma canônica (clientes.placas): "ABC-1234", "ABC1234" e "ABC1C34" são a mesma.
+    placa_normalizada = models.CharField('Placa Normalizada', max_length=10, db_index=True, editable=False)
     modelo = models.CharField('Modelo', max_length=100)
     marca = models.CharField('Marca', max_length=50)
     ano = models.PositiveIntegerField('Ano', null=True, blank=True)
@@ -43,15 +49,21 @@ class Veiculo(models.Model):
     tipo = models.CharField('Tipo', max_length=20, choices=TIPOS_VEICULO, default='CARRO')
     observacoes = models.TextField('Observações', blank=True)
     ativo = models.BooleanField('Ativo', default=True)
+    atualizado_em = models.DateTimeField('Atualizado em', auto_now=True)
 
     class Meta:
         verbose_name = 'Veículo'
         verbose_name_plural = 'Veículos'
+        indexes = [models.Index(fields=['atualizado_em', 'id'], name='veiculo_sync_idx')]
         ordering = ['placa']
 
     def __str__(self):
         return f"{self.placa} - {self.marca} {self.modelo}"
 
+    def save(self, *args, **kwargs):
+        self.placa_normalizada = normalizar_placa(self.placa)
+        super().save(*args, **kwargs)
+
 
 class Lavador(models.Model):
     """
@@ -64,10 +76,12 @@ class Lavador(models.Model):
     salario = models.DecimalField('Salário', max_digits=10, decimal_places=2, null=True, blank=True)
     observacoes = models.TextField('Observações', blank=True)
     ativo = models.BooleanField('Ativo', default=True)
+    atualizado_em = models.DateTimeField('Atualizado em', auto_now=True)
 
     class Meta:
         verbose_name = 'Lavador'
         verbose_name_plural = 'Lavadores'
+        indexes = [models.Index(fields=['atualizado_em', 'id'], name='lavador_sync_idx')]
         ordering = ['nome']
 
     def __str__(self):
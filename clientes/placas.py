@@ -0,0 +1,74 @@
+"""
+Placas de veículos em forma canônica.
+
+A mesma placa chega como "ABC-1234", "abc1234" ou, depois da troca para o
+padrão Mercosul, "ABC1C34" (o segundo dígito vira letra: 0=A, 1=B ... 9=J).
+Veiculo, Lavagem e Agendamento guardam, além da placa digitada, a coluna
+indexada `placa_normalizada`:
+
+- maiúsculas, só letras e dígitos;
+- placas no formato brasileiro (antigo ou Mercosul) no formato antigo, então
+  "ABC-1234", "ABC1234" e "ABC1C34" têm a mesma forma canônica;
+- qualquer outro texto só em maiúsculas e sem separadores.
+
+A busca aproximada (um erro de digitação: troca, falta, sobra ou inversão de
+dois caracteres vizinhos) não percorre a tabela: gera as variantes da placa
+digitada que têm formato de placa e procura todas no índice com um IN.
+"""
+import re
+import string
+
+PLACA_VALIDA = re.compile(r"^[A-Z]{3}-?\d[A-Z0-9]\d{2}$")
+_PLACA_CANONICA = re.compile(r"^[A-Z]{3}\d{4}$")
+_PLACA_BRASILEIRA = re.compile(r"^([A-Z]{3}\d)([A-Z0-9])(\d{2})$")
+_SEPARADORES = re.compile(r"[^A-Z0-9]")
+_ALFABETO = string.ascii_uppercase + string.digits
+
+# Letra do Mercosul -> dígito do formato antigo
+_DIGITO_MERCOSUL = {letra: str(digito) for digito, letra in enumerate("ABCDEFGHIJ")}
+
+
+def normalizar_placa(texto):
+    """Forma canônica de `texto` (ver o docstring do módulo)."""
+    placa = _SEPARADORES.sub("", (texto or "").upper())
+    partes = _PLACA_BRASILEIRA.match(placa)
+    if partes and partes.group(2) in _DIGITO_MERCOSUL:
+        return partes.group(1) + _DIGITO_MERCOSUL[partes.group(2)] + partes.group(3)
+    return placa
+
+
+def eh_placa(texto):
+    """Se `texto` é uma placa completa (antiga ou Mercosul), com ou sem traço."""
+    return bool(_PLACA_CANONICA.match(normalizar_placa(texto)))
+
+
+def variantes_placa(texto):
+    """
+    Formas canônicas a uma edição de distância de `texto` (Damerau-Levenshtein
+    1) que têm formato de placa; a própria placa fica de fora.
+    """
+    placa = _SEPARADORES.sub("", (texto or "").upper())
+    edicoes = set()
+    for i in range(len(placa) + 1):
+        inicio, fim = placa[:i], placa[i:]
+        edicoes.update(inicio + caractere + fim for caractere in _ALFABETO)
+        if fim:
+            edicoes.add(inicio + fim[1:])
+            edicoes.update(inicio + caractere + fim[1:] for caractere in _ALFABETO)
+        if len(fim) > 1:
+            edicoes.add(inicio + fim[1] + fim[0] + fim[2:])
+    canonicas = {normalizar_placa(edicao) for edicao in edicoes}
+    canonicas.discard(normalizar_placa(placa))
+    return sorted(candidata for candidata in canonicas if _PLACA_CANONICA.match(candidata))
+
+
+def filtrar_placa(queryset, texto, aproximada=False):
+    """
+    Linhas de `queryset` (modelo com `placa_normalizada`) com a placa `texto`.
+    Com `aproximada`, se nenhuma linha tiver exatamente essa placa, devolve
+    as que estão a um erro de digitação dela.
+    """
+    exatas = queryset.filter(placa_normalizada=normalizar_placa(texto))
+    if not aproximada or exatas.exists():
+        return exatas
+    return queryset.filter(placa_normalizada__in=variantes_placa(texto))
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.utils.html import format_html
 from .models import Lavagem
 from .agendamento_models import Agendamento
+from .transicoes import transicionar_agendamentos, transicionar_lavagens
 
 
 @admin.register(Lavagem)
@@ -67,17 +68,18 @@ class LavagemAdmin(admin.ModelAdmin):
         return "Em andamento"
     duracao_lavagem.short_description = 'Duração'
 
-    actions = ['marcar_como_concluida']
+    actions = ['marcar_como_concluida', 'cancelar_lavagens']
 
     def marcar_como_concluida(self, request, queryset):
-        count = 0
-        for lavagem in queryset:
-            if lavagem.status == 'EM_ANDAMENTO':
-                lavagem.concluir_lavagem()
-                count += 1
+        count = len(transicionar_lavagens(queryset, 'concluir'))
         self.message_user(request, f'{count} lavagens marcadas como concluídas.')
     marcar_como_concluida.short_description = 'Marcar como concluída'
 
+    def cancelar_lavagens(self, request, queryset):
+        count = len(transicionar_lavagens(queryset, 'cancelar', motivo='Cancelada via admin'))
+        self.message_user(request, f'{count} lavagens canceladas.')
+    cancelar_lavagens.short_description = 'Cancelar lavagens'
+
 
 @admin.register(Agendamento)
 class AgendamentoAdmin(admin.ModelAdmin):
@@ -156,26 +158,23 @@ class AgendamentoAdmin(admin.ModelAdmin):
             return format_html('<span style="color: green;">✓ No prazo</span>')
     esta_vencido.short_description = 'Status Prazo'
 
-    actions = ['confirmar_agendamentos', 'cancelar_agendamentos', 'iniciar_lavagens']
+    actions = ['confirmar_agendamentos', 'cancelar_agendamentos', 'marcar_nao_compareceu', 'iniciar_lavagens']
 
     def confirmar_agendamentos(self, request, queryset):
-        count = 0
-        for agendamento in queryset:
-            if agendamento.status == 'AGENDADO':
-                agendamento.confirmar_agendamento(confirmado_por=request.user.username)
-                count += 1
+        count = len(transicionar_agendamentos(queryset, 'confirmar', confirmado_por=request.user.username))
         self.message_user(request, f'{count} agendamentos confirmados.')
     confirmar_agendamentos.short_description = 'Confirmar agendamentos'
 
     def cancelar_agendamentos(self, request, queryset):
-        count = 0
-        for agendamento in queryset:
-            if agendamento.pode_ser_cancelado:
-                agendamento.cancelar_agendamento(motivo='Cancelado via admin')
-                count += 1
+        count = len(transicionar_agendamentos(queryset, 'cancelar', motivo='Cancelado via admin'))
         self.message_user(request, f'{count} agendamentos cancelados.')
     cancelar_agendamentos.short_description = 'Cancelar agendamentos'
 
+    def marcar_nao_compareceu(self, request, queryset):
+        count = len(transicionar_agendamentos(queryset, 'nao_compareceu'))
+        self.message_user(request, f'{count} agendamentos marcados como não compareceu.')
+    marcar_nao_compareceu.short_description = 'Marcar como não compareceu'
+
     def iniciar_lavagens(self, request, queryset):
         count = 0
         for agendamento in queryset:
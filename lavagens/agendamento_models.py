@@ -3,6 +3,7 @@ from django.utils import timezone
 from django.core.exceptions import ValidationError
 from clientes.models import Cliente, Veiculo, Lavador
 from clientes.models import Lavador
+from clientes.placas import normalizar_placa
 from decimal import Decimal
 from datetime import datetime
 
@@ -64,6 +65,8 @@ class Agendamento(models.Model):
         help_text="Lavadores designados (opcional)"
     )
     placa_veiculo = models.CharField("Placa do Veículo", max_length=10)
+    # Forma canônica (clientes.placas), para buscar sem depender do formato digitado.
+    placa_normalizada = models.CharField("Placa Normalizada", max_length=10, db_index=True, editable=False)
     data_agendamento = models.DateField("Data do Agendamento")
     hora_agendamento = models.TimeField("Hora do Agendamento")
     duracao_estimada = models.PositiveIntegerField(
@@ -124,6 +127,8 @@ class Agendamento(models.Model):
         help_text="Lavagem criada a partir deste agendamento"
     )
     
+    atualizado_em = models.DateTimeField("Atualizado em", auto_now=True)
+    
     class Meta:
         verbose_name = "Agendamento"
         verbose_name_plural = "Agendamentos"
@@ -132,10 +137,23 @@ class Agendamento(models.Model):
         unique_together = [
             ["data_agendamento", "hora_agendamento", "local"]
         ]
+        indexes = [
+            # Keyset da API (lavagens.paginacao)
+            models.Index(fields=["data_agendamento", "hora_agendamento", "id"], name="agendamento_keyset_idx"),
+            # Sincronização incremental (lavagens.sincronizacao)
+            models.Index(fields=["atualizado_em", "id"], name="agendamento_sync_idx"),
+        ]
 
     def __str__(self):
         return f"{self.codigo} - {self.placa_veiculo} ({self.data_agendamento} {self.hora_agendamento})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Status e base carregados: o feed ao vivo só publica quando mudam.
+        instancia._evento_original = (instancia.__dict__.get("status"), instancia.__dict__.get("base_id"))
+        return instancia
+
     def save(self, *args, **kwargs):
         if not self.codigo:
             import random
@@ -143,6 +161,7 @@ class Agendamento(models.Model):
             self.codigo = "AGD" + "".join(random.choices(string.ascii_uppercase + string.digits, k=6))
         if not self.duracao_estimada:
             self.duracao_estimada = 30 # Duração fixa
+        self.placa_normalizada = normalizar_placa(self.placa_veiculo)
         
         super().save(*args, **kwargs)
 
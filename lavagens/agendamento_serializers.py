@@ -1,48 +1,79 @@
 from rest_framework import serializers
 from django.utils import timezone
 from .agendamento_models import Agendamento
+from .anotacoes import CampoAnotado, DataHoraAnotadaField, RotuloEscolhaField
+from .campos_dinamicos import CamposDinamicosSerializerMixin
 from .models import Lavagem
+from .serializers import ClienteSerializer, LavadorResumoSerializer, TransicaoLavagensSerializer, VeiculoSerializer
+from .transicoes import TRANSICOES_AGENDAMENTO
 from clientes.models import Cliente, Veiculo, Lavador
 
 
-class AgendamentoListSerializer(serializers.ModelSerializer):
+# Propriedades de Agendamento e as colunas que elas leem (também quando o
+# valor vem anotado pelo banco: sem a anotação, o campo usa a propriedade).
+_DEPENDENCIAS_AGENDAMENTO = {
+    'status_display': ['status'],
+    'prioridade_display': ['prioridade'],
+    'data_hora_agendamento': ['data_agendamento', 'hora_agendamento'],
+    'esta_vencido': ['data_agendamento', 'hora_agendamento'],
+    'pode_ser_cancelado': ['status'],
+    'pode_iniciar_lavagem': ['status', 'data_agendamento', 'hora_agendamento'],
+}
+
+
+class AgendamentoListSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
     cliente_nome = serializers.CharField(source='cliente.nome', read_only=True)
-    lavador_nome = serializers.CharField(source='lavador.nome', read_only=True)
-    status_display = serializers.CharField(source='get_status_display', read_only=True)
-    prioridade_display = serializers.CharField(source='get_prioridade_display', read_only=True)
-    data_hora_agendamento = serializers.DateTimeField(read_only=True)
-    esta_vencido = serializers.BooleanField(read_only=True)
+    lavadores_nomes = serializers.SlugRelatedField(
+        source='lavadores', slug_field='nome', many=True, read_only=True
+    )
+    status_display = RotuloEscolhaField(source='status')
+    prioridade_display = RotuloEscolhaField(source='prioridade')
+    data_hora_agendamento = DataHoraAnotadaField()
+    esta_vencido = CampoAnotado('vencido')
     pode_ser_cancelado = serializers.BooleanField(read_only=True)
-    pode_iniciar_lavagem = serializers.BooleanField(read_only=True)
+    pode_iniciar_lavagem = CampoAnotado('iniciavel')
     
     class Meta:
         model = Agendamento
         fields = [
             'id', 'codigo', 'placa_veiculo', 'data_agendamento', 'hora_agendamento',
             'status', 'status_display', 'prioridade', 'prioridade_display',
-            'cliente_nome', 'base', 'local', 'tipo_lavagem', 'transporte_equipamento', 'lavador_nome',
+            'cliente_nome', 'base', 'local', 'tipo_lavagem', 'transporte_equipamento', 'lavadores_nomes',
             'valor_estimado', 'telefone_contato', 'observacoes',
-            'data_hora_agendamento', 'esta_vencido', 'pode_ser_cancelado', 'pode_iniciar_lavagem',
-            'created_at'
+            'data_hora_agendamento', 'esta_vencido', 'pode_ser_cancelado', 'pode_iniciar_lavagem'
         ]
+        expansiveis = {
+            'cliente': ClienteSerializer,
+            'veiculo': VeiculoSerializer,
+            'lavadores': LavadorResumoSerializer,
+        }
+        dependencias = _DEPENDENCIAS_AGENDAMENTO
 
 
-class AgendamentoDetailSerializer(serializers.ModelSerializer):
+class AgendamentoDetailSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
     cliente_nome = serializers.CharField(source='cliente.nome', read_only=True)
     veiculo_info = serializers.SerializerMethodField()
-    lavador_nome = serializers.CharField(source='lavador.nome', read_only=True)
-    status_display = serializers.CharField(source='get_status_display', read_only=True)
-    prioridade_display = serializers.CharField(source='get_prioridade_display', read_only=True)
-    data_hora_agendamento = serializers.DateTimeField(read_only=True)
+    lavadores_nomes = serializers.SlugRelatedField(
+        source='lavadores', slug_field='nome', many=True, read_only=True
+    )
+    status_display = RotuloEscolhaField(source='status')
+    prioridade_display = RotuloEscolhaField(source='prioridade')
+    data_hora_agendamento = DataHoraAnotadaField()
     horario_fim_estimado = serializers.SerializerMethodField()
-    esta_vencido = serializers.BooleanField(read_only=True)
+    esta_vencido = CampoAnotado('vencido')
     pode_ser_cancelado = serializers.BooleanField(read_only=True)
-    pode_iniciar_lavagem = serializers.BooleanField(read_only=True)
+    pode_iniciar_lavagem = CampoAnotado('iniciavel')
     lavagem_info = serializers.SerializerMethodField()
     
     class Meta:
         model = Agendamento
         fields = '__all__'
+        dependencias = {
+            **_DEPENDENCIAS_AGENDAMENTO,
+            'veiculo_info': ['veiculo.*'],
+            'horario_fim_estimado': ['data_agendamento', 'hora_agendamento', 'duracao_estimada'],
+            'lavagem_info': ['lavagem.*'],
+        }
     
     def get_veiculo_info(self, obj):
         if obj.veiculo:
@@ -77,7 +108,7 @@ class AgendamentoCreateSerializer(serializers.ModelSerializer):
         model = Agendamento
         fields = [
             'cliente', 'veiculo', 'placa_veiculo', 'base', 'local',
-            'tipo_lavagem', 'transporte_equipamento', 'lavador',
+            'tipo_lavagem', 'transporte_equipamento', 'lavadores',
             'data_agendamento', 'hora_agendamento', 'duracao_estimada',
             'prioridade', 'telefone_contato', 'email_contato',
             'observacoes', 'observacoes_internas'
@@ -120,7 +151,7 @@ class AgendamentoUpdateSerializer(serializers.ModelSerializer):
         fields = [
             'data_agendamento', 'hora_agendamento', 'duracao_estimada',
             'prioridade', 'telefone_contato', 'email_contato',
-            'observacoes', 'observacoes_internas', 'lavador'
+            'observacoes', 'observacoes_internas', 'lavadores'
         ]
     
     def validate(self, data):
@@ -158,6 +189,17 @@ class AgendamentoStatusSerializer(serializers.Serializer):
         return data
 
 
+class TransicaoAgendamentosSerializer(TransicaoLavagensSerializer):
+    """Corpo de POST /api/agendamentos/transicao/."""
+    acao = serializers.ChoiceField(choices=list(TRANSICOES_AGENDAMENTO))
+    confirmado_por = serializers.CharField(required=False, allow_blank=True, max_length=100)
+
+    def validate(self, data):
+        if data['acao'] == 'cancelar' and not data.get('motivo'):
+            raise serializers.ValidationError("É obrigatório informar o motivo do cancelamento.")
+        return data
+
+
 class IniciarLavagemSerializer(serializers.Serializer):
     hora_inicio = serializers.DateTimeField(required=False)
     observacoes_adicionais = serializers.CharField(required=False, allow_blank=True, max_length=500)
@@ -172,41 +214,3 @@ class IniciarLavagemSerializer(serializers.Serializer):
             data['hora_inicio'] = timezone.now()
         
         return data
-
-
-class AgendamentoCalendarioSerializer(serializers.ModelSerializer):
-    title = serializers.SerializerMethodField()
-    start = serializers.SerializerMethodField()
-    end = serializers.SerializerMethodField()
-    color = serializers.SerializerMethodField()
-    
-    class Meta:
-        model = Agendamento
-        fields = ['id', 'codigo', 'title', 'start', 'end', 'color', 'status']
-    
-    def get_title(self, obj):
-        return f"{obj.placa_veiculo} - {obj.cliente.nome if obj.cliente else 'Cliente não informado'}"
-    
-    def get_start(self, obj):
-        if obj.data_hora_agendamento:
-            return obj.data_hora_agendamento.isoformat()
-        return None
-    
-    def get_end(self, obj):
-        horario_fim = obj.get_horario_fim_estimado()
-        if horario_fim:
-            return horario_fim.isoformat()
-        return None
-    
-    def get_color(self, obj):
-        colors = {
-            'AGENDADO': '#007bff',
-            'CONFIRMADO': '#28a745',
-            'EM_ANDAMENTO': '#ffc107',
-            'CONCLUIDO': '#6f42c1',
-            'CANCELADO': '#dc3545',
-            'NAO_COMPARECEU': '#6c757d'
-        }
-        return colors.get(obj.status, '#007bff')
-
-
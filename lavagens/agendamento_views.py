@@ -3,7 +3,6 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.utils import timezone
 from django.db.models import Q, Count
-from django.core.paginator import Paginator
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
@@ -14,17 +13,30 @@ from rest_framework.permissions import IsAuthenticated
 from datetime import datetime, timedelta
 import json
 from clientes.models import Lavador
+from clientes.placas import filtrar_placa
 from decimal import Decimal
 
 from .agendamento_models import Agendamento
+from .anotacoes import anotar_agendamentos
+from .busca import filtrar as filtrar_busca
 from .agendamento_serializers import (
     AgendamentoListSerializer, AgendamentoDetailSerializer,
     AgendamentoCreateSerializer, AgendamentoUpdateSerializer,
     AgendamentoStatusSerializer, IniciarLavagemSerializer,
-    AgendamentoCalendarioSerializer
+    TransicaoAgendamentosSerializer
 )
 from clientes.models import Cliente, Veiculo
 from .models import Agendamento, Base, TipoLavagem, TransporteEquipamento
+from .calendario import JANELA_ICS_PADRAO, JanelaInvalida, eventos_periodo, ler_janela, resposta_ics
+from .campos_dinamicos import CamposDinamicosViewSetMixin
+from .condicional import AGENDAMENTOS, CATALOGO, LAVAGENS, resposta_condicional
+from .paginacao import PaginacaoAgendamentos, PaginadorContagemCacheada
+from .transicoes import transicionar_agendamentos
+from .estatisticas import STATUS_AGENDAMENTO, contadores_agendamentos, por_status
+from .exportacao import (
+    CAMPOS_AGENDAMENTO, FORMATOS as FORMATOS_EXPORTACAO, FiltroInvalido, filtrar_agendamentos,
+    resposta_exportacao
+)
 
 
 # Views Django tradicionais
@@ -51,29 +63,23 @@ def agendamentos_dashboard(request):
             pass
     
     if busca:
-        agendamentos = agendamentos.filter(
-            Q(codigo__icontains=busca) |
-            Q(placa_veiculo__icontains=busca) |
-            Q(cliente__nome__icontains=busca) |
-            Q(telefone_contato__icontains=busca)
-        )
+        agendamentos = filtrar_busca(agendamentos, "agendamento", busca, placa_aproximada=True)
     
     agendamentos = agendamentos.order_by("data_agendamento", "hora_agendamento")
     
-    paginator = Paginator(agendamentos, 20)
+    # Contagem no cache e limitada: listas grandes mostram estimativa ou só Anterior/Próxima.
+    paginator = PaginadorContagemCacheada(agendamentos, 20, (AGENDAMENTOS, CATALOGO))
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
     
     hoje = timezone.now().date()
+    contadores = contadores_agendamentos(hoje=hoje)
     stats = {
-        "total": Agendamento.objects.count(),
-        "hoje": Agendamento.objects.filter(data_agendamento=hoje).count(),
-        "agendados": Agendamento.objects.filter(status="AGENDADO").count(),
-        "confirmados": Agendamento.objects.filter(status="CONFIRMADO").count(),
-        "vencidos": Agendamento.objects.filter(
-            data_agendamento__lt=hoje,
-            status__in=["AGENDADO", "CONFIRMADO"]
-        ).count()
+        "total": contadores["total"],
+        "hoje": contadores["hoje"],
+        "agendados": contadores["agendados"],
+        "confirmados": contadores["confirmados"],
+        "vencidos": contadores["vencidos"],
     }
     
     status_choices = Agendamento.STATUS_CHOICES
@@ -236,15 +242,11 @@ def calendario_agendamentos(request):
         mes = timezone.now().month
         ano = timezone.now().year
     
-    agendamentos = Agendamento.objects.filter(
-        data_agendamento__year=ano,
-        data_agendamento__month=mes
-    ).select_related("cliente")
-    
+    # Os eventos vêm do feed da API (/api/agendamentos/calendario/), que o
+    # FullCalendar chama com a janela visível a cada navegação.
     context = {
         "mes": mes,
         "ano": ano,
-        "agendamentos": agendamentos,
     }
     
     return render(request, "lavagens/calendario_agendamentos.html", context)
@@ -290,11 +292,12 @@ def api_verificar_disponibilidade(request):
 
 
 # ViewSet para API REST
-class AgendamentoViewSet(viewsets.ModelViewSet):
+class AgendamentoViewSet(CamposDinamicosViewSetMixin, viewsets.ModelViewSet):
     queryset = Agendamento.objects.select_related(
-        "cliente", "veiculo", "lavador"
-    ).all()
+        "cliente", "veiculo", "base", "tipo_lavagem", "transporte_equipamento", "lavagem"
+    ).prefetch_related("lavadores")
     permission_classes = [IsAuthenticated]
+    pagination_class = PaginacaoAgendamentos
     
     def get_serializer_class(self):
         if self.action == "list":
@@ -303,18 +306,27 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
             return AgendamentoCreateSerializer
         elif self.action in ["update", "partial_update"]:
             return AgendamentoUpdateSerializer
-        elif self.action == "calendario":
-            return AgendamentoCalendarioSerializer
         else:
             return AgendamentoDetailSerializer
     
+    # esta_vencido e pode_iniciar_lavagem mudam com o relógio: o ETag vale por minuto.
+    @resposta_condicional(AGENDAMENTOS, LAVAGENS, CATALOGO, granularidade="minuto")
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @resposta_condicional(AGENDAMENTOS, LAVAGENS, CATALOGO, granularidade="minuto")
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def get_queryset(self):
-        queryset = self.queryset
+        # Anotado a cada requisição: vencido e iniciavel dependem da hora atual.
+        queryset = anotar_agendamentos(self.queryset)
         
         status = self.request.query_params.get("status")
         data_inicio = self.request.query_params.get("data_inicio")
         data_fim = self.request.query_params.get("data_fim")
         busca = self.request.query_params.get("busca")
+        placa = self.request.query_params.get("placa")
         
         if status:
             queryset = queryset.filter(status=status)
@@ -326,13 +338,14 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(data_agendamento__lte=data_fim)
         
         if busca:
-            queryset = queryset.filter(
-                Q(codigo__icontains=busca) |
-                Q(placa_veiculo__icontains=busca) |
-                Q(cliente__nome__icontains=busca)
-            )
+            queryset = filtrar_busca(queryset, "agendamento", busca)
+        
+        if placa:
+            # Qualquer formato da placa; ?placa_aproximada=1 aceita um erro de digitação.
+            aproximada = self.request.query_params.get("placa_aproximada") in ("1", "true")
+            queryset = filtrar_placa(queryset, placa, aproximada=aproximada)
         
-        return queryset.order_by("data_agendamento", "hora_agendamento")
+        return self.podar_queryset(queryset.order_by("data_agendamento", "hora_agendamento"))
     
     @action(detail=True, methods=["post"])
     def confirmar(self, request, pk=None):
@@ -364,6 +377,32 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=["post"])
+    def transicao(self, request):
+        """
+        Confirmar, cancelar ou marcar não comparecimento de vários agendamentos.
+        Corpo: {"acao": "confirmar"|"cancelar"|"nao_compareceu", "ids": [...],
+        "motivo": "", "confirmado_por": ""}
+        """
+        serializer = TransicaoAgendamentosSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+        
+        ids = set(dados["ids"])
+        alterados = transicionar_agendamentos(
+            Agendamento.objects.filter(pk__in=ids),
+            dados["acao"],
+            motivo=dados["motivo"],
+            confirmado_por=dados.get("confirmado_por", request.user.username),
+        )
+        
+        return Response({
+            "acao": dados["acao"],
+            "alterados": sorted(alterados),
+            # Inexistentes ou fora do status de origem da ação
+            "ignorados": sorted(ids - set(alterados)),
+        })
+    
     @action(detail=True, methods=["post"])
     def iniciar_lavagem(self, request, pk=None):
         agendamento = self.get_object()
@@ -395,27 +434,54 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=["get"])
+    # A janela padrão do .ics anda com o dia: o ETag também precisa mudar.
+    @resposta_condicional(AGENDAMENTOS, CATALOGO, granularidade="dia")
     def calendario(self, request):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        """
+        Eventos de ?start= a ?end= (exclusivo) para o FullCalendar, ou em
+        iCalendar com ?formato=ics (sem janela, usa uma janela móvel).
+        """
+        ics = request.query_params.get("formato") == "ics"
+        try:
+            inicio, fim = ler_janela(request.query_params, padrao=JANELA_ICS_PADRAO if ics else None)
+        except JanelaInvalida as erro:
+            return Response({"error": str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        eventos = eventos_periodo(inicio, fim)
+        if ics:
+            return resposta_ics(eventos, request.get_host().split(":")[0])
+        return Response(eventos)
+    
+    @action(detail=False, methods=["get"])
+    def exportar(self, request):
+        """Exporta os agendamentos filtrados em CSV (padrão) ou NDJSON (?formato=ndjson)"""
+        formato = request.query_params.get("formato", "csv")
+        if formato not in FORMATOS_EXPORTACAO:
+            return Response(
+                {"error": "Formato inválido. Use csv ou ndjson"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            agendamentos = filtrar_agendamentos(
+                Agendamento.objects.order_by("data_agendamento", "hora_agendamento", "id"),
+                request.query_params
+            )
+        except FiltroInvalido as erro:
+            return Response({"error": str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+        return resposta_exportacao(agendamentos, CAMPOS_AGENDAMENTO, formato, "agendamentos")
     
     @action(detail=False, methods=["get"])
+    @resposta_condicional(AGENDAMENTOS, granularidade="dia")
     def estatisticas(self, request):
         hoje = timezone.now().date()
+        contadores = contadores_agendamentos(self.get_queryset(), hoje)
         
         stats = {
-            "total": self.get_queryset().count(),
-            "hoje": self.get_queryset().filter(data_agendamento=hoje).count(),
-            "por_status": dict(
-                self.get_queryset().values("status").annotate(
-                    count=Count("id")
-                ).values_list("status", "count")
-            ),
-            "vencidos": self.get_queryset().filter(
-                data_agendamento__lt=hoje,
-                status__in=["AGENDADO", "CONFIRMADO"]
-            ).count()
+            "total": contadores["total"],
+            "hoje": contadores["hoje"],
+            "por_status": por_status(contadores, STATUS_AGENDAMENTO),
+            "vencidos": contadores["vencidos"],
         }
         return Response(stats)
 
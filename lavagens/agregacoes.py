@@ -0,0 +1,302 @@
+"""
+Agregações livres de lavagens (GET /api/lavagens/aggregate/).
+
+Os gráficos novos pedem combinações de agrupamento e métrica que antes
+viravam mais um values().annotate() escrito à mão em relatorios. Aqui a
+consulta é montada a partir de listas fechadas:
+
+    ?group_by=mes,base&metrics=quantidade,valor_total,duracao_p90
+    &data_inicio=2025-01-01&data_fim=2025-06-30&status=CONCLUIDA&base=1,2
+
+- cada dimensão vira uma coluna do GROUP BY (e o nome da relação, pelo
+  join, no mesmo GROUP BY); "lavador" agrupa pela tabela intermediária, então
+  uma lavagem com dois lavadores conta uma vez para cada um. Como filtro sem
+  o agrupamento, lavador vira um IN sobre a tabela intermediária e cada
+  lavagem conta uma vez;
+- quantidade, valor total e duração média saem dessa mesma consulta;
+- percentis de duração também, no PostgreSQL (PERCENTILE_CONT). O SQLite não
+  tem essa função: lá uma segunda consulta lê só (grupo, duração) e os
+  percentis são calculados em Python;
+- no máximo `limit` linhas (LIMITE_LINHAS_MAXIMO); `truncado` avisa o corte.
+
+O resultado passa pelo cache de relatórios (cache_relatorios), versionado
+pelos meses do período.
+"""
+from datetime import date
+from itertools import groupby
+
+from django.db import connections
+from django.db.models import Aggregate, Avg, Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from clientes.placas import normalizar_placa
+
+from .anotacoes import DuracaoSegundos
+from .cache_relatorios import obter_ou_calcular
+from .models import Lavagem
+
+LIMITE_LINHAS_PADRAO = 500
+LIMITE_LINHAS_MAXIMO = 5000
+
+# dimensão: (expressão ou caminho agrupado, caminho do nome exibido ou None)
+DIMENSOES = {
+    "data": ("data_lavagem", None),
+    "semana": (TruncWeek("data_lavagem"), None),
+    "mes": (TruncMonth("data_lavagem"), None),
+    "base": ("base_id", "base__nome"),
+    "tipo_lavagem": ("tipo_lavagem_id", "tipo_lavagem__nome"),
+    "transporte": ("transporte_equipamento_id", "transporte_equipamento__nome"),
+    "lavador": ("lavadores__id", "lavadores__nome"),
+    "contrato": ("contrato", None),
+    # Forma canônica: "ABC-1234" e "ABC1234" são a mesma placa.
+    "placa": ("placa_normalizada", None),
+    "status": ("status", None),
+}
+DIMENSOES_DATA = ("data", "semana", "mes")
+
+# filtro: caminho no modelo (aceita vários valores separados por vírgula)
+FILTROS = {
+    "status": "status",
+    "base": "base_id",
+    "tipo_lavagem": "tipo_lavagem_id",
+    "transporte": "transporte_equipamento_id",
+    "lavador": "lavadores__id",
+    "contrato": "contrato",
+    "placa": "placa_normalizada",
+}
+FILTROS_INTEIROS = ("base", "tipo_lavagem", "transporte", "lavador")
+
+PERCENTIS = {"duracao_p50": 0.5, "duracao_p90": 0.9, "duracao_p99": 0.99}
+METRICAS = ("quantidade", "valor_total", "duracao_media", *PERCENTIS)
+METRICAS_PADRAO = ("quantidade",)
+
+
+class ConsultaInvalida(ValueError):
+    pass
+
+
+class Percentil(Aggregate):
+    """PERCENTILE_CONT(fração) WITHIN GROUP (ORDER BY expressão) — PostgreSQL."""
+
+    function = "PERCENTILE_CONT"
+    template = "%(function)s(%(fracao)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expressao, fracao, **extra):
+        super().__init__(expressao, fracao=float(fracao), **extra)
+
+
+def _duracao():
+    # Término antes do início conta como 0, como em Lavagem.duracao_lavagem.
+    return Case(
+        When(hora_termino__lt=F("hora_inicio"), then=Value(0.0)),
+        default=DuracaoSegundos("hora_inicio", "hora_termino"),
+        output_field=FloatField(),
+    )
+
+
+def _lista(params, nome):
+    return [valor.strip() for valor in params.get(nome, "").split(",") if valor.strip()]
+
+
+def _data(params, nome):
+    valor = params.get(nome)
+    if not valor:
+        return None
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ConsultaInvalida(f"{nome} inválido. Use YYYY-MM-DD.")
+
+
+def ler_consulta(params):
+    """Valida os parâmetros da requisição e devolve a consulta normalizada."""
+    dimensoes = _lista(params, "group_by")
+    invalidas = [nome for nome in dimensoes if nome not in DIMENSOES]
+    if invalidas:
+        raise ConsultaInvalida(f"Dimensões inválidas: {', '.join(invalidas)}. Use: {', '.join(DIMENSOES)}.")
+    if len(set(dimensoes) & set(DIMENSOES_DATA)) > 1:
+        raise ConsultaInvalida("Use apenas uma dimensão de data (data, semana ou mes).")
+
+    metricas = _lista(params, "metrics") or list(METRICAS_PADRAO)
+    invalidas = [nome for nome in metricas if nome not in METRICAS]
+    if invalidas:
+        raise ConsultaInvalida(f"Métricas inválidas: {', '.join(invalidas)}. Use: {', '.join(METRICAS)}.")
+
+    filtros = {}
+    for nome in FILTROS:
+        valores = _lista(params, nome)
+        if nome in FILTROS_INTEIROS:
+            try:
+                valores = [int(valor) for valor in valores]
+            except ValueError:
+                raise ConsultaInvalida(f"{nome} deve ser um ou mais ids numéricos.")
+        elif nome == "placa":
+            valores = [normalizar_placa(valor) for valor in valores]
+        if valores:
+            filtros[nome] = sorted(valores)
+
+    data_inicio, data_fim = _data(params, "data_inicio"), _data(params, "data_fim")
+    if data_inicio and data_fim and data_fim < data_inicio:
+        raise ConsultaInvalida("data_fim deve ser igual ou posterior a data_inicio.")
+
+    ordenacao = params.get("order_by") or ""
+    ordenaveis = [*dimensoes, *(nome for nome in metricas if nome not in PERCENTIS)]
+    if ordenacao and ordenacao.lstrip("-") not in ordenaveis:
+        raise ConsultaInvalida(f"order_by deve ser uma destas colunas: {', '.join(ordenaveis)}.")
+
+    try:
+        limite = int(params.get("limit") or LIMITE_LINHAS_PADRAO)
+    except ValueError:
+        raise ConsultaInvalida("limit deve ser um número.")
+
+    return {
+        "dimensoes": list(dict.fromkeys(dimensoes)),
+        "metricas": list(dict.fromkeys(metricas)),
+        "filtros": filtros,
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "ordenacao": ordenacao,
+        "limite": min(max(limite, 1), LIMITE_LINHAS_MAXIMO),
+    }
+
+
+def _filtrar(consulta):
+    lavagens = Lavagem.objects.all()
+    if consulta["data_inicio"]:
+        lavagens = lavagens.filter(data_lavagem__gte=consulta["data_inicio"])
+    if consulta["data_fim"]:
+        lavagens = lavagens.filter(data_lavagem__lte=consulta["data_fim"])
+    for nome, valores in consulta["filtros"].items():
+        if nome == "lavador" and "lavador" not in consulta["dimensoes"]:
+            # Sem agrupar por lavador, o join repetiria a lavagem uma vez por
+            # lavador filtrado e inflaria quantidade, valor e percentis.
+            vinculos = Lavagem.lavadores.through.objects.filter(lavador_id__in=valores)
+            lavagens = lavagens.filter(id__in=vinculos.values("lavagem_id"))
+            continue
+        lavagens = lavagens.filter(**{f"{FILTROS[nome]}__in": valores})
+    return lavagens
+
+
+def _expressao(caminho):
+    return F(caminho) if isinstance(caminho, str) else caminho
+
+
+def _coluna(nome):
+    # Apelido próprio: "status", "base" etc. colidiriam com os campos do modelo.
+    return f"g_{nome}"
+
+
+def _colunas_grupo(dimensoes, com_nomes=True):
+    """{apelido: expressão} das colunas do GROUP BY, na ordem das dimensões."""
+    colunas = {}
+    for nome in dimensoes:
+        expressao, nome_exibido = DIMENSOES[nome]
+        colunas[_coluna(nome)] = _expressao(expressao)
+        if com_nomes and nome_exibido:
+            colunas[_coluna(f"{nome}_nome")] = F(nome_exibido)
+    return colunas
+
+
+def _ordenacao(consulta):
+    ordenacao = consulta["ordenacao"]
+    colunas = [_coluna(nome) for nome in consulta["dimensoes"]]
+    if not ordenacao:
+        return colunas
+    decrescente, nome = ordenacao.startswith("-"), ordenacao.lstrip("-")
+    coluna = _coluna(nome) if nome in consulta["dimensoes"] else nome
+    # As dimensões desempatam, para o corte em `limite` ser sempre o mesmo.
+    return [f"-{coluna}" if decrescente else coluna, *(c for c in colunas if c != coluna)]
+
+
+def _percentil(ordenados, fracao):
+    # Interpolação linear, como np.percentile e PERCENTILE_CONT.
+    posicao = (len(ordenados) - 1) * fracao
+    abaixo = int(posicao)
+    acima = min(abaixo + 1, len(ordenados) - 1)
+    return ordenados[abaixo] + (ordenados[acima] - ordenados[abaixo]) * (posicao - abaixo)
+
+
+def _percentis_python(lavagens, dimensoes, percentis):
+    """{chave do grupo: {métrica: segundos}} lendo (grupo, duração) em uma consulta."""
+    colunas = _colunas_grupo(dimensoes, com_nomes=False)
+    linhas = (
+        lavagens.filter(hora_inicio__isnull=False, hora_termino__isnull=False)
+        .annotate(**colunas, duracao=_duracao())
+        .order_by(*colunas, "duracao")
+        .values_list(*colunas, "duracao")
+    )
+    resultado = {}
+    for chave, grupo in groupby(linhas, key=lambda linha: linha[:-1]):
+        duracoes = [linha[-1] for linha in grupo]
+        resultado[chave] = {nome: _percentil(duracoes, PERCENTIS[nome]) for nome in percentis}
+    return resultado
+
+
+def _formatar(valor):
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+
+def calcular_agregacao(consulta):
+    dimensoes, metricas = consulta["dimensoes"], consulta["metricas"]
+    lavagens = _filtrar(consulta)
+    percentis = [nome for nome in metricas if nome in PERCENTIS]
+    percentis_no_banco = connections[lavagens.db].vendor == "postgresql"
+
+    agregados = {}
+    if "quantidade" in metricas:
+        agregados["quantidade"] = Count("id")
+    if "valor_total" in metricas:
+        agregados["valor_total"] = Sum("valor_final")
+    if "duracao_media" in metricas:
+        agregados["duracao_media"] = Avg(_duracao())
+    if percentis_no_banco:
+        agregados.update({nome: Percentil(_duracao(), PERCENTIS[nome]) for nome in percentis})
+
+    if dimensoes:
+        grupos = lavagens.order_by().values(**_colunas_grupo(dimensoes))
+        # Só percentis no SQLite: nenhum agregado para gerar o GROUP BY, então
+        # os grupos saem do distinct (senão viria uma linha por lavagem).
+        grupos = grupos.annotate(**agregados) if agregados else grupos.distinct()
+        linhas = list(grupos.order_by(*_ordenacao(consulta))[:consulta["limite"] + 1])
+    else:
+        # Sem agrupamento: uma linha com os totais.
+        linhas = [lavagens.aggregate(**agregados)]
+    truncado = len(linhas) > consulta["limite"]
+    linhas = linhas[:consulta["limite"]]
+
+    if percentis and not percentis_no_banco:
+        por_grupo = _percentis_python(lavagens, dimensoes, percentis)
+        for linha in linhas:
+            valores = por_grupo.get(tuple(linha[_coluna(nome)] for nome in dimensoes), {})
+            linha.update({nome: valores.get(nome) for nome in percentis})
+
+    resultado = []
+    for linha in linhas:
+        saida = {
+            nome.removeprefix("g_"): _formatar(valor)
+            for nome, valor in linha.items()
+        }
+        if "valor_total" in saida:
+            saida["valor_total"] = float(saida["valor_total"] or 0)
+        for nome in ("duracao_media", *percentis):
+            if saida.get(nome) is not None:
+                # Segundos no banco, minutos na resposta.
+                saida[nome] = round(saida[nome] / 60, 1)
+        resultado.append(saida)
+
+    return {"linhas": resultado, "truncado": truncado}
+
+
+def agregacao(consulta):
+    """calcular_agregacao() pelo cache de relatórios."""
+    parametros = {chave: valor for chave, valor in consulta.items() if chave not in ("data_inicio", "data_fim")}
+    return obter_ou_calcular(
+        "agregacao",
+        parametros,
+        consulta["data_inicio"],
+        consulta["data_fim"],
+        lambda: calcular_agregacao(consulta),
+    )
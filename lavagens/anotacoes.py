@@ -0,0 +1,144 @@
+"""
+Valores calculados de lavagens e agendamentos como anotações SQL.
+
+Lavagem.duracao_lavagem, Agendamento.data_hora_agendamento, esta_vencido e
+pode_iniciar_lavagem fazem aritmética de datas ou timezone.make_aware() em
+Python a cada chamada. Nas listagens da API esses valores vêm do banco:
+
+- duracao_segundos: hora_termino - hora_inicio;
+- data_hora_local: data e hora do agendamento juntas, em texto ISO local;
+- vencido / iniciavel: comparação com a data e a hora locais de agora,
+  calculadas uma vez por consulta.
+
+Os campos de serializer daqui leem a anotação e, em objetos que não vieram
+de um queryset anotado (respostas de create/update, por exemplo), voltam
+para a propriedade do modelo com o mesmo nome do campo. Os rótulos de
+status e prioridade também saem sem chamar get_<campo>_display() por linha.
+"""
+from datetime import datetime
+from functools import lru_cache
+
+from django.db.models import BooleanField, CharField, ExpressionWrapper, FloatField, Func, Q, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+from rest_framework import serializers
+
+STATUS_INICIAVEIS = ("AGENDADO", "CONFIRMADO")
+
+_AUSENTE = object()
+
+
+class DuracaoSegundos(Func):
+    """Segundos entre `inicio` e `fim` (datetimes), calculados no banco."""
+
+    output_field = FloatField()
+    arity = 2
+    # PostgreSQL: EXTRACT(EPOCH FROM (fim - inicio))
+    template = "EXTRACT(EPOCH FROM (%(expressions)s))"
+    arg_joiner = " - "
+
+    def __init__(self, inicio, fim, **extra):
+        super().__init__(fim, inicio, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="((julianday(%(expressions)s)) * 86400.0)",
+            arg_joiner=") - julianday(",
+            **extra_context,
+        )
+
+
+def anotar_lavagens(queryset):
+    return queryset.annotate(duracao_segundos=DuracaoSegundos("hora_inicio", "hora_termino"))
+
+
+def anotar_agendamentos(queryset, agora=None):
+    """
+    Anota data_hora_local, vencido e iniciavel. "Vencido" compara data e hora
+    locais com as de `agora` (padrão: timezone.now()), o mesmo que comparar
+    os datetimes como faz Agendamento.esta_vencido.
+    """
+    local = timezone.localtime(agora)
+    hoje, hora = local.date(), local.time()
+    vencido = Q(data_agendamento__lt=hoje) | Q(data_agendamento=hoje, hora_agendamento__lt=hora)
+    return queryset.annotate(
+        data_hora_local=Concat(
+            Cast("data_agendamento", CharField()),
+            Value("T"),
+            Cast("hora_agendamento", CharField()),
+            output_field=CharField(),
+        ),
+        vencido=ExpressionWrapper(vencido, output_field=BooleanField()),
+        iniciavel=ExpressionWrapper(
+            Q(status__in=STATUS_INICIAVEIS) & ~vencido, output_field=BooleanField()
+        ),
+    )
+
+
+def duracao_minutos(lavagem):
+    """Lavagem.duracao_lavagem, lida de `duracao_segundos` quando anotada."""
+    segundos = getattr(lavagem, "duracao_segundos", _AUSENTE)
+    if segundos is _AUSENTE:
+        return lavagem.duracao_lavagem
+    if segundos is None:
+        return None
+    # julianday() tem erro de frações de milissegundo; 3600 s não pode virar 59 min.
+    return int(max(round(segundos, 3), 0) / 60)
+
+
+class CampoAnotado(serializers.ReadOnlyField):
+    """Valor da anotação `anotacao`, ou da propriedade de mesmo nome do campo."""
+
+    def __init__(self, anotacao, **kwargs):
+        self.anotacao = anotacao
+        super().__init__(source="*", **kwargs)
+
+    def to_representation(self, instancia):
+        valor = getattr(instancia, self.anotacao, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = getattr(instancia, self.field_name)
+        return valor
+
+
+class RotuloEscolhaField(serializers.ReadOnlyField):
+    """
+    get_<campo>_display() sem a chamada por linha: o DRF inspeciona a
+    assinatura de cada método chamado pela `source`, o que custa mais que o
+    próprio valor. Aqui o rótulo sai de um dicionário montado com as choices.
+    """
+
+    def bind(self, field_name, parent):
+        super().bind(field_name, parent)
+        campo = parent.Meta.model._meta.get_field(self.source)
+        self.rotulos = {valor: str(rotulo) for valor, rotulo in campo.flatchoices}
+
+    def to_representation(self, valor):
+        return self.rotulos.get(valor, valor)
+
+
+@lru_cache(maxsize=4096)
+def _deslocamento(hora_local, fuso):
+    """Sufixo UTC ("-04:00" ou "Z") de "YYYY-MM-DDTHH" no fuso informado."""
+    deslocamento = timezone.make_aware(datetime.fromisoformat(hora_local), fuso).isoformat()[-6:]
+    return "Z" if deslocamento == "+00:00" else deslocamento
+
+
+class DataHoraAnotadaField(serializers.DateTimeField):
+    """
+    data_hora_agendamento a partir de `data_hora_local`: só acrescenta o fuso,
+    calculado uma vez por data e hora distintas em vez de um make_aware por linha.
+    """
+
+    def __init__(self, anotacao="data_hora_local", **kwargs):
+        self.anotacao = anotacao
+        super().__init__(source="*", read_only=True, **kwargs)
+
+    def to_representation(self, instancia):
+        texto = getattr(instancia, self.anotacao, _AUSENTE)
+        if texto is _AUSENTE:
+            return super().to_representation(getattr(instancia, self.field_name))
+        if not texto:
+            return None
+        return texto + _deslocamento(texto[:13], timezone.get_current_timezone())
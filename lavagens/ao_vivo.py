@@ -0,0 +1,155 @@
+"""
+Feed ao vivo de status de lavagens e agendamentos (GET /eventos/).
+
+O dashboard e a tela de agendamentos recarregavam a página inteira a cada
+30 s, refazendo todas as consultas por navegador aberto. Agora a página abre
+um EventSource (Server-Sent Events) e corrige as próprias linhas quando
+chega um evento:
+
+    event: lavagem
+    id: 812
+    data: {"tipo": "lavagem", "id": 41, "base": 2, "status": "CONCLUIDA", ...}
+
+- os eventos vêm de EventoAoVivo, gravado na mesma transação da mudança
+  (sinais de save/delete, transicoes e lote);
+- o fluxo só consulta o banco quando a marca de alteração de lavagens ou de
+  agendamentos (lavagens.condicional) muda; no resto do tempo lê o cache e
+  manda um comentário de keep-alive a cada INTERVALO_KEEPALIVE;
+- ?base=<id> restringe os eventos a uma base;
+- cada consulta relê também os eventos dos últimos MARGEM_COMMIT, pelo mesmo
+  motivo de lavagens.sincronizacao: um id menor pode confirmar depois de um
+  maior. Os já enviados nesta conexão são pulados; numa reconexão podem
+  chegar de novo, então a página deve aplicar os eventos como "status atual";
+- cada conexão ocupa uma thread do servidor. Por isso há um limite de
+  conexões por processo (AO_VIVO_CONEXOES_POR_PROCESSO, além dele 503) e
+  cada fluxo termina depois de DURACAO_MAXIMA; o navegador reconecta sozinho
+  com Last-Event-ID. No gunicorn use workers com threads
+  (--worker-class gthread --threads N, N acima do limite), senão cada
+  conexão prende um worker inteiro.
+"""
+import json
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .agendamento_models import Agendamento
+from .condicional import AGENDAMENTOS, LAVAGENS, marcas_alteracao
+from .models import EventoAoVivo, Lavagem
+from .sincronizacao import MARGEM_COMMIT
+
+CONEXOES_POR_PROCESSO_PADRAO = 8
+DURACAO_MAXIMA = 300  # segundos
+INTERVALO_VERIFICACAO = 1  # segundos
+INTERVALO_KEEPALIVE = 15  # segundos
+RECONEXAO_MS = 3000
+RETENCAO_EVENTOS = timedelta(days=1)
+
+ROTULOS_STATUS = {
+    "lavagem": dict(Lavagem.STATUS_CHOICES),
+    "agendamento": dict(Agendamento.STATUS_CHOICES),
+}
+
+_conexoes = threading.BoundedSemaphore(
+    getattr(settings, "AO_VIVO_CONEXOES_POR_PROCESSO", CONEXOES_POR_PROCESSO_PADRAO)
+)
+
+
+def registrar_eventos(tipo, linhas, acao="alterado"):
+    """
+    Grava um evento por (objeto_id, base_id, status) de `linhas`. Quem
+    altera status com update()/bulk_update() deve chamar esta função, como
+    faz com registrar_alteracao().
+    """
+    EventoAoVivo.objects.bulk_create(
+        EventoAoVivo(tipo=tipo, objeto_id=objeto_id, base_id=base_id, status=status or "", acao=acao)
+        for objeto_id, base_id, status in linhas
+    )
+
+
+def dados_evento(evento):
+    return {
+        "tipo": evento.tipo,
+        "id": evento.objeto_id,
+        "base": evento.base_id,
+        "acao": evento.acao,
+        "status": evento.status,
+        "status_display": ROTULOS_STATUS[evento.tipo].get(evento.status, evento.status),
+    }
+
+
+def formatar_evento(evento):
+    dados = json.dumps(dados_evento(evento), ensure_ascii=False)
+    return f"event: {evento.tipo}\nid: {evento.pk}\ndata: {dados}\n\n"
+
+
+def ler_eventos(ultimo_id, desde, base_id=None):
+    """
+    Eventos criados a partir de `desde` ou com id > `ultimo_id`, em ordem.
+    Sem `ultimo_id` (primeira conexão da página), só os da margem.
+    """
+    filtro = Q(criado_em__gte=desde)
+    if ultimo_id is not None:
+        filtro |= Q(id__gt=ultimo_id)
+    eventos = EventoAoVivo.objects.filter(filtro)
+    if base_id is not None:
+        eventos = eventos.filter(base_id=base_id)
+    return list(eventos.order_by("id"))
+
+
+class FluxoEventos:
+    """
+    Iterável da StreamingHttpResponse. Ocupa uma das conexões do processo até
+    close(), que o servidor chama quando a resposta termina ou o cliente sai.
+    """
+
+    def __init__(self, ultimo_id=None, base_id=None):
+        self.ultimo_id = ultimo_id
+        self.base_id = base_id
+        self.fechado = False
+
+    def __iter__(self):
+        yield f"retry: {RECONEXAO_MS}\n\n"
+        marcas = None
+        enviados = {}  # id do evento: criado_em, só dentro da margem
+        inicio = ultimo_envio = time.monotonic()
+        while not self.fechado and time.monotonic() - inicio < DURACAO_MAXIMA:
+            atuais = marcas_alteracao([LAVAGENS, AGENDAMENTOS])
+            if atuais != marcas:
+                marcas = atuais
+                desde = timezone.now() - MARGEM_COMMIT
+                enviados = {pk: momento for pk, momento in enviados.items() if momento >= desde}
+                for evento in ler_eventos(self.ultimo_id, desde, self.base_id):
+                    if evento.pk in enviados:
+                        continue
+                    enviados[evento.pk] = evento.criado_em
+                    self.ultimo_id = max(self.ultimo_id or 0, evento.pk)
+                    ultimo_envio = time.monotonic()
+                    yield formatar_evento(evento)
+            if time.monotonic() - ultimo_envio >= INTERVALO_KEEPALIVE:
+                # Comentário SSE: mantém proxies abertos e revela clientes que saíram.
+                ultimo_envio = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(INTERVALO_VERIFICACAO)
+
+    def close(self):
+        if not self.fechado:
+            self.fechado = True
+            _conexoes.release()
+
+
+def abrir_fluxo(ultimo_id=None, base_id=None):
+    """FluxoEventos, ou None se o processo já está no limite de conexões."""
+    if not _conexoes.acquire(blocking=False):
+        return None
+    return FluxoEventos(ultimo_id, base_id)
+
+
+def limpar_eventos(agora=None):
+    """Apaga os eventos mais antigos que a retenção. Retorna quantos."""
+    limite = (agora or timezone.now()) - RETENCAO_EVENTOS
+    apagados, _ = EventoAoVivo.objects.filter(criado_em__lt=limite).delete()
+    return apagados
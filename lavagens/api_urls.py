@@ -1,14 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .api_views import (
-    LavagemViewSet
+    LavagemViewSet, RequisicoesAgrupadasView, SincronizacaoView, TarefaRelatorioViewSet
 )
 
 # Criar router para as APIs
 router = DefaultRouter()
 router.register(r'lavagens', LavagemViewSet)
+router.register(r'relatorios/tarefas', TarefaRelatorioViewSet)
 
 urlpatterns = [
+    path('sync/', SincronizacaoView.as_view(), name='sincronizacao'),
+    path('batch/', RequisicoesAgrupadasView.as_view(), name='requisicoes_agrupadas'),
     path('', include(router.urls)),
 ]
 
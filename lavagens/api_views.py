@@ -1,33 +1,104 @@
-from rest_framework import viewsets, status, filters
+from rest_framework import mixins, viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q, Count, Sum, Avg
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-from .models import Lavagem
+from clientes.placas import filtrar_placa
+
+from .models import Lavagem, TarefaRelatorio
+from .agregacoes import ConsultaInvalida, agregacao, ler_consulta
+from .busca import BuscaTextualFilter
+from .cache_relatorios import metricas as metricas_cache_relatorios
+from .campos_dinamicos import CamposDinamicosViewSetMixin
+from .condicional import CATALOGO, LAVAGENS, resposta_condicional
+from .relatorios_dados import (
+    calcular_relatorio_periodo_api, consumo_materiais_periodo, duracoes_periodo,
+    estatisticas_gerais
+)
 from .serializers import (
     LavagemListSerializer, LavagemDetailSerializer, 
-    LavagemCreateUpdateSerializer, EstatisticasSerializer
+    LavagemCreateUpdateSerializer, LavagemLoteItemSerializer, EstatisticasSerializer,
+    RequisicoesAgrupadasSerializer, TarefaRelatorioSerializer, TransicaoLavagensSerializer,
+    otimizar_queryset_lavagens
+)
+from .lote import LOTE_MAXIMO, ErroLote, gravar_lote
+from .exportacao import (
+    CAMPOS_LAVAGEM, FORMATOS as FORMATOS_EXPORTACAO, FiltroInvalido, filtrar_lavagens, resposta_exportacao
+)
+from .paginacao import PaginacaoLavagens
+from .requisicoes import executar_requisicoes
+from .sincronizacao import (
+    LIMITE_MAXIMO as LIMITE_MAXIMO_SINCRONIZACAO, LIMITE_PADRAO as LIMITE_PADRAO_SINCRONIZACAO,
+    TokenExpirado, TokenInvalido, sincronizar
 )
+from .tarefas import deve_rodar_em_segundo_plano, enfileirar, tarefas_visiveis
+from .transicoes import transicionar_lavagens
+
+
+def ler_periodo(request):
+    """
+    Lê data_inicio e data_fim (YYYY-MM-DD) dos parâmetros da requisição.
+    Retorna (data_inicio, data_fim, None) ou (None, None, Response de erro).
+    """
+    data_inicio = request.query_params.get('data_inicio')
+    data_fim = request.query_params.get('data_fim')
+    
+    if not data_inicio or not data_fim:
+        return None, None, Response(
+            {'error': 'Parâmetros data_inicio e data_fim são obrigatórios'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    try:
+        data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
+        data_fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
+    except ValueError:
+        return None, None, Response(
+            {'error': 'Formato de data inválido. Use YYYY-MM-DD'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    return data_inicio, data_fim, None
 
 
-class LavagemViewSet(viewsets.ModelViewSet):
+def ler_base(request):
+    """
+    Lê o id opcional de ?base=. Retorna (base_id ou None, None) ou
+    (None, Response de erro).
+    """
+    base_id = request.query_params.get('base')
+    if not base_id:
+        return None, None
+    try:
+        return int(base_id), None
+    except ValueError:
+        return None, Response(
+            {'error': 'base deve ser um id numérico'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+class LavagemViewSet(CamposDinamicosViewSetMixin, viewsets.ModelViewSet):
     """
     ViewSet para gerenciar lavagens
     """
-    queryset = Lavagem.objects.all().select_related(
-        'cliente', 'veiculo', 'lavador'
-    ).order_by("-data_lavagem")
+    queryset = otimizar_queryset_lavagens(Lavagem.objects.all())
     
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['status', 'tipo_lavagem', 'transporte_equipamento']
-    search_fields = ['codigo', 'placa_veiculo', 'cliente__nome', 'lavador__nome']
-    ordering_fields = ['created_at', 'hora_inicio', 'hora_termino', 'valor_final']
-    ordering = ['-created_at']
+    pagination_class = PaginacaoLavagens
+    # A busca vem por último: ordena por relevância quando não há ?ordering=.
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, BuscaTextualFilter]
+    filterset_fields = ['status', 'base', 'tipo_lavagem', 'transporte_equipamento']
+    tipo_busca = 'lavagem'
+    # Só usados sem o índice FTS5 (banco que não é SQLite).
+    search_fields = ['codigo', 'placa_veiculo', 'cliente__nome', 'lavadores__nome']
+    ordering_fields = ['data_lavagem', 'hora_inicio', 'hora_termino', 'valor_final']
+    ordering = ['-data_lavagem', '-hora_inicio']
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -37,18 +108,31 @@ class LavagemViewSet(viewsets.ModelViewSet):
         else:
             return LavagemDetailSerializer
     
+    @resposta_condicional(LAVAGENS, CATALOGO)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @resposta_condicional(LAVAGENS, CATALOGO)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def get_queryset(self):
         queryset = super().get_queryset()
         
         data_inicio = self.request.query_params.get('data_inicio')
         data_fim = self.request.query_params.get('data_fim')
+        placa = self.request.query_params.get('placa')
         
         if data_inicio:
             queryset = queryset.filter(data_lavagem__gte=data_inicio)
         if data_fim:
             queryset = queryset.filter(data_lavagem__lte=data_fim)
+        if placa:
+            # Qualquer formato da placa; ?placa_aproximada=1 aceita um erro de digitação.
+            aproximada = self.request.query_params.get('placa_aproximada') in ('1', 'true')
+            queryset = filtrar_placa(queryset, placa, aproximada=aproximada)
         
-        return queryset
+        return self.podar_queryset(queryset)
     
     @action(detail=True, methods=['post'])
     def concluir(self, request, pk=None):
@@ -87,96 +171,259 @@ class LavagemViewSet(viewsets.ModelViewSet):
             'lavagem': LavagemDetailSerializer(lavagem).data
         })
     
+    @action(detail=False, methods=['post'])
+    def transicao(self, request):
+        """
+        Concluir ou cancelar várias lavagens de uma vez.
+        Corpo: {"acao": "concluir"|"cancelar", "ids": [...], "motivo": ""}
+        """
+        serializer = TransicaoLavagensSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+        
+        ids = set(dados['ids'])
+        alteradas = transicionar_lavagens(
+            Lavagem.objects.filter(pk__in=ids), dados['acao'], motivo=dados['motivo']
+        )
+        
+        return Response({
+            'acao': dados['acao'],
+            'alteradas': sorted(alteradas),
+            # Inexistentes ou fora do status de origem (só EM_ANDAMENTO)
+            'ignoradas': sorted(ids - set(alteradas)),
+        })
+    
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        """
+        Criar/atualizar várias lavagens em uma transação.
+        Corpo: lista de itens (ou {"lavagens": [...]}); itens com "id" são atualizados.
+        """
+        itens = request.data.get('lavagens') if isinstance(request.data, dict) else request.data
+        if not isinstance(itens, list) or not itens:
+            return Response(
+                {'error': 'Envie uma lista de lavagens'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(itens) > LOTE_MAXIMO:
+            return Response(
+                {'error': f'O lote aceita no máximo {LOTE_MAXIMO} lavagens'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        serializer = LavagemLoteItemSerializer(data=itens, many=True, partial=True)
+        if not serializer.is_valid():
+            return Response({
+                'error': 'Lote inválido; nada foi gravado',
+                'itens': [
+                    {'indice': indice, 'erros': erros}
+                    for indice, erros in enumerate(serializer.errors) if erros
+                ],
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            resultados = gravar_lote(serializer.validated_data)
+        except ErroLote as erro:
+            return Response(
+                {'error': 'Lote inválido; nada foi gravado', 'itens': erro.itens},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({'resultados': resultados}, status=status.HTTP_201_CREATED)
+    
     @action(detail=False, methods=['get'])
+    @resposta_condicional(LAVAGENS, granularidade='dia')
     def estatisticas(self, request):
         """Obter estatísticas das lavagens"""
-        hoje = timezone.now().date()
-        inicio_mes = hoje.replace(day=1)
-        
-        total_lavagens = Lavagem.objects.count()
-        lavagens_em_andamento = Lavagem.objects.filter(status='EM_ANDAMENTO').count()
-        lavagens_concluidas = Lavagem.objects.filter(status='CONCLUIDA').count()
-        lavagens_canceladas = Lavagem.objects.filter(status='CANCELADA').count()
-        
-        faturamento_mes = Lavagem.objects.filter(
-            status='CONCLUIDA',
-            data_lavagem__gte=inicio_mes
-        ).aggregate(total=Sum('valor_final'))['total'] or Decimal('0.00')
-        
-        faturamento_dia = Lavagem.objects.filter(
-            status='CONCLUIDA',
-            data_lavagem=hoje
-        ).aggregate(total=Sum('valor_final'))['total'] or Decimal('0.00')
-        
-        tempo_medio = Lavagem.objects.filter(
-            status='CONCLUIDA',
-            duracao_lavagem__isnull=False
-        ).aggregate(media=Avg('duracao_lavagem'))['media'] or 0
-        
-        lavagens_por_status = dict(
-            Lavagem.objects.values('status')
-            .annotate(total=Count('id'))
-            .values_list('status', 'total')
-        )
-        
-        estatisticas = {
-            'total_lavagens': total_lavagens,
-            'lavagens_em_andamento': lavagens_em_andamento,
-            'lavagens_concluidas': lavagens_concluidas,
-            'lavagens_canceladas': lavagens_canceladas,
-            'faturamento_mes': faturamento_mes,
-            'faturamento_dia': faturamento_dia,
-            'tempo_medio_lavagem': int(tempo_medio),
-            'lavagens_por_status': lavagens_por_status,
-        }
+        estatisticas = estatisticas_gerais(timezone.now().date())
         
         serializer = EstatisticasSerializer(estatisticas)
         return Response(serializer.data)
     
-    @action(detail=False, methods=['get'])
-    def relatorio_periodo(self, request):
-        """Relatório de lavagens por período"""
-        data_inicio = request.query_params.get('data_inicio')
-        data_fim = request.query_params.get('data_fim')
+    @action(detail=False, methods=['get'], url_path='aggregate')
+    @resposta_condicional(LAVAGENS, CATALOGO)
+    def agregar(self, request):
+        """
+        Agregação por dimensões e métricas de listas fechadas
+        (?group_by=&metrics=&order_by=&limit= e filtros; ver lavagens.agregacoes)
+        """
+        try:
+            consulta = ler_consulta(request.query_params)
+        except ConsultaInvalida as erro:
+            return Response({'error': str(erro)}, status=status.HTTP_400_BAD_REQUEST)
         
-        if not data_inicio or not data_fim:
+        return Response({
+            'dimensoes': consulta['dimensoes'],
+            'metricas': consulta['metricas'],
+            **agregacao(consulta),
+        })
+    
+    @action(detail=False, methods=['get'])
+    def cache_relatorios(self, request):
+        """Acertos, falhas e tempo de recálculo do cache de relatórios"""
+        return Response(metricas_cache_relatorios())
+    
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """Exporta as lavagens filtradas em CSV (padrão) ou NDJSON (?formato=ndjson)"""
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in FORMATOS_EXPORTACAO:
             return Response(
-                {'error': 'Parâmetros data_inicio e data_fim são obrigatórios'},
+                {'error': 'Formato inválido. Use csv ou ndjson'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         try:
-            data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-            data_fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
-        except ValueError:
-            return Response(
-                {'error': 'Formato de data inválido. Use YYYY-MM-DD'},
-                status=status.HTTP_400_BAD_REQUEST
+            lavagens = filtrar_lavagens(
+                Lavagem.objects.order_by('-data_lavagem', '-hora_inicio', 'id'),
+                request.query_params
             )
+        except FiltroInvalido as erro:
+            return Response({'error': str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+        return resposta_exportacao(lavagens, CAMPOS_LAVAGEM, formato, 'lavagens')
+    
+    @action(detail=False, methods=['get'])
+    def consumo_materiais(self, request):
+        """Consumo de materiais das lavagens concluídas no período, total e por mês"""
+        data_inicio, data_fim, erro = ler_periodo(request)
+        if erro:
+            return erro
         
-        lavagens = Lavagem.objects.filter(
-            data_lavagem__range=[data_inicio, data_fim]
-        ).select_related(
-            'cliente', 'veiculo', 'lavador'
-        )
+        base_id, erro = ler_base(request)
+        if erro:
+            return erro
+        consumo = consumo_materiais_periodo(data_inicio, data_fim, base_id)
         
-        total_periodo = lavagens.count()
-        concluidas_periodo = lavagens.filter(status='CONCLUIDA').count()
-        faturamento_periodo = lavagens.filter(status='CONCLUIDA').aggregate(
-            total=Sum('valor_final')
-        )['total'] or Decimal('0.00')
+        return Response({
+            'periodo': {
+                'data_inicio': data_inicio,
+                'data_fim': data_fim,
+                'base': base_id,
+            },
+            'materiais': consumo['total'],
+            'por_mes': consumo['por_mes'],
+        })
+    
+    @action(detail=False, methods=['get'])
+    def duracoes(self, request):
+        """Percentis (p50/p90/p99) e histogramas de duração por tipo, transporte e lavador"""
+        data_inicio, data_fim, erro = ler_periodo(request)
+        if erro:
+            return erro
         
-        serializer = LavagemListSerializer(lavagens, many=True)
+        base_id, erro = ler_base(request)
+        if erro:
+            return erro
         
         return Response({
             'periodo': {
                 'data_inicio': data_inicio,
                 'data_fim': data_fim,
-                'total_lavagens': total_periodo,
-                'lavagens_concluidas': concluidas_periodo,
-                'faturamento_total': faturamento_periodo
+                'base': base_id,
             },
-            'lavagens': serializer.data
+            **duracoes_periodo(data_inicio, data_fim, base_id),
         })
+    
+    @action(detail=False, methods=['get'])
+    def relatorio_periodo(self, request):
+        """
+        Relatório de lavagens por período. Períodos longos (ou ?async=1) são
+        enfileirados: a resposta 202 traz a tarefa para acompanhar em
+        /api/relatorios/tarefas/<id>/.
+        """
+        data_inicio, data_fim, erro = ler_periodo(request)
+        if erro:
+            return erro
+        
+        em_segundo_plano = request.query_params.get('async') in ('1', 'true')
+        if em_segundo_plano or deve_rodar_em_segundo_plano(data_inicio, data_fim):
+            tarefa = enfileirar(
+                'relatorio_periodo',
+                {'data_inicio': data_inicio, 'data_fim': data_fim},
+                request.user,
+            )
+            return Response(
+                TarefaRelatorioSerializer(tarefa).data,
+                status=status.HTTP_202_ACCEPTED
+            )
+        
+        return Response(calcular_relatorio_periodo_api(data_inicio, data_fim))
 
 
+class TarefaRelatorioViewSet(mixins.CreateModelMixin,
+                             mixins.RetrieveModelMixin,
+                             mixins.ListModelMixin,
+                             viewsets.GenericViewSet):
+    """
+    Relatórios em segundo plano: POST enfileira, GET acompanha o status e,
+    no detalhe, traz o resultado quando a tarefa é concluída.
+    """
+    queryset = TarefaRelatorio.objects.all()
+    serializer_class = TarefaRelatorioSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return tarefas_visiveis(self.request.user)
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['incluir_resultado'] = self.action == 'retrieve'
+        return context
+    
+    def perform_create(self, serializer):
+        serializer.instance = enfileirar(
+            serializer.validated_data['tipo'],
+            serializer.validated_data['parametros'],
+            self.request.user,
+        )
+
+
+class SincronizacaoView(APIView):
+    """
+    Sincronização incremental: GET /api/sync/?since=<token>&page_size=500
+
+    Devolve as linhas criadas/alteradas e os ids excluídos depois do token,
+    o próximo token (`since`) e `mais`, que indica se é preciso chamar de
+    novo imediatamente. Sem ?since= começa a carga completa.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            limite = int(request.query_params.get('page_size', LIMITE_PADRAO_SINCRONIZACAO))
+        except ValueError:
+            limite = LIMITE_PADRAO_SINCRONIZACAO
+        limite = min(max(limite, 1), LIMITE_MAXIMO_SINCRONIZACAO)
+        
+        try:
+            return Response(sincronizar(request.query_params.get('since'), limite))
+        except TokenInvalido:
+            return Response(
+                {'error': 'Token de sincronização inválido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except TokenExpirado:
+            return Response(
+                {'error': 'Token de sincronização expirado; sincronize do zero, sem ?since='},
+                status=status.HTTP_410_GONE
+            )
+
+
+class RequisicoesAgrupadasView(APIView):
+    """
+    Várias chamadas da API de uma vez: POST /api/batch/
+
+    {"requisicoes": [{"id": "andamento", "metodo": "GET", "url": "/api/lavagens/?status=EM_ANDAMENTO"}, ...],
+     "transacao": false}
+
+    Devolve {"respostas": [{"id", "status", "corpo"}, ...], "revertida": bool}
+    na ordem recebida (ver lavagens.requisicoes).
+    """
+    
+    def post(self, request):
+        serializer = RequisicoesAgrupadasSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        respostas, revertida = executar_requisicoes(
+            request, serializer.validated_data['requisicoes'], serializer.validated_data['transacao']
+        )
+        return Response({'respostas': respostas, 'revertida': revertida})
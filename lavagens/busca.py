@@ -0,0 +1,206 @@
+"""
+Busca textual de lavagens e agendamentos por índice FTS5 (SQLite).
+
+Os dashboards e a API buscavam com um OR de icontains em código, placa,
+cliente, telefone e no join com lavadores, seguido de distinct(): varredura
+da tabela inteira e ordenação para tirar duplicatas a cada tecla. Agora cada
+modelo tem uma tabela virtual FTS5 (criada pela migração 0013), com o id da
+linha como rowid e as colunas:
+
+    codigo, placa, cliente, telefone, lavadores
+
+- placa e telefone são indexados também sem pontuação ("ABC-1234" e
+  "ABC1234"), então a busca funciona com ou sem o traço;
+- cada palavra digitada vira um prefixo ("abc 12" -> "abc"* AND "12"*), sem
+  acento e sem diferenciar maiúsculas; ao contrário do icontains, o trecho
+  precisa estar no começo de uma palavra;
+- o índice é atualizado na mesma transação pelos sinais de lavagens.models
+  (save, delete, lavadores, cliente e lavador renomeados) e por gravar_lote;
+  `manage.py reindexar_busca` refaz tudo;
+- em outro banco (sem FTS5) a busca volta para o icontains de antes;
+- uma placa completa ("ABC-1234", "abc1c34"...) é buscada pela coluna
+  placa_normalizada (clientes.placas), que junta os formatos antigo e
+  Mercosul; os dashboards aceitam também a placa com um erro de digitação.
+
+Na API, BuscaTextualFilter substitui o SearchFilter: sem ?ordering= os
+resultados vêm do mais para o menos relevante (bm25).
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+from clientes.models import Cliente, Lavador
+from clientes.placas import eh_placa, filtrar_placa
+
+from .agendamento_models import Agendamento
+from .models import Lavagem
+
+LOTE_INDEXACAO = 500
+
+# Pesos do bm25 por coluna: código e placa valem mais que nomes.
+PESOS = (10.0, 10.0, 3.0, 3.0, 1.0)
+
+_PALAVRA = re.compile(r"\w+")
+
+
+def _com_versao_compacta(coluna):
+    """SQL de "valor valor-sem-pontuação" da coluna."""
+    texto = compacto = f"COALESCE({coluna}, '')"
+    for simbolo in ("-", " ", ".", "(", ")", "+", "/"):
+        compacto = f"REPLACE({compacto}, '{simbolo}', '')"
+    return f"{texto} || ' ' || {compacto}"
+
+
+def _lavadores(tabela_vinculo, coluna_vinculo):
+    lavador = Lavador._meta.db_table
+    return (
+        f"(SELECT GROUP_CONCAT(lv.nome, ' ') FROM {tabela_vinculo} v "
+        f"JOIN {lavador} lv ON lv.id = v.lavador_id WHERE v.{coluna_vinculo} = t.id)"
+    )
+
+
+class Indice:
+    """Tabela FTS5 de um modelo e o SELECT que monta as linhas dela."""
+
+    def __init__(self, modelo, tabela, colunas_telefone, campos_alternativos):
+        self.modelo = modelo
+        self.tabela = tabela
+        self.colunas_telefone = colunas_telefone
+        self.campos_alternativos = campos_alternativos
+
+    @property
+    def select(self):
+        telefone = " || ' ' || ".join(_com_versao_compacta(coluna) for coluna in self.colunas_telefone)
+        vinculo = self.modelo.lavadores.through._meta
+        coluna_vinculo = vinculo.get_field(self.modelo._meta.model_name).column
+        return (
+            f"SELECT t.id, t.codigo, {_com_versao_compacta('t.placa_veiculo')}, "
+            f"COALESCE(c.nome, ''), {telefone}, "
+            f"COALESCE({_lavadores(vinculo.db_table, coluna_vinculo)}, '') "
+            f"FROM {self.modelo._meta.db_table} t LEFT JOIN {Cliente._meta.db_table} c ON c.id = t.cliente_id"
+        )
+
+
+INDICES = {
+    "lavagem": Indice(
+        Lavagem, "lavagens_busca_lavagem", ("c.telefone",),
+        ("codigo", "placa_veiculo", "cliente__nome", "cliente__telefone", "lavadores__nome"),
+    ),
+    "agendamento": Indice(
+        Agendamento, "lavagens_busca_agendamento", ("t.telefone_contato", "c.telefone"),
+        ("codigo", "placa_veiculo", "cliente__nome", "telefone_contato", "lavadores__nome"),
+    ),
+}
+
+
+def disponivel(using="default"):
+    """O índice só existe no SQLite (a migração não o cria em outros bancos)."""
+    return connections[using].vendor == "sqlite"
+
+
+def expressao_busca(texto):
+    """Consulta FTS5 com cada palavra de `texto` como prefixo, ou None se vazia."""
+    palavras = _PALAVRA.findall(texto or "")
+    if not palavras:
+        return None
+    return " ".join(f'"{palavra}"*' for palavra in palavras)
+
+
+def indexar(tipo, ids):
+    """Refaz as linhas do índice de `tipo` para os ids (as que não existem mais saem)."""
+    if not disponivel():
+        return
+    indice = INDICES[tipo]
+    ids = list(ids)
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(ids), LOTE_INDEXACAO):
+            lote = ids[inicio:inicio + LOTE_INDEXACAO]
+            marcadores = ", ".join(["%s"] * len(lote))
+            cursor.execute(f"DELETE FROM {indice.tabela} WHERE rowid IN ({marcadores})", lote)
+            cursor.execute(
+                f"INSERT INTO {indice.tabela}(rowid, codigo, placa, cliente, telefone, lavadores) "
+                f"{indice.select} WHERE t.id IN ({marcadores})",
+                lote,
+            )
+
+
+def reindexar(tipo):
+    """Recria o índice de `tipo` inteiro. Retorna quantas linhas foram indexadas."""
+    if not disponivel():
+        return 0
+    indice = INDICES[tipo]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {indice.tabela}")
+        cursor.execute(f"INSERT INTO {indice.tabela}(rowid, codigo, placa, cliente, telefone, lavadores) {indice.select}")
+        return cursor.rowcount
+
+
+def _alternativa(queryset, indice, texto):
+    filtro = Q()
+    for campo in indice.campos_alternativos:
+        filtro |= Q(**{f"{campo}__icontains": texto})
+    return queryset.filter(filtro).distinct()
+
+
+def filtrar(queryset, tipo, texto, placa_aproximada=False):
+    """
+    Linhas de `queryset` que casam com `texto`, pelo índice (sem ordenar por
+    relevância). `placa_aproximada` vale quando `texto` é uma placa.
+    """
+    if eh_placa(texto):
+        return filtrar_placa(queryset, texto, aproximada=placa_aproximada)
+    indice = INDICES[tipo]
+    if not disponivel(queryset.db):
+        return _alternativa(queryset, indice, texto)
+    expressao = expressao_busca(texto)
+    if expressao is None:
+        return queryset
+    return queryset.filter(
+        pk__in=RawSQL(f"SELECT rowid FROM {indice.tabela} WHERE {indice.tabela} MATCH %s", (expressao,))
+    )
+
+
+def filtrar_por_relevancia(queryset, tipo, texto):
+    """
+    Como filtrar(), com a anotação `relevancia` (bm25; menor é mais relevante)
+    e as linhas ordenadas por ela antes da ordenação que o queryset já tinha.
+    """
+    if eh_placa(texto):
+        return filtrar_placa(queryset, texto)
+    indice = INDICES[tipo]
+    if not disponivel(queryset.db):
+        return _alternativa(queryset, indice, texto)
+    expressao = expressao_busca(texto)
+    if expressao is None:
+        return queryset
+    tabela_modelo = indice.modelo._meta.db_table
+    # Join com a tabela virtual: o SQLite parte do MATCH e busca as linhas
+    # pelo id, sem avaliar o bm25 de novo por linha.
+    queryset = queryset.extra(
+        select={"relevancia": f"bm25({indice.tabela}, {', '.join(map(str, PESOS))})"},
+        tables=[indice.tabela],
+        where=[f"{indice.tabela} MATCH %s", f"{indice.tabela}.rowid = {tabela_modelo}.id"],
+        params=[expressao],
+    )
+    ordenacao = queryset.query.order_by or queryset.model._meta.ordering
+    return queryset.order_by("relevancia", *ordenacao)
+
+
+class BuscaTextualFilter(SearchFilter):
+    """
+    SearchFilter pelo índice FTS5 do `tipo_busca` da view. Deve vir depois do
+    OrderingFilter em filter_backends, para a relevância passar à frente da
+    ordenação padrão; com ?ordering= explícito a busca só filtra.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        texto = request.query_params.get(self.search_param, "")
+        if not texto.strip() or not disponivel(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            return filtrar(queryset, view.tipo_busca, texto)
+        return filtrar_por_relevancia(queryset, view.tipo_busca, texto)
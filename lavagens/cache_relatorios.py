@@ -0,0 +1,161 @@
+"""
+Cache versionado dos relatórios e estatísticas de lavagens.
+
+A chave de cada resultado junta os parâmetros do relatório com as versões
+dos meses que o período cobre. Gravar uma lavagem incrementa apenas a versão
+do(s) mês(es) afetado(s), então relatórios de outros períodos continuam
+válidos. Consultas sem período (estatísticas gerais) usam a versão global de
+lavagens, e alterações de catálogo (bases, tipos, materiais...) incrementam a
+versão de catálogo, que entra em todas as chaves.
+
+Períodos totalmente fechados (terminados antes do mês corrente) ficam em
+cache por RELATORIOS_CACHE_TTL_FECHADO; os demais por RELATORIOS_CACHE_TTL.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PREFIXO = "relatorios"
+VERSAO_LAVAGENS = f"{PREFIXO}:versao:lavagens"
+VERSAO_CATALOGO = f"{PREFIXO}:versao:catalogo"
+
+METRICA_ACERTOS = f"{PREFIXO}:metricas:acertos"
+METRICA_FALHAS = f"{PREFIXO}:metricas:falhas"
+METRICA_TEMPO_MS = f"{PREFIXO}:metricas:tempo_calculo_ms"
+METRICA_ULTIMO_MS = f"{PREFIXO}:metricas:ultimo_calculo_ms"
+
+TTL_ABERTO_PADRAO = 5 * 60
+TTL_FECHADO_PADRAO = 30 * 24 * 60 * 60
+
+
+def _chave_versao_mes(mes):
+    return f"{PREFIXO}:versao:{mes:%Y-%m}"
+
+
+def _meses(data_inicio, data_fim):
+    mes = data_inicio.replace(day=1)
+    while mes <= data_fim:
+        yield mes
+        mes = (mes.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _versao_inicial():
+    # Um contador que sumiu do cache (expulso pelo backend) não pode recomeçar
+    # de um valor já usado, senão resultados antigos voltariam a ser válidos.
+    return time.time_ns()
+
+
+def _incrementar(chave, valor=1):
+    try:
+        return cache.incr(chave, valor)
+    except ValueError:
+        # Chave ainda não existe (ou foi expulsa): começa de um valor novo.
+        cache.add(chave, _versao_inicial(), timeout=None)
+        return cache.incr(chave, valor)
+
+
+def _somar_metrica(chave, valor=1):
+    cache.add(chave, 0, timeout=None)
+    try:
+        cache.incr(chave, valor)
+    except ValueError:
+        pass
+
+
+def versao_periodo(data_inicio=None, data_fim=None):
+    """Texto que muda sempre que alguma lavagem do período é alterada."""
+    chaves = [VERSAO_CATALOGO]
+    if data_inicio and data_fim:
+        chaves += [_chave_versao_mes(mes) for mes in _meses(data_inicio, data_fim)]
+    else:
+        chaves.append(VERSAO_LAVAGENS)
+    versoes = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in versoes:
+            cache.add(chave, _versao_inicial(), timeout=None)
+            versoes[chave] = cache.get(chave)
+    assinatura = ":".join(str(versoes[chave]) for chave in chaves)
+    return hashlib.md5(assinatura.encode()).hexdigest()[:16]
+
+
+def invalidar_dias(dias):
+    """Invalida os relatórios dos meses que contêm os dias informados."""
+    for mes in {dia.replace(day=1) for dia in dias if dia}:
+        _incrementar(_chave_versao_mes(mes))
+    _incrementar(VERSAO_LAVAGENS)
+
+
+def invalidar_catalogo():
+    """Invalida todos os relatórios (ex.: mudança de nome de base ou de materiais)."""
+    _incrementar(VERSAO_CATALOGO)
+
+
+def periodo_fechado(data_fim):
+    return data_fim is not None and data_fim < timezone.localdate().replace(day=1)
+
+
+def obter_ou_calcular(nome, parametros, data_inicio, data_fim, calcular, apenas_cache=False):
+    """
+    Retorna o resultado em cache para (nome, parametros, período) ou o calcula
+    com `calcular()` e o guarda, registrando acertos, falhas e tempo de cálculo.
+    Com apenas_cache=True, retorna None em vez de calcular.
+    """
+    parametros = json.dumps(
+        {"inicio": str(data_inicio), "fim": str(data_fim), **parametros},
+        sort_keys=True,
+        default=str,
+    )
+    chave = "{}:{}:{}:{}".format(
+        PREFIXO,
+        nome,
+        hashlib.md5(parametros.encode()).hexdigest(),
+        versao_periodo(data_inicio, data_fim),
+    )
+
+    resultado = cache.get(chave)
+    if resultado is not None:
+        _somar_metrica(METRICA_ACERTOS)
+        return resultado
+    if apenas_cache:
+        return None
+
+    inicio = time.perf_counter()
+    resultado = calcular()
+    tempo_ms = int((time.perf_counter() - inicio) * 1000)
+
+    if periodo_fechado(data_fim):
+        ttl = getattr(settings, "RELATORIOS_CACHE_TTL_FECHADO", TTL_FECHADO_PADRAO)
+    else:
+        ttl = getattr(settings, "RELATORIOS_CACHE_TTL", TTL_ABERTO_PADRAO)
+    cache.set(chave, resultado, timeout=ttl)
+
+    _somar_metrica(METRICA_FALHAS)
+    _somar_metrica(METRICA_TEMPO_MS, tempo_ms)
+    cache.set(METRICA_ULTIMO_MS, tempo_ms, timeout=None)
+    logger.debug("Relatório %s recalculado em %d ms (%s)", nome, tempo_ms, parametros)
+    return resultado
+
+
+def metricas():
+    """Acertos, falhas e tempo de recálculo acumulados do cache de relatórios."""
+    valores = cache.get_many([METRICA_ACERTOS, METRICA_FALHAS, METRICA_TEMPO_MS, METRICA_ULTIMO_MS])
+    acertos = valores.get(METRICA_ACERTOS, 0)
+    falhas = valores.get(METRICA_FALHAS, 0)
+    tempo_total = valores.get(METRICA_TEMPO_MS, 0)
+    consultas = acertos + falhas
+    return {
+        "acertos": acertos,
+        "falhas": falhas,
+        "taxa_acerto": round(acertos / consultas, 4) if consultas else None,
+        "tempo_calculo_total_ms": tempo_total,
+        "tempo_calculo_medio_ms": round(tempo_total / falhas, 1) if falhas else None,
+        "ultimo_calculo_ms": valores.get(METRICA_ULTIMO_MS),
+    }
@@ -0,0 +1,212 @@
+"""
+Feed do calendário de agendamentos (GET /api/agendamentos/calendario/).
+
+O feed exige uma janela (?start=&end=, como o FullCalendar envia) e monta os
+eventos a partir de meses inteiros guardados em cache já serializados. Um mês
+que falta no cache custa uma consulta só, com apenas as colunas usadas e o
+nome do cliente pelo join; vários meses faltando saem na mesma consulta.
+
+A chave de cada mês inclui as marcas de alteração de agendamentos e do
+catálogo (lavagens.condicional), então qualquer gravação de agendamento,
+inclusive em lote, ou de cliente invalida os meses em cache sem nenhum
+código extra de invalidação.
+
+Com ?formato=ics a mesma janela sai como iCalendar em fluxo, para assinatura
+em aplicativos de calendário externos; sem janela, o .ics usa a janela
+móvel JANELA_ICS_PADRAO em torno de hoje.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .agendamento_models import Agendamento
+from .condicional import AGENDAMENTOS, CATALOGO, marcas_alteracao
+
+PREFIXO = "calendario"
+TTL_MES = 24 * 60 * 60
+MAXIMO_DIAS_JANELA = 366
+# (dias antes de hoje, dias depois de hoje)
+JANELA_ICS_PADRAO = (30, 180)
+
+CORES_STATUS = {
+    "AGENDADO": "#007bff",
+    "CONFIRMADO": "#28a745",
+    "EM_ANDAMENTO": "#ffc107",
+    "CONCLUIDO": "#6f42c1",
+    "CANCELADO": "#dc3545",
+    "NAO_COMPARECEU": "#6c757d",
+}
+STATUS_ICS = {
+    "AGENDADO": "TENTATIVE",
+    "CANCELADO": "CANCELLED",
+    "NAO_COMPARECEU": "CANCELLED",
+}
+
+
+class JanelaInvalida(ValueError):
+    pass
+
+
+def _ler_data(valor):
+    """Aceita 2025-03-01 ou o datetime ISO que o FullCalendar envia."""
+    data = parse_date(valor)
+    if data is None:
+        momento = parse_datetime(valor)
+        if momento is None:
+            raise JanelaInvalida(f"Data inválida: {valor}")
+        data = momento.date()
+    return data
+
+
+def ler_janela(params, padrao=None):
+    """
+    (inicio, fim) de ?start=&end=, com `fim` exclusivo. Sem os dois
+    parâmetros, usa `padrao` (dias antes, dias depois de hoje) ou falha.
+    """
+    inicio, fim = params.get("start"), params.get("end")
+    if not inicio or not fim:
+        if padrao is None:
+            raise JanelaInvalida("Informe start e end (YYYY-MM-DD).")
+        hoje = timezone.localdate()
+        return hoje - timedelta(days=padrao[0]), hoje + timedelta(days=padrao[1])
+
+    try:
+        inicio, fim = _ler_data(inicio), _ler_data(fim)
+    except ValueError as erro:
+        raise JanelaInvalida(str(erro)) from erro
+    if fim <= inicio:
+        raise JanelaInvalida("end deve ser posterior a start.")
+    if (fim - inicio).days > MAXIMO_DIAS_JANELA:
+        raise JanelaInvalida(f"A janela aceita no máximo {MAXIMO_DIAS_JANELA} dias.")
+    return inicio, fim
+
+
+def _proximo_mes(mes):
+    return (mes.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _meses(inicio, fim):
+    mes = inicio.replace(day=1)
+    while mes < fim:
+        yield mes
+        mes = _proximo_mes(mes)
+
+
+def _eventos(linhas):
+    """Eventos serializados; make_aware uma vez por horário distinto, não por linha."""
+    inicios = {}
+    eventos = []
+    for id_, codigo, placa, cliente, dia, hora, duracao, status in linhas:
+        inicio = inicios.get((dia, hora))
+        if inicio is None:
+            inicio = inicios[(dia, hora)] = timezone.make_aware(datetime.combine(dia, hora))
+        eventos.append({
+            "id": id_,
+            "codigo": codigo,
+            "title": f"{placa} - {cliente}",
+            "start": inicio.isoformat(),
+            "end": (inicio + timedelta(minutes=duracao or 0)).isoformat(),
+            "color": CORES_STATUS.get(status, CORES_STATUS["AGENDADO"]),
+            "status": status,
+        })
+    return eventos
+
+
+def _calcular_meses(meses):
+    """{mes: [eventos]} para os meses informados, em uma consulta."""
+    linhas = (
+        Agendamento.objects
+        .filter(data_agendamento__gte=min(meses), data_agendamento__lt=_proximo_mes(max(meses)))
+        .order_by("data_agendamento", "hora_agendamento", "id")
+        .values_list(
+            "id", "codigo", "placa_veiculo", "cliente__nome",
+            "data_agendamento", "hora_agendamento", "duracao_estimada", "status",
+        )
+    )
+    por_mes = {mes: [] for mes in meses}
+    for linha in linhas:
+        mes = linha[4].replace(day=1)
+        if mes in por_mes:
+            por_mes[mes].append(linha)
+    return {mes: _eventos(linhas_mes) for mes, linhas_mes in por_mes.items()}
+
+
+def eventos_periodo(inicio, fim):
+    """Eventos com data em [inicio, fim), ordenados por data e hora."""
+    versao = ":".join(map(str, marcas_alteracao([AGENDAMENTOS, CATALOGO])))
+    chaves = {mes: f"{PREFIXO}:{mes:%Y-%m}:{versao}" for mes in _meses(inicio, fim)}
+
+    em_cache = cache.get_many(list(chaves.values()))
+    faltando = [mes for mes, chave in chaves.items() if chave not in em_cache]
+    if faltando:
+        calculados = _calcular_meses(faltando)
+        cache.set_many({chaves[mes]: eventos for mes, eventos in calculados.items()}, timeout=TTL_MES)
+        em_cache.update({chaves[mes]: eventos for mes, eventos in calculados.items()})
+
+    inicio_iso, fim_iso = inicio.isoformat(), fim.isoformat()
+    return [
+        evento
+        for chave in chaves.values()
+        for evento in em_cache[chave]
+        # "start" começa com a data local (YYYY-MM-DD), então a comparação de texto basta.
+        if inicio_iso <= evento["start"][:10] < fim_iso
+    ]
+
+
+def _escapar_ics(texto):
+    return (
+        texto.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _linha_ics(linha):
+    # Linhas de no máximo 75 octetos; as continuações começam com espaço (RFC 5545).
+    dados = linha.encode()
+    partes = []
+    while len(dados) > 75:
+        corte = 75 if not partes else 74
+        while corte > 0 and (dados[corte] & 0xC0) == 0x80:
+            corte -= 1  # não parte um caractere UTF-8 ao meio
+        partes.append(dados[:corte])
+        dados = dados[corte:]
+    partes.append(dados)
+    return (b"\r\n ".join(partes) + b"\r\n").decode()
+
+
+def _utc_ics(iso):
+    return datetime.fromisoformat(iso).astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _gerar_ics(eventos, dominio):
+    agora = timezone.now().astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    yield _linha_ics("BEGIN:VCALENDAR")
+    yield _linha_ics("VERSION:2.0")
+    yield _linha_ics("PRODID:-//Lava Jato 2025//Agendamentos//PT-BR")
+    yield _linha_ics("CALSCALE:GREGORIAN")
+    yield _linha_ics("X-WR-CALNAME:Agendamentos")
+    for evento in eventos:
+        yield "".join(
+            _linha_ics(linha)
+            for linha in (
+                "BEGIN:VEVENT",
+                f"UID:agendamento-{evento['id']}@{dominio}",
+                f"DTSTAMP:{agora}",
+                f"DTSTART:{_utc_ics(evento['start'])}",
+                f"DTEND:{_utc_ics(evento['end'])}",
+                f"SUMMARY:{_escapar_ics(evento['title'])}",
+                f"DESCRIPTION:{_escapar_ics(evento['codigo'])}",
+                f"STATUS:{STATUS_ICS.get(evento['status'], 'CONFIRMED')}",
+                "END:VEVENT",
+            )
+        )
+    yield _linha_ics("END:VCALENDAR")
+
+
+def resposta_ics(eventos, dominio, nome_arquivo="agendamentos"):
+    """StreamingHttpResponse com os eventos em iCalendar."""
+    resposta = StreamingHttpResponse(_gerar_ics(eventos, dominio), content_type="text/calendar; charset=utf-8")
+    resposta["Content-Disposition"] = f'inline; filename="{nome_arquivo}.ics"'
+    return resposta
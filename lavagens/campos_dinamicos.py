@@ -0,0 +1,196 @@
+"""
+Sparse fieldsets na API: ?fields=, ?omit= e ?expand=.
+
+- fields=codigo,status     devolve apenas esses campos;
+- omit=observacoes         remove campos da resposta;
+- expand=cliente,lavadores inclui o objeto aninhado no lugar do id da
+                           relação (relações listadas em Meta.expansiveis).
+
+Além de recortar a saída do serializer, a seleção define a consulta: as
+colunas, joins (select_related) e prefetches são deduzidos dos campos que
+sobraram, pela `source` de cada um. Campos calculados (propriedades,
+SerializerMethodField) informam do que dependem em Meta.dependencias; um
+caminho terminado em ".*" pede o objeto relacionado inteiro. Se algum campo
+não puder ser resolvido, a consulta carrega todas as colunas, mas os joins
+continuam restritos ao necessário.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+PARAM_CAMPOS = "fields"
+PARAM_OMITIR = "omit"
+PARAM_EXPANDIR = "expand"
+
+
+def _nomes(valor):
+    return {nome.strip() for nome in (valor or "").split(",") if nome.strip()}
+
+
+def ler_selecao(query_params):
+    """Seleção de campos pedida na requisição, ou None se não houver."""
+    selecao = {
+        "campos": _nomes(query_params.get(PARAM_CAMPOS)),
+        "omitir": _nomes(query_params.get(PARAM_OMITIR)),
+        "expandir": _nomes(query_params.get(PARAM_EXPANDIR)),
+    }
+    return selecao if any(selecao.values()) else None
+
+
+class CamposDinamicosSerializerMixin:
+    """
+    Aplica a seleção de campos guardada em context["selecao_campos"].
+
+    Meta.expansiveis: {campo: serializer aninhado usado com ?expand=}
+    Meta.dependencias: {campo calculado: [caminhos no modelo]}
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selecao = self.context.get("selecao_campos")
+        if selecao:
+            self._aplicar_selecao(selecao)
+
+    def _aplicar_selecao(self, selecao):
+        expansiveis = getattr(self.Meta, "expansiveis", {})
+        erros = {}
+
+        invalidos = selecao["expandir"] - set(expansiveis)
+        if invalidos:
+            erros[PARAM_EXPANDIR] = [f"Não é possível expandir: {', '.join(sorted(invalidos))}."]
+        for nome in selecao["expandir"] & set(expansiveis):
+            campo_modelo = self.Meta.model._meta.get_field(nome)
+            self.fields[nome] = expansiveis[nome](many=campo_modelo.many_to_many, read_only=True)
+
+        invalidos = (selecao["campos"] | selecao["omitir"]) - set(self.fields)
+        if invalidos:
+            erros[PARAM_CAMPOS] = [f"Campos inexistentes: {', '.join(sorted(invalidos))}."]
+        if erros:
+            raise serializers.ValidationError(erros)
+
+        # Relações expandidas entram na resposta mesmo fora de ?fields=.
+        manter = selecao["campos"] | selecao["expandir"]
+        for nome in list(self.fields):
+            if (selecao["campos"] and nome not in manter) or nome in selecao["omitir"]:
+                self.fields.pop(nome)
+
+
+class _Requisitos:
+    def __init__(self):
+        self.colunas = set()
+        self.joins = set()
+        self.prefetches = set()
+        self.todas_colunas = False
+
+
+def _resolver(caminho, aninhado, modelo, prefixo, requisitos):
+    relacao = prefixo
+    partes = caminho.split(".")
+    for indice, parte in enumerate(partes):
+        ultima = indice == len(partes) - 1
+        if parte == "*":
+            # Objeto relacionado inteiro: only("rel") carrega todas as suas colunas.
+            requisitos.colunas.add(relacao)
+            return
+        try:
+            campo = modelo._meta.get_field(parte)
+        except FieldDoesNotExist:
+            # Propriedade ou método sem dependências declaradas.
+            if relacao:
+                requisitos.colunas.add(relacao)
+            else:
+                requisitos.todas_colunas = True
+            return
+
+        caminho_orm = f"{relacao}__{parte}" if relacao else parte
+        if campo.many_to_many or campo.one_to_many:
+            requisitos.prefetches.add(caminho_orm)
+            return
+        if not campo.is_relation:
+            requisitos.colunas.add(caminho_orm)
+            return
+        if ultima and aninhado is None:
+            # Só o id da relação (PrimaryKeyRelatedField).
+            requisitos.colunas.add(caminho_orm)
+            return
+
+        requisitos.joins.add(caminho_orm)
+        modelo, relacao = campo.related_model, caminho_orm
+
+    if aninhado is not None:
+        _requisitos_serializer(aninhado, modelo, relacao, requisitos)
+
+
+def _requisitos_serializer(serializer, modelo, prefixo, requisitos):
+    dependencias = getattr(getattr(serializer, "Meta", None), "dependencias", {})
+    for nome, campo in serializer.fields.items():
+        if nome in dependencias:
+            for caminho in dependencias[nome]:
+                _resolver(caminho, None, modelo, prefixo, requisitos)
+            continue
+        if campo.source == "*":
+            if prefixo:
+                requisitos.colunas.add(prefixo)
+            else:
+                requisitos.todas_colunas = True
+            continue
+        aninhado = campo.child if isinstance(campo, serializers.ListSerializer) else campo
+        if not isinstance(aninhado, serializers.BaseSerializer):
+            aninhado = None
+        _resolver(campo.source, aninhado, modelo, prefixo, requisitos)
+
+
+def podar_queryset(queryset, serializer, colunas_extras=()):
+    """
+    Restringe colunas, joins e prefetches do queryset ao que `serializer`
+    (já com a seleção aplicada) vai ler.
+    """
+    requisitos = _Requisitos()
+    _requisitos_serializer(serializer, queryset.model, "", requisitos)
+
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if requisitos.joins:
+        queryset = queryset.select_related(*requisitos.joins)
+    if requisitos.prefetches:
+        queryset = queryset.prefetch_related(*requisitos.prefetches)
+    if requisitos.todas_colunas:
+        return queryset
+
+    colunas = requisitos.colunas | set(colunas_extras)
+    for join in requisitos.joins:
+        # Relação percorrida sem colunas pedidas: ao menos a chave estrangeira.
+        if not any(coluna.startswith(f"{join}__") for coluna in colunas):
+            colunas.add(join)
+    return queryset.only(*colunas)
+
+
+class CamposDinamicosViewSetMixin:
+    """
+    Lê ?fields=/?omit=/?expand= nas ações em `acoes_campos_dinamicos`, repassa a
+    seleção ao serializer e poda o queryset de acordo (ver podar_queryset).
+    """
+
+    acoes_campos_dinamicos = ("list", "retrieve")
+
+    def selecao_campos(self):
+        request = getattr(self, "request", None)
+        if request is None or self.action not in self.acoes_campos_dinamicos:
+            return None
+        return ler_selecao(request.query_params)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        selecao = self.selecao_campos()
+        if selecao:
+            context["selecao_campos"] = selecao
+        return context
+
+    def podar_queryset(self, queryset):
+        if not self.selecao_campos():
+            return queryset
+        # A paginação por keyset lê os campos da ordenação em cada página.
+        ordenacao = getattr(self.pagination_class, "ordering_cursor", ())
+        return podar_queryset(
+            queryset,
+            self.get_serializer(),
+            colunas_extras=[campo.lstrip("-") for campo in ordenacao],
+        )
@@ -0,0 +1,119 @@
+"""
+GET condicional (ETag / Last-Modified) para a API.
+
+Cada tabela acompanhada tem uma marca de alteração no cache compartilhado:
+o instante (time.time_ns) da última gravação confirmada. A marca serve ao
+mesmo tempo de versão, para o ETag, e de Last-Modified. Ela é atualizada
+depois do commit pelos sinais em lavagens.models; código que grava em lote
+sem passar por save() deve chamar registrar_alteracao().
+
+Views decoradas com @resposta_condicional comparam If-None-Match /
+If-Modified-Since com as marcas antes de consultar o banco ou serializar
+qualquer coisa; se nada mudou, respondem 304 direto.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+PREFIXO = "api:alterado_em"
+
+LAVAGENS = "lavagens"
+AGENDAMENTOS = "agendamentos"
+# Bases, tipos, transportes, materiais, lavadores, clientes e veículos:
+# os nomes aparecem embutidos nas respostas de lavagens e agendamentos.
+CATALOGO = "catalogo"
+
+
+def _chave(tabela):
+    return f"{PREFIXO}:{tabela}"
+
+
+def registrar_alteracao(*tabelas):
+    """Marca as tabelas como alteradas agora (após o commit, se em transação)."""
+    def marcar():
+        agora = time.time_ns()
+        cache.set_many({_chave(tabela): agora for tabela in tabelas}, timeout=None)
+
+    transaction.on_commit(marcar)
+
+
+def marcas_alteracao(tabelas):
+    """Instante da última alteração de cada tabela, em nanossegundos."""
+    chaves = [_chave(tabela) for tabela in tabelas]
+    marcas = cache.get_many(chaves)
+    faltando = [chave for chave in chaves if chave not in marcas]
+    if faltando:
+        # Marca expulsa do cache: considerar alterada agora é sempre seguro.
+        agora = time.time_ns()
+        for chave in faltando:
+            cache.add(chave, agora, timeout=None)
+        marcas.update(cache.get_many(faltando))
+    return [marcas[chave] for chave in chaves]
+
+
+def _inicio_janela(granularidade):
+    agora = timezone.localtime()
+    if granularidade == "dia":
+        return agora.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularidade == "minuto":
+        return agora.replace(second=0, microsecond=0)
+    return None
+
+
+def validadores(request, tabelas, granularidade=None):
+    """
+    (etag, last_modified) da resposta para a requisição, a partir das marcas
+    das tabelas. `granularidade` ("dia" ou "minuto") entra no cálculo quando a
+    resposta depende do relógio (ex.: agendamentos vencidos).
+    """
+    marcas = marcas_alteracao(tabelas)
+    ultima_alteracao = max(marcas) / 1e9
+    partes = [request.get_full_path(), request.accepted_renderer.media_type, *map(str, marcas)]
+
+    janela = _inicio_janela(granularidade)
+    if janela is not None:
+        partes.append(janela.isoformat())
+        ultima_alteracao = max(ultima_alteracao, janela.timestamp())
+
+    etag = quote_etag(hashlib.md5("|".join(partes).encode()).hexdigest())
+    return etag, int(ultima_alteracao)
+
+
+def resposta_condicional(*tabelas, granularidade=None):
+    """
+    Decorador para ações GET de viewsets: responde 304 quando o cliente já tem
+    a versão atual e, caso contrário, acrescenta ETag e Last-Modified.
+    A API navegável (HTML) fica de fora: a página depende do usuário e do CSRF.
+    """
+    def decorador(metodo):
+        @wraps(metodo)
+        def envoltorio(self, request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or request.accepted_renderer.format == "api":
+                return metodo(self, request, *args, **kwargs)
+
+            etag, ultima_alteracao = validadores(request, tabelas, granularidade)
+            nao_modificado = get_conditional_response(
+                request._request, etag=etag, last_modified=ultima_alteracao
+            )
+            if nao_modificado is not None:
+                if nao_modificado.status_code == 304:
+                    nao_modificado["ETag"] = etag
+                return nao_modificado
+
+            response = metodo(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response["ETag"] = etag
+                response["Last-Modified"] = http_date(ultima_alteracao)
+                # O cliente pode guardar, mas deve revalidar a cada uso.
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return envoltorio
+
+    return decorador
@@ -0,0 +1,182 @@
+"""
+Análise das durações das lavagens concluídas: percentis (p50/p90/p99) e
+histogramas, no geral e por tipo de lavagem, transporte/equipamento e lavador.
+
+A duração de cada lavagem é calculada no banco (DuracaoSegundos), e o
+resultado é lido do cursor como colunas numéricas, sem converter datas
+linha a linha. Os agrupamentos e percentis são feitos de uma vez com NumPy.
+"""
+from itertools import chain
+
+import numpy as np
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models.functions import Coalesce
+
+from clientes.models import Lavador
+
+from .anotacoes import DuracaoSegundos
+from .models import Lavagem, TipoLavagem, TransporteEquipamento
+
+PERCENTIS = (50, 90, 99)
+
+# Faixas do histograma, em minutos; a última faixa acumula tudo acima dela.
+LARGURA_FAIXA_MINUTOS = 15
+TOTAL_FAIXAS = 12
+
+SEM_GRUPO = 0
+NOME_SEM_GRUPO = "Não informado"
+
+
+def lavagens_com_duracao(lavagens=None):
+    """Lavagens concluídas com início e término, anotadas com `duracao_segundos`."""
+    if lavagens is None:
+        lavagens = Lavagem.objects.all()
+    return lavagens.filter(
+        status="CONCLUIDA", hora_inicio__isnull=False, hora_termino__isnull=False
+    ).annotate(duracao_segundos=DuracaoSegundos("hora_inicio", "hora_termino"))
+
+
+def _colunas(queryset, *campos):
+    """
+    Valores de `campos` como uma matriz float64 (uma linha por registro).
+    Lê direto do cursor, sem os conversores do ORM aplicados linha a linha.
+    """
+    try:
+        sql, params = queryset.order_by().values_list(*campos).query.sql_with_params()
+    except EmptyResultSet:
+        return np.empty((0, len(campos)))
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        linhas = cursor.fetchall()
+    valores = np.fromiter(
+        chain.from_iterable(linhas), dtype=np.float64, count=len(linhas) * len(campos)
+    )
+    return valores.reshape(-1, len(campos))
+
+
+def _minutos(segundos):
+    # Término antes do início conta como 0, como em Lavagem.duracao_lavagem.
+    return np.maximum(segundos, 0) / 60
+
+
+def _carregar(lavagens):
+    """
+    Retorna (minutos, tipos, transportes) como arrays NumPy. Ids de grupo
+    nulos viram SEM_GRUPO.
+    """
+    matriz = _colunas(
+        lavagens.annotate(
+            tipo=Coalesce("tipo_lavagem_id", SEM_GRUPO),
+            transporte=Coalesce("transporte_equipamento_id", SEM_GRUPO),
+        ),
+        "duracao_segundos", "tipo", "transporte",
+    )
+    return _minutos(matriz[:, 0]), matriz[:, 1].astype(np.int64), matriz[:, 2].astype(np.int64)
+
+
+def _carregar_lavadores(lavagens):
+    """(lavadores, minutos) com uma entrada por par lavagem/lavador."""
+    matriz = _colunas(
+        Lavagem.lavadores.through.objects
+        .filter(lavagem__in=lavagens.order_by().values("id"))
+        .annotate(duracao_segundos=DuracaoSegundos("lavagem__hora_inicio", "lavagem__hora_termino")),
+        "lavador_id", "duracao_segundos",
+    )
+    return matriz[:, 0].astype(np.int64), _minutos(matriz[:, 1])
+
+
+def _faixas(minutos):
+    return np.minimum((minutos // LARGURA_FAIXA_MINUTOS).astype(np.int64), TOTAL_FAIXAS)
+
+
+def _rotulos_faixas():
+    rotulos = [
+        f"{inicio}-{inicio + LARGURA_FAIXA_MINUTOS} min"
+        for inicio in range(0, TOTAL_FAIXAS * LARGURA_FAIXA_MINUTOS, LARGURA_FAIXA_MINUTOS)
+    ]
+    rotulos.append(f"{TOTAL_FAIXAS * LARGURA_FAIXA_MINUTOS}+ min")
+    return rotulos
+
+
+def _estatisticas_por_grupo(grupos, minutos):
+    """
+    Quantidade, média, mínimo, máximo, percentis e histograma de cada grupo,
+    calculados sobre os valores ordenados por (grupo, minutos), sem laço por
+    grupo. Com grupos=None, todos os valores formam um grupo só.
+    """
+    if not len(minutos):
+        return []
+
+    if grupos is None:
+        grupos, minutos = np.zeros(len(minutos), dtype=np.int64), np.sort(minutos)
+    else:
+        ordem = np.lexsort((minutos, grupos))
+        grupos, minutos = grupos[ordem], minutos[ordem]
+    chaves, inicios, quantidades = np.unique(grupos, return_index=True, return_counts=True)
+    fins = inicios + quantidades - 1
+
+    # Percentil com interpolação linear (o mesmo método padrão de np.percentile).
+    percentis = {}
+    for percentil in PERCENTIS:
+        posicao = inicios + (quantidades - 1) * (percentil / 100)
+        abaixo = np.floor(posicao).astype(np.int64)
+        acima = np.ceil(posicao).astype(np.int64)
+        percentis[percentil] = minutos[abaixo] + (minutos[acima] - minutos[abaixo]) * (posicao - abaixo)
+
+    medias = np.add.reduceat(minutos, inicios) / quantidades
+
+    indice_grupo = np.repeat(np.arange(len(chaves)), quantidades)
+    histogramas = np.bincount(
+        indice_grupo * (TOTAL_FAIXAS + 1) + _faixas(minutos),
+        minlength=len(chaves) * (TOTAL_FAIXAS + 1),
+    ).reshape(len(chaves), TOTAL_FAIXAS + 1)
+
+    # Valores convertidos para tipos nativos: o resultado vai para cache e JSON.
+    return [
+        {
+            "id": int(chaves[i]),
+            "quantidade": int(quantidades[i]),
+            "media": round(float(medias[i]), 1),
+            "minimo": round(float(minutos[inicios[i]]), 1),
+            "maximo": round(float(minutos[fins[i]]), 1),
+            **{f"p{p}": round(float(percentis[p][i]), 1) for p in PERCENTIS},
+            "histograma": histogramas[i].tolist(),
+        }
+        for i in range(len(chaves))
+    ]
+
+
+def _nomear(itens, modelo):
+    nomes = dict(
+        modelo.objects.filter(id__in=[item["id"] for item in itens]).values_list("id", "nome")
+    )
+    for item in itens:
+        item["nome"] = nomes.get(item["id"], NOME_SEM_GRUPO)
+    return sorted(itens, key=lambda item: -item["quantidade"])
+
+
+def analise_duracoes(lavagens=None):
+    """
+    Percentis e histogramas de duração (em minutos) das lavagens concluídas
+    do queryset informado (todas, se None).
+    """
+    lavagens = lavagens_com_duracao(lavagens)
+    minutos, tipos, transportes = _carregar(lavagens)
+    lavadores, minutos_lavadores = _carregar_lavadores(lavagens)
+
+    geral = _estatisticas_por_grupo(None, minutos)
+    if geral:
+        geral = geral[0]
+        del geral["id"]
+    else:
+        geral = {"quantidade": 0, "media": None, "minimo": None, "maximo": None,
+                 **{f"p{p}": None for p in PERCENTIS}, "histograma": [0] * (TOTAL_FAIXAS + 1)}
+
+    return {
+        "faixas": _rotulos_faixas(),
+        "geral": geral,
+        "por_tipo_lavagem": _nomear(_estatisticas_por_grupo(tipos, minutos), TipoLavagem),
+        "por_transporte": _nomear(_estatisticas_por_grupo(transportes, minutos), TransporteEquipamento),
+        "por_lavador": _nomear(_estatisticas_por_grupo(lavadores, minutos_lavadores), Lavador),
+    }
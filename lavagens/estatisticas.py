@@ -0,0 +1,99 @@
+"""
+Contadores compartilhados pelos dashboards, relatórios e endpoints de estatísticas.
+
+Cada função devolve todos os contadores de um modelo com um único
+aggregate(Count(..., filter=Q(...))), em vez de um .count() por status.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+
+# Nome do contador -> status correspondente no modelo.
+STATUS_LAVAGEM = {
+    "em_andamento": "EM_ANDAMENTO",
+    "concluidas": "CONCLUIDA",
+    "canceladas": "CANCELADA",
+}
+
+STATUS_AGENDAMENTO = {
+    "agendados": "AGENDADO",
+    "confirmados": "CONFIRMADO",
+    "em_andamento": "EM_ANDAMENTO",
+    "concluidos": "CONCLUIDO",
+    "cancelados": "CANCELADO",
+    "nao_compareceu": "NAO_COMPARECEU",
+}
+
+
+def por_status(contadores, mapa_status):
+    """Converte os contadores em {STATUS: quantidade}, omitindo os zerados."""
+    return {
+        status: contadores[nome]
+        for nome, status in mapa_status.items()
+        if contadores[nome]
+    }
+
+
+def contadores_lavagens(lavagens=None):
+    """Total e quantidade por status das lavagens informadas."""
+    from .models import Lavagem
+
+    if lavagens is None:
+        lavagens = Lavagem.objects.all()
+    return lavagens.order_by().aggregate(
+        total=Count("id"),
+        **{nome: Count("id", filter=Q(status=status)) for nome, status in STATUS_LAVAGEM.items()},
+    )
+
+
+def contadores_agendamentos(agendamentos=None, hoje=None):
+    """Total, agendamentos de hoje, vencidos e quantidade por status."""
+    from .agendamento_models import Agendamento
+
+    if agendamentos is None:
+        agendamentos = Agendamento.objects.all()
+    agregados = {
+        nome: Count("id", filter=Q(status=status)) for nome, status in STATUS_AGENDAMENTO.items()
+    }
+    if hoje is not None:
+        agregados["hoje"] = Count("id", filter=Q(data_agendamento=hoje))
+        agregados["vencidos"] = Count(
+            "id",
+            filter=Q(data_agendamento__lt=hoje, status__in=["AGENDADO", "CONFIRMADO"]),
+        )
+    return agendamentos.order_by().aggregate(total=Count("id"), **agregados)
+
+
+def contadores_resumo(resumos, hoje=None):
+    """
+    Totais do resumo diário (ResumoDiarioLavagem): quantidade por status,
+    faturamento e tempo médio das concluídas e, se `hoje` for informado,
+    faturamento do mês corrente e do dia.
+    """
+    concluidas = Q(status="CONCLUIDA")
+    agregados = {
+        nome: Sum("quantidade", filter=Q(status=status)) for nome, status in STATUS_LAVAGEM.items()
+    }
+    agregados.update(
+        total=Sum("quantidade"),
+        faturamento_periodo=Sum("faturamento", filter=concluidas),
+        duracao_segundos=Sum("duracao_total_segundos", filter=concluidas),
+        quantidade_com_duracao=Sum("quantidade_com_duracao", filter=concluidas),
+    )
+    if hoje is not None:
+        agregados["faturamento_mes"] = Sum(
+            "faturamento", filter=concluidas & Q(data_lavagem__gte=hoje.replace(day=1))
+        )
+        agregados["faturamento_dia"] = Sum("faturamento", filter=concluidas & Q(data_lavagem=hoje))
+
+    totais = resumos.order_by().aggregate(**agregados)
+    for nome in ["total", *STATUS_LAVAGEM]:
+        totais[nome] = totais[nome] or 0
+    for nome in ["faturamento_periodo", "faturamento_mes", "faturamento_dia"]:
+        if nome in totais:
+            totais[nome] = totais[nome] or Decimal("0.00")
+
+    segundos = totais.pop("duracao_segundos")
+    quantidade = totais.pop("quantidade_com_duracao")
+    totais["tempo_medio_minutos"] = int(segundos / quantidade / 60) if quantidade else 0
+    return totais
@@ -0,0 +1,191 @@
+"""
+Exportação em fluxo (CSV ou NDJSON) de lavagens e agendamentos.
+
+As linhas são lidas com .values().iterator(chunk_size=...) e escritas uma a
+uma num StreamingHttpResponse, então a memória fica constante qualquer que
+seja o tamanho do período. Os lavadores (ManyToMany) são buscados com uma
+consulta por lote de linhas.
+"""
+import csv
+import json
+from datetime import date, datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+TAMANHO_LOTE = 2000
+
+FORMATOS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+CAMPOS_LAVAGEM = [
+    ("id", "id"),
+    ("codigo", "codigo"),
+    ("data_lavagem", "data_lavagem"),
+    ("hora_inicio", "hora_inicio"),
+    ("hora_termino", "hora_termino"),
+    ("status", "status"),
+    ("placa_veiculo", "placa_veiculo"),
+    ("cliente", "cliente__nome"),
+    ("base", "base__nome"),
+    ("local", "local"),
+    ("tipo_lavagem", "tipo_lavagem__nome"),
+    ("transporte_equipamento", "transporte_equipamento__nome"),
+    ("contrato", "contrato"),
+    ("valor_servico", "valor_servico"),
+    ("desconto", "desconto"),
+    ("valor_final", "valor_final"),
+    ("recebimento", "recebimento"),
+    ("observacoes", "observacoes"),
+]
+
+CAMPOS_AGENDAMENTO = [
+    ("id", "id"),
+    ("codigo", "codigo"),
+    ("data_agendamento", "data_agendamento"),
+    ("hora_agendamento", "hora_agendamento"),
+    ("status", "status"),
+    ("prioridade", "prioridade"),
+    ("placa_veiculo", "placa_veiculo"),
+    ("cliente", "cliente__nome"),
+    ("telefone_contato", "telefone_contato"),
+    ("base", "base__nome"),
+    ("local", "local"),
+    ("tipo_lavagem", "tipo_lavagem__nome"),
+    ("transporte_equipamento", "transporte_equipamento__nome"),
+    ("duracao_estimada", "duracao_estimada"),
+    ("valor_estimado", "valor_estimado"),
+    ("desconto_agendamento", "desconto_agendamento"),
+    ("lavagem_id", "lavagem_id"),
+    ("observacoes", "observacoes"),
+]
+
+
+class FiltroInvalido(ValueError):
+    pass
+
+
+def _ler_filtro(parametro, valor, lookup):
+    if lookup.endswith("_id"):
+        try:
+            return int(valor)
+        except ValueError:
+            raise FiltroInvalido(f"{parametro} deve ser um id numérico.")
+    if parametro in ("data_inicio", "data_fim"):
+        try:
+            return date.fromisoformat(valor)
+        except ValueError:
+            raise FiltroInvalido(f"{parametro} inválido. Use YYYY-MM-DD.")
+    return valor
+
+
+def _filtrar(queryset, params, filtros):
+    for parametro, lookup in filtros.items():
+        valor = params.get(parametro)
+        if valor:
+            queryset = queryset.filter(**{lookup: _ler_filtro(parametro, valor, lookup)})
+    return queryset
+
+
+def filtrar_lavagens(lavagens, params):
+    """
+    Aplica os filtros da API de lavagens (status, base, tipo, transporte e
+    datas). Levanta FiltroInvalido com ids ou datas mal formados.
+    """
+    return _filtrar(lavagens, params, {
+        "status": "status",
+        "base": "base_id",
+        "tipo_lavagem": "tipo_lavagem_id",
+        "transporte_equipamento": "transporte_equipamento_id",
+        "data_inicio": "data_lavagem__gte",
+        "data_fim": "data_lavagem__lte",
+    })
+
+
+def filtrar_agendamentos(agendamentos, params):
+    """
+    Aplica os filtros da API de agendamentos (status, base, tipo e datas).
+    Levanta FiltroInvalido com ids ou datas mal formados.
+    """
+    return _filtrar(agendamentos, params, {
+        "status": "status",
+        "base": "base_id",
+        "tipo_lavagem": "tipo_lavagem_id",
+        "transporte_equipamento": "transporte_equipamento_id",
+        "data_inicio": "data_agendamento__gte",
+        "data_fim": "data_agendamento__lte",
+    })
+
+
+class _Eco:
+    """Pseudo-arquivo para o csv.writer: devolve a linha em vez de guardá-la."""
+
+    def write(self, valor):
+        return valor
+
+
+def _valor(valor):
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat() if timezone.is_aware(valor) else valor.isoformat()
+    return valor
+
+
+def _linhas(queryset, campos):
+    """Gera dicionários prontos para exportar, com os lavadores de cada lote."""
+    nomes = [nome for nome, _ in campos]
+    colunas = [coluna for _, coluna in campos]
+    through = queryset.model._meta.get_field("lavadores").remote_field.through
+    coluna_origem = f"{queryset.model._meta.model_name}_id"
+
+    lote = []
+    for linha in queryset.values_list(*colunas).iterator(chunk_size=TAMANHO_LOTE):
+        lote.append(linha)
+        if len(lote) >= TAMANHO_LOTE:
+            yield from _lote_com_lavadores(lote, nomes, through, coluna_origem)
+            lote = []
+    if lote:
+        yield from _lote_com_lavadores(lote, nomes, through, coluna_origem)
+
+
+def _lote_com_lavadores(lote, nomes, through, coluna_origem):
+    ids = [linha[0] for linha in lote]
+    lavadores = {}
+    for origem_id, nome in through.objects.filter(
+        **{f"{coluna_origem}__in": ids}
+    ).values_list(coluna_origem, "lavador__nome").order_by("lavador__nome"):
+        lavadores.setdefault(origem_id, []).append(nome)
+
+    for linha in lote:
+        registro = {nome: _valor(valor) for nome, valor in zip(nomes, linha)}
+        registro["lavadores"] = ", ".join(lavadores.get(linha[0], []))
+        yield registro
+
+
+def _gerar_csv(registros, nomes):
+    escritor = csv.writer(_Eco())
+    yield "\ufeff"  # BOM para o Excel reconhecer UTF-8
+    yield escritor.writerow(nomes)
+    for registro in registros:
+        yield escritor.writerow([registro[nome] for nome in nomes])
+
+
+def _gerar_ndjson(registros):
+    for registro in registros:
+        yield json.dumps(registro, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def resposta_exportacao(queryset, campos, formato, nome_arquivo):
+    """StreamingHttpResponse com as linhas do queryset em CSV ou NDJSON."""
+    registros = _linhas(queryset, campos)
+    if formato == "ndjson":
+        conteudo = _gerar_ndjson(registros)
+    else:
+        formato = "csv"
+        conteudo = _gerar_csv(registros, [nome for nome, _ in campos] + ["lavadores"])
+
+    resposta = StreamingHttpResponse(conteudo, content_type=FORMATOS[formato])
+    resposta["Content-Disposition"] = f'attachment; filename="{nome_arquivo}.{formato}"'
+    return resposta
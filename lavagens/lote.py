@@ -0,0 +1,186 @@
+"""
+Gravação de lavagens em lote (POST /api/lavagens/lote/).
+
+Contratos de frota mandam dezenas de veículos de uma vez. Em vez de um
+save() e um lavadores.set() por lavagem, o lote:
+
+- resolve base, tipo, transporte e lavadores com uma consulta por modelo;
+- insere as novas lavagens com bulk_create e atualiza as existentes (itens
+  com "id") com bulk_update;
+- grava todos os vínculos com lavadores em um único insert na tabela
+  intermediária;
+- refaz o resumo diário uma vez para todos os dias afetados;
+- atualiza o índice de busca textual das lavagens do lote de uma vez.
+
+Tudo acontece em uma transação: ou o lote inteiro é gravado, ou nada é.
+Como save() e os sinais não são chamados, a invalidação de caches, as
+marcas de alteração da API e os eventos do feed ao vivo ficam aqui.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from clientes.models import Lavador
+from clientes.placas import normalizar_placa
+
+from .ao_vivo import registrar_eventos
+from .busca import indexar
+from .condicional import AGENDAMENTOS, LAVAGENS, registrar_alteracao
+from .models import Base, Lavagem, TipoLavagem, TransporteEquipamento, gerar_codigo_lavagem
+from .resumos import atualizar_resumo_dias
+
+LOTE_MAXIMO = 1000
+
+RELACOES = {
+    "base": Base,
+    "tipo_lavagem": TipoLavagem,
+    "transporte_equipamento": TransporteEquipamento,
+}
+
+
+class ErroLote(Exception):
+    """Itens do lote com erro: lista de {"indice", "erros"}."""
+
+    def __init__(self, itens):
+        super().__init__(f"{len(itens)} item(ns) do lote com erro")
+        self.itens = itens
+
+
+def _ids_existentes(modelo, ids):
+    ids = {id_ for id_ in ids if id_ is not None}
+    if not ids:
+        return set()
+    return set(modelo.objects.filter(pk__in=ids).values_list("pk", flat=True))
+
+
+def _validar_referencias(itens, existentes):
+    encontrados = {
+        campo: _ids_existentes(modelo, (item.get(campo) for item in itens))
+        for campo, modelo in RELACOES.items()
+    }
+    lavadores = _ids_existentes(Lavador, (id_ for item in itens for id_ in item.get("lavadores", ())))
+
+    erros = []
+    vistos = set()
+    for indice, item in enumerate(itens):
+        erros_item = {}
+        for campo, modelo in RELACOES.items():
+            valor = item.get(campo)
+            if valor is not None and valor not in encontrados[campo]:
+                erros_item[campo] = [f"{modelo._meta.verbose_name} {valor} não existe."]
+        faltando = sorted(set(item.get("lavadores", ())) - lavadores)
+        if faltando:
+            erros_item["lavadores"] = [f"Lavadores inexistentes: {', '.join(map(str, faltando))}."]
+        if "id" in item:
+            if item["id"] not in existentes:
+                erros_item["id"] = ["Lavagem não encontrada."]
+            elif item["id"] in vistos:
+                erros_item["id"] = ["Lavagem repetida no lote."]
+            vistos.add(item["id"])
+        if erros_item:
+            erros.append({"indice": indice, "erros": erros_item})
+    return erros
+
+
+def _codigos_livres(quantidade):
+    """Gera `quantidade` códigos que ainda não existem no banco."""
+    codigos = set()
+    while len(codigos) < quantidade:
+        novos = {gerar_codigo_lavagem() for _ in range(quantidade - len(codigos))} - codigos
+        em_uso = set(Lavagem.objects.filter(codigo__in=novos).values_list("codigo", flat=True))
+        codigos |= novos - em_uso
+    return list(codigos)
+
+
+def _aplicar(lavagem, item):
+    """Copia os campos do item para a lavagem; retorna os nomes alterados."""
+    campos = set()
+    for campo, valor in item.items():
+        if campo in ("id", "lavadores"):
+            continue
+        if campo in RELACOES:
+            campo = f"{campo}_id"
+        setattr(lavagem, campo, valor)
+        campos.add(campo)
+    if "data_lavagem" not in item and lavagem.data_lavagem is None and lavagem.hora_inicio:
+        lavagem.data_lavagem = timezone.localtime(lavagem.hora_inicio).date()
+        campos.add("data_lavagem")
+    # Mesmos cálculos de Lavagem.save().
+    if "placa_veiculo" in campos:
+        lavagem.placa_normalizada = normalizar_placa(lavagem.placa_veiculo)
+        campos.add("placa_normalizada")
+    if lavagem.valor_servico is not None:
+        lavagem.valor_final = lavagem.valor_servico - (lavagem.desconto or 0)
+        campos.add("valor_final")
+    return campos
+
+
+def gravar_lote(itens):
+    """
+    Cria (itens sem "id") e atualiza (itens com "id") lavagens a partir dos
+    dados já validados por LavagemLoteItemSerializer. Retorna um resultado
+    por item, na ordem recebida; levanta ErroLote sem gravar nada se alguma
+    referência não existir.
+    """
+    existentes = Lavagem.objects.in_bulk([item["id"] for item in itens if "id" in item])
+    erros = _validar_referencias(itens, existentes)
+    if erros:
+        raise ErroLote(erros)
+
+    dias = set()
+    agora = timezone.now()
+    alvos, novas, atualizadas, campos_atualizados = [], [], [], {"atualizado_em"}
+    for item in itens:
+        if "id" in item:
+            lavagem = existentes[item["id"]]
+            dias.add(lavagem.data_lavagem)
+            campos_atualizados |= _aplicar(lavagem, item)
+            # bulk_update não preenche campos auto_now.
+            lavagem.atualizado_em = agora
+            atualizadas.append(lavagem)
+        else:
+            lavagem = Lavagem()
+            _aplicar(lavagem, item)
+            novas.append(lavagem)
+        dias.add(lavagem.data_lavagem)
+        alvos.append(lavagem)
+
+    Vinculo = Lavagem.lavadores.through
+    with transaction.atomic():
+        for lavagem, codigo in zip(novas, _codigos_livres(len(novas))):
+            lavagem.codigo = codigo
+        Lavagem.objects.bulk_create(novas)
+        if atualizadas:
+            Lavagem.objects.bulk_update(atualizadas, sorted(campos_atualizados))
+
+        vinculos, substituir = [], []
+        for item, lavagem in zip(itens, alvos):
+            if "lavadores" not in item:
+                continue
+            if "id" in item:
+                substituir.append(lavagem.pk)
+            vinculos += [
+                Vinculo(lavagem_id=lavagem.pk, lavador_id=lavador_id)
+                for lavador_id in set(item["lavadores"])
+            ]
+        if substituir:
+            Vinculo.objects.filter(lavagem_id__in=substituir).delete()
+        Vinculo.objects.bulk_create(vinculos)
+
+        atualizar_resumo_dias(dias)
+        indexar("lavagem", [lavagem.pk for lavagem in alvos])
+        registrar_alteracao(LAVAGENS, AGENDAMENTOS)
+        registrar_eventos("lavagem", [(lavagem.pk, lavagem.base_id, lavagem.status) for lavagem in novas], "criado")
+        registrar_eventos("lavagem", [
+            (lavagem.pk, lavagem.base_id, lavagem.status) for lavagem in atualizadas
+            if (lavagem.status, lavagem.base_id) != lavagem._evento_original
+        ])
+
+    return [
+        {
+            "indice": indice,
+            "id": lavagem.pk,
+            "codigo": lavagem.codigo,
+            "acao": "atualizada" if "id" in item else "criada",
+        }
+        for indice, (item, lavagem) in enumerate(zip(itens, alvos))
+    ]
@@ -0,0 +1,123 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from clientes.models import Cliente, Lavador
+from lavagens.models import Base, Lavagem, TipoLavagem, TransporteEquipamento
+from lavagens.renderizadores import JSONRapidoRenderer, MessagePackRenderer, msgpack, orjson
+from lavagens.serializers import LavagemListSerializer, otimizar_queryset_lavagens
+
+
+def _lavagens_sinteticas(quantidade):
+    """Lavagens em memória com as relações já carregadas, como numa página real."""
+    aleatorio = random.Random(2025)
+    bases = [Base(pk=i, nome=f"Base {nome}") for i, nome in enumerate(["Manaus", "Itacoatiara", "Parintins"], 1)]
+    tipos = [TipoLavagem(pk=i, nome=nome) for i, nome in enumerate(["Simples", "Completa", "Técnica"], 1)]
+    transportes = [TransporteEquipamento(pk=i, nome=f"Caminhão {i:02d}") for i in range(1, 6)]
+    clientes = [Cliente(pk=i, nome=f"Transportadora São João {i}") for i in range(1, 21)]
+    lavadores = [Lavador(pk=i, nome=f"Lavador {i}") for i in range(1, 11)]
+    agora = timezone.now()
+
+    lavagens = []
+    for pk in range(1, quantidade + 1):
+        inicio = agora - timedelta(minutes=aleatorio.randint(0, 60 * 24 * 90))
+        concluida = aleatorio.random() < 0.8
+        valor = Decimal(aleatorio.randint(5000, 40000)) / 100
+        lavagem = Lavagem(
+            pk=pk,
+            codigo=f"LAV{pk:08d}",
+            placa_veiculo=f"ABC{pk % 10000:04d}",
+            hora_inicio=inicio,
+            hora_termino=inicio + timedelta(minutes=aleatorio.randint(20, 180)) if concluida else None,
+            data_lavagem=timezone.localtime(inicio).date(),
+            status="CONCLUIDA" if concluida else "EM_ANDAMENTO",
+            valor_servico=valor,
+            valor_final=valor,
+            base=aleatorio.choice(bases),
+            local="Pátio principal",
+            tipo_lavagem=aleatorio.choice(tipos),
+            transporte_equipamento=aleatorio.choice(transportes),
+            cliente=aleatorio.choice(clientes),
+            observacoes="Lavagem com atenção à carroceria." if pk % 3 == 0 else "",
+        )
+        lavagem._prefetched_objects_cache = {"lavadores": aleatorio.sample(lavadores, 2)}
+        lavagens.append(lavagem)
+    return lavagens
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o tempo de renderização da API (JSON padrão, orjson e MessagePack) "
+        "em páginas da listagem de lavagens."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tamanho-pagina",
+            type=int,
+            action="append",
+            help="Lavagens por página; pode ser repetido (padrão: 20, 100 e 1000).",
+        )
+        parser.add_argument(
+            "--repeticoes",
+            type=int,
+            default=50,
+            help="Renderizações por medida; vale a melhor de 5 medidas (padrão: 50).",
+        )
+        parser.add_argument(
+            "--banco",
+            action="store_true",
+            help="Usa lavagens do banco em vez de lavagens geradas em memória.",
+        )
+
+    def _medir(self, funcao, repeticoes):
+        melhores = []
+        for _ in range(5):
+            inicio = time.perf_counter()
+            for _ in range(repeticoes):
+                funcao()
+            melhores.append((time.perf_counter() - inicio) / repeticoes)
+        return min(melhores) * 1000
+
+    def handle(self, *args, **options):
+        tamanhos = options["tamanho_pagina"] or [20, 100, 1000]
+        repeticoes = options["repeticoes"]
+
+        renderizadores = [("json (DRF)", JSONRenderer())]
+        if orjson is not None:
+            renderizadores.append(("orjson", JSONRapidoRenderer()))
+        else:
+            self.stdout.write(self.style.WARNING("orjson não instalado: JSONRapidoRenderer usa o json padrão."))
+        if msgpack is not None:
+            renderizadores.append(("msgpack", MessagePackRenderer()))
+        else:
+            self.stdout.write(self.style.WARNING("msgpack não instalado: MessagePackRenderer fora da comparação."))
+
+        for tamanho in tamanhos:
+            if options["banco"]:
+                lavagens = list(otimizar_queryset_lavagens(Lavagem.objects.order_by("-data_lavagem", "-id"))[:tamanho])
+            else:
+                lavagens = _lavagens_sinteticas(tamanho)
+            # Mesmo formato da resposta paginada da API.
+            dados = {
+                "count": len(lavagens) * 10,
+                "next": "http://localhost/api/lavagens/?page=2",
+                "previous": None,
+                "results": LavagemListSerializer(lavagens, many=True).data,
+            }
+            serializacao = self._medir(lambda: LavagemListSerializer(lavagens, many=True).data, max(1, repeticoes // 5))
+
+            self.stdout.write(f"\nPágina com {len(lavagens)} lavagens (serializer: {serializacao:.2f} ms)")
+            referencia = None
+            for nome, renderizador in renderizadores:
+                tamanho_bytes = len(renderizador.render(dados, renderizador.media_type))
+                tempo = self._medir(lambda: renderizador.render(dados, renderizador.media_type), repeticoes)
+                referencia = referencia or tempo
+                self.stdout.write(
+                    f"  {nome:<12} {tempo:8.3f} ms  {tamanho_bytes:>9} bytes  {referencia / tempo:5.1f}x"
+                )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from lavagens.ao_vivo import RETENCAO_EVENTOS, limpar_eventos
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga os eventos do feed ao vivo mais antigos que "
+        f"{RETENCAO_EVENTOS.days} dia(s). Telas abertas há mais tempo recebem só "
+        "os eventos novos ao reconectar."
+    )
+
+    def handle(self, *args, **options):
+        apagados = limpar_eventos()
+        self.stdout.write(self.style.SUCCESS(f"{apagados} eventos apagados."))
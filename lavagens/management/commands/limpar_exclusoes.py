@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from lavagens.sincronizacao import RETENCAO_EXCLUSOES, limpar_exclusoes
+
+
+class Command(BaseCommand):
+    help = (
+        "Apaga os registros de exclusão usados por /api/sync/ mais antigos que "
+        f"{RETENCAO_EXCLUSOES.days} dias. Clientes com token mais antigo que isso "
+        "recebem 410 e sincronizam do zero."
+    )
+
+    def handle(self, *args, **options):
+        apagados = limpar_exclusoes()
+        self.stdout.write(self.style.SUCCESS(f"{apagados} registros de exclusão apagados."))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from lavagens.tarefas import processar_pendentes
+
+
+class Command(BaseCommand):
+    help = "Worker da fila de relatórios em segundo plano (TarefaRelatorio)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--uma-vez",
+            action="store_true",
+            help="Processa as tarefas pendentes e sai, em vez de continuar aguardando.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=5,
+            help="Segundos de espera entre verificações da fila (padrão: 5).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            processadas = processar_pendentes()
+            if processadas:
+                self.stdout.write(f"{processadas} tarefa(s) de relatório processada(s).")
+            if options["uma_vez"]:
+                break
+            time.sleep(options["intervalo"])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from lavagens.resumos import reconstruir_resumos
+
+
+class Command(BaseCommand):
+    help = "Recria do zero o resumo diário de lavagens (ResumoDiarioLavagem)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tamanho-lote",
+            type=int,
+            default=1000,
+            help="Quantidade de linhas inseridas por lote (padrão: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        total = reconstruir_resumos(tamanho_lote=options["tamanho_lote"])
+        self.stdout.write(self.style.SUCCESS(f"Resumo diário reconstruído: {total} linhas."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lavagens.busca import INDICES, disponivel, reindexar
+
+
+class Command(BaseCommand):
+    help = "Recria do zero os índices de busca textual (FTS5) de lavagens e agendamentos."
+
+    def handle(self, *args, **options):
+        if not disponivel():
+            self.stdout.write(self.style.WARNING("Banco sem FTS5: a busca usa icontains, não há índice."))
+            return
+        for tipo in INDICES:
+            with transaction.atomic():
+                total = reindexar(tipo)
+            self.stdout.write(self.style.SUCCESS(f"Índice de busca de {tipo}: {total} linhas."))
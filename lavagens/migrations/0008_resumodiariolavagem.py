@@ -0,0 +1,98 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+
+TAMANHO_LOTE = 1000
+
+
+def popular_resumos(apps, schema_editor):
+    # Cópia de lavagens.resumos.reconstruir_resumos sobre os modelos históricos.
+    Lavagem = apps.get_model('lavagens', 'Lavagem')
+    ResumoDiarioLavagem = apps.get_model('lavagens', 'ResumoDiarioLavagem')
+
+    com_duracao = Q(status='CONCLUIDA', hora_inicio__isnull=False, hora_termino__isnull=False)
+    linhas = Lavagem.objects.order_by().values(
+        'data_lavagem', 'base_id', 'tipo_lavagem_id', 'transporte_equipamento_id', 'status'
+    ).annotate(
+        total=Count('id'),
+        soma_valor=Sum('valor_final'),
+        soma_duracao=Sum(
+            ExpressionWrapper(F('hora_termino') - F('hora_inicio'), output_field=DurationField()),
+            filter=com_duracao,
+        ),
+        total_com_duracao=Count('id', filter=com_duracao),
+    )
+
+    ResumoDiarioLavagem.objects.all().delete()
+    lote = []
+    for linha in linhas.iterator(chunk_size=TAMANHO_LOTE):
+        duracao = linha['soma_duracao']
+        lote.append(ResumoDiarioLavagem(
+            data_lavagem=linha['data_lavagem'],
+            base_id=linha['base_id'],
+            tipo_lavagem_id=linha['tipo_lavagem_id'],
+            transporte_equipamento_id=linha['transporte_equipamento_id'],
+            status=linha['status'],
+            quantidade=linha['total'],
+            faturamento=linha['soma_valor'] or 0,
+            duracao_total_segundos=int(duracao.total_seconds()) if duracao else 0,
+            quantidade_com_duracao=linha['total_com_duracao'],
+        ))
+        if len(lote) >= TAMANHO_LOTE:
+            ResumoDiarioLavagem.objects.bulk_create(lote)
+            lote = []
+    ResumoDiarioLavagem.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0002_remove_cliente_cpf_cnpj_remove_cliente_endereco'),
+        ('lavagens', '0007_remove_agendamento_lavador_agendamento_lavadores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoDiarioLavagem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_lavagem', models.DateField(verbose_name='Data da Lavagem')),
+                ('status', models.CharField(choices=[('EM_ANDAMENTO', 'Lavagem em Andamento'), ('CONCLUIDA', 'Lavagem Concluída'), ('CANCELADA', 'Cancelada')], max_length=20, verbose_name='Status')),
+                ('quantidade', models.PositiveIntegerField(default=0, verbose_name='Quantidade')),
+                ('faturamento', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Faturamento')),
+                ('duracao_total_segundos', models.BigIntegerField(default=0, verbose_name='Duração Total (segundos)')),
+                ('quantidade_com_duracao', models.PositiveIntegerField(default=0, verbose_name='Lavagens com Duração')),
+            ],
+            options={
+                'verbose_name': 'Resumo Diário de Lavagens',
+                'verbose_name_plural': 'Resumos Diários de Lavagens',
+                'ordering': ['data_lavagem'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='lavagem',
+            index=models.Index(fields=['data_lavagem'], name='lavagem_data_idx'),
+        ),
+        migrations.AddField(
+            model_name='resumodiariolavagem',
+            name='base',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumos_diarios', to='lavagens.base'),
+        ),
+        migrations.AddField(
+            model_name='resumodiariolavagem',
+            name='tipo_lavagem',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumos_diarios', to='lavagens.tipolavagem'),
+        ),
+        migrations.AddField(
+            model_name='resumodiariolavagem',
+            name='transporte_equipamento',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='resumos_diarios', to='lavagens.transporteequipamento'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='resumodiariolavagem',
+            unique_together={('data_lavagem', 'base', 'tipo_lavagem', 'transporte_equipamento', 'status')},
+        ),
+        migrations.RunPython(popular_resumos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:34
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lavagens', '0008_resumodiariolavagem'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaRelatorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('relatorio', 'Página de Relatórios'), ('relatorio_periodo', 'Relatório por Período (API)')], max_length=30, verbose_name='Tipo')),
+                ('parametros', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Parâmetros')),
+                ('chave', models.CharField(db_index=True, help_text='Identifica tarefas com os mesmos parâmetros', max_length=64, verbose_name='Chave')),
+                ('status', models.CharField(choices=[('PENDENTE', 'Pendente'), ('PROCESSANDO', 'Processando'), ('CONCLUIDA', 'Concluída'), ('ERRO', 'Erro')], default='PENDENTE', max_length=20, verbose_name='Status')),
+                ('resultado', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='Resultado')),
+                ('erro', models.TextField(blank=True, verbose_name='Erro')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criada em')),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True, verbose_name='Iniciada em')),
+                ('concluido_em', models.DateTimeField(blank=True, null=True, verbose_name='Concluída em')),
+                ('solicitado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tarefas_relatorio', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Tarefa de Relatório',
+                'verbose_name_plural': 'Tarefas de Relatório',
+                'ordering': ['-criado_em'],
+                'indexes': [models.Index(fields=['status', 'criado_em'], name='tarefa_status_criado_idx')],
+            },
+        ),
+    ]
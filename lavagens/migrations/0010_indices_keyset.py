@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0002_remove_cliente_cpf_cnpj_remove_cliente_endereco'),
+        ('lavagens', '0009_tarefarelatorio'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='lavagem',
+            name='lavagem_data_idx',
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['data_agendamento', 'hora_agendamento', 'id'], name='agendamento_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lavagem',
+            index=models.Index(fields=['-data_lavagem', '-hora_inicio', 'id'], name='lavagem_keyset_idx'),
+        ),
+    ]
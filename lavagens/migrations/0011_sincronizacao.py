@@ -0,0 +1,85 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0003_atualizado_em'),
+        ('lavagens', '0010_indices_keyset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroExclusao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(help_text='app_label.model_name', max_length=100, verbose_name='Modelo')),
+                ('objeto_id', models.BigIntegerField(verbose_name='ID do Objeto')),
+                ('excluido_em', models.DateTimeField(auto_now_add=True, verbose_name='Excluído em')),
+            ],
+            options={
+                'verbose_name': 'Registro de Exclusão',
+                'verbose_name_plural': 'Registros de Exclusão',
+            },
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='base',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='lavagem',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='materiallavagem',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='tipolavagem',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='transporteequipamento',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['atualizado_em', 'id'], name='agendamento_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='base',
+            index=models.Index(fields=['atualizado_em', 'id'], name='base_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lavagem',
+            index=models.Index(fields=['atualizado_em', 'id'], name='lavagem_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='materiallavagem',
+            index=models.Index(fields=['atualizado_em', 'id'], name='material_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tipolavagem',
+            index=models.Index(fields=['atualizado_em', 'id'], name='tipolavagem_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transporteequipamento',
+            index=models.Index(fields=['atualizado_em', 'id'], name='transporte_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroexclusao',
+            index=models.Index(fields=['excluido_em', 'id'], name='exclusao_sync_idx'),
+        ),
+    ]
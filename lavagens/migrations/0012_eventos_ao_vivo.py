@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lavagens', '0011_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoAoVivo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('lavagem', 'Lavagem'), ('agendamento', 'Agendamento')], max_length=20, verbose_name='Tipo')),
+                ('objeto_id', models.BigIntegerField(verbose_name='ID do Objeto')),
+                ('base_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID da Base')),
+                ('status', models.CharField(blank=True, max_length=20, verbose_name='Status')),
+                ('acao', models.CharField(choices=[('criado', 'Criado'), ('alterado', 'Alterado'), ('excluido', 'Excluído')], default='alterado', max_length=20, verbose_name='Ação')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+            ],
+            options={
+                'verbose_name': 'Evento ao Vivo',
+                'verbose_name_plural': 'Eventos ao Vivo',
+                'indexes': [models.Index(fields=['criado_em', 'id'], name='evento_ao_vivo_idx')],
+            },
+        ),
+    ]
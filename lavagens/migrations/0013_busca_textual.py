@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:20
+
+from django.db import migrations
+
+# tabela FTS5: (modelo, colunas de telefone)
+INDICES = {
+    'lavagens_busca_lavagem': ('Lavagem', ('c.telefone',)),
+    'lavagens_busca_agendamento': ('Agendamento', ('t.telefone_contato', 'c.telefone')),
+}
+TABELAS = tuple(INDICES)
+
+
+def _com_versao_compacta(coluna):
+    # Mesmo SQL de lavagens.busca no momento desta migração.
+    texto = compacto = f"COALESCE({coluna}, '')"
+    for simbolo in ('-', ' ', '.', '(', ')', '+', '/'):
+        compacto = f"REPLACE({compacto}, '{simbolo}', '')"
+    return f"{texto} || ' ' || {compacto}"
+
+
+def _select(apps, nome_modelo, colunas_telefone):
+    modelo = apps.get_model('lavagens', nome_modelo)
+    cliente = apps.get_model('clientes', 'Cliente')
+    lavador = apps.get_model('clientes', 'Lavador')
+    vinculo = modelo._meta.get_field('lavadores').remote_field.through._meta
+    coluna_vinculo = vinculo.get_field(modelo._meta.model_name).column
+    telefone = " || ' ' || ".join(_com_versao_compacta(coluna) for coluna in colunas_telefone)
+    lavadores = (
+        f"(SELECT GROUP_CONCAT(lv.nome, ' ') FROM {vinculo.db_table} v "
+        f"JOIN {lavador._meta.db_table} lv ON lv.id = v.lavador_id WHERE v.{coluna_vinculo} = t.id)"
+    )
+    return (
+        f"SELECT t.id, t.codigo, {_com_versao_compacta('t.placa_veiculo')}, "
+        f"COALESCE(c.nome, ''), {telefone}, COALESCE({lavadores}, '') "
+        f"FROM {modelo._meta.db_table} t LEFT JOIN {cliente._meta.db_table} c ON c.id = t.cliente_id"
+    )
+
+
+def criar_indices(apps, schema_editor):
+    # FTS5 é do SQLite; em outros bancos a busca continua por icontains.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for tabela, (nome_modelo, colunas_telefone) in INDICES.items():
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {tabela} USING fts5("
+            "codigo, placa, cliente, telefone, lavadores, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {tabela}(rowid, codigo, placa, cliente, telefone, lavadores) "
+            f"{_select(apps, nome_modelo, colunas_telefone)}"
+        )
+
+
+def remover_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for tabela in TABELAS:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {tabela}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0003_atualizado_em'),
+        ('lavagens', '0012_eventos_ao_vivo'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:40
+
+import re
+
+from django.db import migrations, models
+
+# Cópia de clientes.placas.normalizar_placa no momento desta migração.
+_PLACA_BRASILEIRA = re.compile(r'^([A-Z]{3}\d)([A-Z0-9])(\d{2})$')
+_SEPARADORES = re.compile(r'[^A-Z0-9]')
+_DIGITO_MERCOSUL = {letra: str(digito) for digito, letra in enumerate('ABCDEFGHIJ')}
+
+
+def normalizar_placa(texto):
+    placa = _SEPARADORES.sub('', (texto or '').upper())
+    partes = _PLACA_BRASILEIRA.match(placa)
+    if partes and partes.group(2) in _DIGITO_MERCOSUL:
+        return partes.group(1) + _DIGITO_MERCOSUL[partes.group(2)] + partes.group(3)
+    return placa
+
+
+def preencher_placas(apps, schema_editor):
+    for nome in ('Lavagem', 'Agendamento'):
+        modelo = apps.get_model('lavagens', nome)
+        ultimo_id = 0
+        while True:
+            linhas = list(modelo.objects.filter(id__gt=ultimo_id).order_by('id').only('id', 'placa_veiculo')[:2000])
+            if not linhas:
+                break
+            for linha in linhas:
+                linha.placa_normalizada = normalizar_placa(linha.placa_veiculo)
+            modelo.objects.bulk_update(linhas, ['placa_normalizada'])
+            ultimo_id = linhas[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientes', '0004_veiculo_placa_normalizada'),
+        ('lavagens', '0013_busca_textual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamento',
+            name='placa_normalizada',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=10, verbose_name='Placa Normalizada'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='lavagem',
+            name='placa_normalizada',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=10, verbose_name='Placa Normalizada'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(preencher_placas, migrations.RunPython.noop),
+    ]
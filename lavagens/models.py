@@ -1,6 +1,18 @@
-from django.db import models
+import random
+import string
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from clientes.models import Cliente, Veiculo, Lavador
+from clientes.placas import normalizar_placa
+
+
+def gerar_codigo_lavagem():
+    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
 
 
 class Lavagem(models.Model):
@@ -23,6 +35,8 @@ class Lavagem(models.Model):
     transporte_equipamento = models.ForeignKey('TransporteEquipamento', on_delete=models.PROTECT, related_name='lavagens_transporte', null=True, blank=True)
     lavadores = models.ManyToManyField(Lavador, related_name="lavagens", blank=True)
     placa_veiculo = models.CharField("Placa do Veículo", max_length=10)
+    # Forma canônica (clientes.placas), para buscar sem depender do formato digitado.
+    placa_normalizada = models.CharField("Placa Normalizada", max_length=10, db_index=True, editable=False)
     hora_inicio = models.DateTimeField("Hora de Início")
     hora_termino = models.DateTimeField("Hora de Término", null=True, blank=True)
     data_lavagem = models.DateField("Data da Lavagem")
@@ -33,25 +47,47 @@ class Lavagem(models.Model):
     observacoes = models.TextField("Observações", blank=True)
     recebimento = models.CharField("Recebimento", max_length=200, blank=True)
     contrato = models.CharField("Contrato", max_length=100, blank=True, help_text="Número ou código do contrato")
+    atualizado_em = models.DateTimeField("Atualizado em", auto_now=True)
 
     class Meta:
         verbose_name = "Lavagem"
         verbose_name_plural = "Lavagens"
         ordering = ["-data_lavagem", "-hora_inicio"]
+        indexes = [
+            # Ordenação da listagem e do keyset da API (lavagens.paginacao); também
+            # atende os filtros por data_lavagem.
+            models.Index(fields=["-data_lavagem", "-hora_inicio", "id"], name="lavagem_keyset_idx"),
+            # Sincronização incremental (lavagens.sincronizacao)
+            models.Index(fields=["atualizado_em", "id"], name="lavagem_sync_idx"),
+        ]
 
     def __str__(self):
         return f"{self.codigo} - {self.placa_veiculo} ({self.get_status_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Guarda a data carregada para atualizar também o resumo do dia antigo
+        # quando a lavagem muda de data.
+        instancia._data_lavagem_original = instancia.__dict__.get("data_lavagem")
+        # Status e base carregados: o feed ao vivo só publica quando mudam.
+        instancia._evento_original = (instancia.__dict__.get("status"), instancia.__dict__.get("base_id"))
+        return instancia
+
     def save(self, *args, **kwargs):
         if not self.codigo:
-            import random
-            import string
-            self.codigo = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
+            self.codigo = gerar_codigo_lavagem()
+        self.placa_normalizada = normalizar_placa(self.placa_veiculo)
 
         if self.valor_servico is not None:
             self.valor_final = self.valor_servico - (self.desconto or 0)
 
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            from .resumos import atualizar_resumo_dias
+            atualizar_resumo_dias({self.data_lavagem, getattr(self, "_data_lavagem_original", None)})
+            self._data_lavagem_original = self.data_lavagem
 
         # --- LÓGICA DE SINCRONIZAÇÃO DE STATUS COM O AGENDAMENTO ---
         # O 'hasattr' previne erros se a relação não existir por algum motivo.
@@ -116,29 +152,72 @@ class Lavagem(models.Model):
         self.save()
 
 
+@receiver(post_delete, sender=Lavagem)
+def _atualizar_resumo_apos_exclusao(sender, instance, **kwargs):
+    from .resumos import atualizar_resumo_dias
+    atualizar_resumo_dias({instance.data_lavagem})
+
+
+@receiver(post_save, sender=Lavagem)
+@receiver(post_delete, sender=Lavagem)
+def _registrar_alteracao_lavagem(sender, **kwargs):
+    from .condicional import AGENDAMENTOS, LAVAGENS, registrar_alteracao
+    # O detalhe do agendamento mostra o status da lavagem gerada por ele.
+    registrar_alteracao(LAVAGENS, AGENDAMENTOS)
+
+
+@receiver(m2m_changed, sender=Lavagem.lavadores.through)
+def _invalidar_relatorios_lavadores(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    from .condicional import LAVAGENS, registrar_alteracao
+    registrar_alteracao(LAVAGENS)
+    from .cache_relatorios import invalidar_catalogo, invalidar_dias
+    if not reverse:
+        invalidar_dias({instance.data_lavagem})
+    elif pk_set:
+        invalidar_dias(set(Lavagem.objects.filter(pk__in=pk_set).values_list("data_lavagem", flat=True)))
+    else:
+        invalidar_catalogo()
+
+
 from .agendamento_models import Agendamento
 
 
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+@receiver(m2m_changed, sender=Agendamento.lavadores.through)
+def _registrar_alteracao_agendamento(sender, action=None, **kwargs):
+    if action is not None and action not in ("post_add", "post_remove", "post_clear"):
+        return
+    from .condicional import AGENDAMENTOS, registrar_alteracao
+    registrar_alteracao(AGENDAMENTOS)
+
+
 
 
 
 class TipoLavagem(models.Model):
     nome = models.CharField(max_length=50, unique=True)
     preco_base = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+    atualizado_em = models.DateTimeField("Atualizado em", auto_now=True)
 
     class Meta:
         verbose_name = "Tipo de Lavagem"
         verbose_name_plural = "Tipos de Lavagem"
+        indexes = [models.Index(fields=["atualizado_em", "id"], name="tipolavagem_sync_idx")]
 
     def __str__(self):
         return self.nome
 
 class Base(models.Model):
     nome = models.CharField(max_length=100, unique=True)
+    atualizado_em = models.DateTimeField("Atualizado em", auto_now=True)
 
     class Meta:
         verbose_name = "Base"
         verbose_name_plural = "Bases"
+        indexes = [models.Index(fields=["atualizado_em", "id"], name="base_sync_idx")]
 
     def __str__(self):
         return self.nome
@@ -146,10 +225,12 @@ class Base(models.Model):
 class TransporteEquipamento(models.Model):
     nome = models.CharField(max_length=50, unique=True)
     multiplicador_preco = models.DecimalField(max_digits=5, decimal_places=2, default=1.00)
+    atualizado_em = models.DateTimeField("Atualizado em", auto_now=True)
 
     class Meta:
         verbose_name = "Transporte/Equipamento"
         verbose_name_plural = "Transportes/Equipamentos"
+        indexes = [models.Index(fields=["atualizado_em", "id"], name="transporte_sync_idx")]
 
     def __str__(self):
         return self.nome
@@ -162,10 +243,259 @@ class MaterialLavagem(models.Model):
     tipo_lavagem = models.ForeignKey(TipoLavagem, on_delete=models.CASCADE, related_name='materiais')
     nome = models.CharField(max_length=100)
     valor = models.DecimalField(max_digits=10, decimal_places=2)
+    atualizado_em = models.DateTimeField("Atualizado em", auto_now=True)
 
     class Meta:
         verbose_name = "Material da Lavagem"
         verbose_name_plural = "Materiais da Lavagem"
+        indexes = [models.Index(fields=["atualizado_em", "id"], name="material_sync_idx")]
 
     def __str__(self):
         return f"{self.nome} ({self.tipo_lavagem.nome})"
+
+
+class ResumoDiarioLavagem(models.Model):
+    """
+    Resumo diário das lavagens, agrupado por base, tipo, transporte e status.
+    Mantido por lavagens.resumos a cada gravação de Lavagem; os relatórios leem
+    daqui para que o custo cresça com o número de dias e não de lavagens.
+    """
+    data_lavagem = models.DateField("Data da Lavagem")
+    base = models.ForeignKey(Base, on_delete=models.CASCADE, related_name='resumos_diarios', null=True, blank=True)
+    tipo_lavagem = models.ForeignKey(TipoLavagem, on_delete=models.CASCADE, related_name='resumos_diarios', null=True, blank=True)
+    transporte_equipamento = models.ForeignKey(TransporteEquipamento, on_delete=models.CASCADE, related_name='resumos_diarios', null=True, blank=True)
+    status = models.CharField("Status", max_length=20, choices=Lavagem.STATUS_CHOICES)
+    quantidade = models.PositiveIntegerField("Quantidade", default=0)
+    faturamento = models.DecimalField("Faturamento", max_digits=14, decimal_places=2, default=0)
+    duracao_total_segundos = models.BigIntegerField("Duração Total (segundos)", default=0)
+    quantidade_com_duracao = models.PositiveIntegerField("Lavagens com Duração", default=0)
+
+    class Meta:
+        verbose_name = "Resumo Diário de Lavagens"
+        verbose_name_plural = "Resumos Diários de Lavagens"
+        ordering = ["data_lavagem"]
+        unique_together = [
+            ["data_lavagem", "base", "tipo_lavagem", "transporte_equipamento", "status"]
+        ]
+
+    def __str__(self):
+        return f"{self.data_lavagem} - {self.get_status_display()} ({self.quantidade})"
+
+
+@receiver(post_save, sender=Base)
+@receiver(post_delete, sender=Base)
+@receiver(post_save, sender=TipoLavagem)
+@receiver(post_delete, sender=TipoLavagem)
+@receiver(post_save, sender=TransporteEquipamento)
+@receiver(post_delete, sender=TransporteEquipamento)
+@receiver(post_save, sender=MaterialLavagem)
+@receiver(post_delete, sender=MaterialLavagem)
+@receiver(post_save, sender=Lavador)
+@receiver(post_delete, sender=Lavador)
+def _invalidar_relatorios_catalogo(sender, **kwargs):
+    # Nomes de bases, tipos, lavadores e valores de materiais aparecem nos relatórios.
+    from .cache_relatorios import invalidar_catalogo
+    invalidar_catalogo()
+    from .condicional import CATALOGO, registrar_alteracao
+    registrar_alteracao(CATALOGO)
+
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_save, sender=Veiculo)
+@receiver(post_delete, sender=Veiculo)
+def _registrar_alteracao_clientes(sender, **kwargs):
+    # Nomes de clientes e dados de veículos aparecem nas respostas da API.
+    from .condicional import CATALOGO, registrar_alteracao
+    registrar_alteracao(CATALOGO)
+
+
+class RegistroExclusao(models.Model):
+    """
+    Registro de exclusão ("tombstone") de uma linha dos modelos sincronizados
+    por /api/sync/ (lavagens.sincronizacao): diz aos clientes o que apagar.
+    Gravado pelo sinal post_delete abaixo e limpo por
+    `manage.py limpar_exclusoes` depois do prazo de retenção.
+    """
+    modelo = models.CharField("Modelo", max_length=100, help_text="app_label.model_name")
+    objeto_id = models.BigIntegerField("ID do Objeto")
+    excluido_em = models.DateTimeField("Excluído em", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Registro de Exclusão"
+        verbose_name_plural = "Registros de Exclusão"
+        indexes = [models.Index(fields=["excluido_em", "id"], name="exclusao_sync_idx")]
+
+    def __str__(self):
+        return f"{self.modelo} {self.objeto_id} ({self.excluido_em})"
+
+
+@receiver(post_delete, sender=Lavagem)
+@receiver(post_delete, sender=Agendamento)
+@receiver(post_delete, sender=Cliente)
+@receiver(post_delete, sender=Veiculo)
+@receiver(post_delete, sender=Lavador)
+@receiver(post_delete, sender=Base)
+@receiver(post_delete, sender=TipoLavagem)
+@receiver(post_delete, sender=TransporteEquipamento)
+@receiver(post_delete, sender=MaterialLavagem)
+def _registrar_exclusao(sender, instance, **kwargs):
+    RegistroExclusao.objects.create(modelo=sender._meta.label_lower, objeto_id=instance.pk)
+
+
+@receiver(m2m_changed, sender=Lavagem.lavadores.through)
+@receiver(m2m_changed, sender=Agendamento.lavadores.through)
+def _marcar_atualizado_lavadores(sender, instance, action, reverse, model, pk_set, **kwargs):
+    # Os ids dos lavadores fazem parte da linha sincronizada por /api/sync/.
+    agora = timezone.now()
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            type(instance).objects.filter(pk=instance.pk).update(atualizado_em=agora)
+    elif action in ("post_add", "post_remove") and pk_set:
+        model.objects.filter(pk__in=pk_set).update(atualizado_em=agora)
+    elif action == "pre_clear":
+        model.objects.filter(lavadores=instance).update(atualizado_em=agora)
+
+
+class EventoAoVivo(models.Model):
+    """
+    Registro de mudança de status de lavagens e agendamentos lido pelo feed
+    ao vivo (lavagens.ao_vivo) das telas abertas. Gravado pelos sinais abaixo
+    e pelas gravações em lote; limpo por `manage.py limpar_eventos`.
+    """
+    TIPO_CHOICES = [
+        ("lavagem", "Lavagem"),
+        ("agendamento", "Agendamento"),
+    ]
+
+    ACAO_CHOICES = [
+        ("criado", "Criado"),
+        ("alterado", "Alterado"),
+        ("excluido", "Excluído"),
+    ]
+
+    tipo = models.CharField("Tipo", max_length=20, choices=TIPO_CHOICES)
+    objeto_id = models.BigIntegerField("ID do Objeto")
+    base_id = models.BigIntegerField("ID da Base", null=True, blank=True)
+    status = models.CharField("Status", max_length=20, blank=True)
+    acao = models.CharField("Ação", max_length=20, choices=ACAO_CHOICES, default="alterado")
+    criado_em = models.DateTimeField("Criado em", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Evento ao Vivo"
+        verbose_name_plural = "Eventos ao Vivo"
+        indexes = [models.Index(fields=["criado_em", "id"], name="evento_ao_vivo_idx")]
+
+    def __str__(self):
+        return f"{self.tipo} {self.objeto_id} {self.acao} ({self.status})"
+
+
+@receiver(post_save, sender=Lavagem)
+@receiver(post_save, sender=Agendamento)
+def _registrar_evento_status(sender, instance, created, **kwargs):
+    atual = (instance.status, instance.base_id)
+    original = getattr(instance, "_evento_original", None)
+    instance._evento_original = atual
+    if created or atual != original:
+        from .ao_vivo import registrar_eventos
+        registrar_eventos(
+            sender._meta.model_name, [(instance.pk, instance.base_id, instance.status)],
+            "criado" if created else "alterado",
+        )
+
+
+@receiver(post_delete, sender=Lavagem)
+@receiver(post_delete, sender=Agendamento)
+def _registrar_evento_exclusao(sender, instance, **kwargs):
+    from .ao_vivo import registrar_eventos
+    registrar_eventos(sender._meta.model_name, [(instance.pk, instance.base_id, instance.status)], "excluido")
+
+
+@receiver(post_save, sender=Lavagem)
+@receiver(post_delete, sender=Lavagem)
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+def _indexar_busca(sender, instance, **kwargs):
+    from .busca import indexar
+    indexar(sender._meta.model_name, [instance.pk])
+
+
+@receiver(m2m_changed, sender=Lavagem.lavadores.through)
+@receiver(m2m_changed, sender=Agendamento.lavadores.through)
+def _indexar_busca_lavadores(sender, instance, action, reverse, model, pk_set, **kwargs):
+    # Os nomes dos lavadores fazem parte do índice de busca.
+    from .busca import indexar
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            indexar(type(instance)._meta.model_name, [instance.pk])
+    elif action in ("post_add", "post_remove") and pk_set:
+        indexar(model._meta.model_name, pk_set)
+    elif action == "pre_clear":
+        instance._busca_pendente = list(model.objects.filter(lavadores=instance).values_list("pk", flat=True))
+    elif action == "post_clear":
+        indexar(model._meta.model_name, getattr(instance, "_busca_pendente", []))
+
+
+@receiver(post_save, sender=Cliente)
+def _indexar_busca_cliente(sender, instance, created, **kwargs):
+    if created:
+        return
+    from .busca import indexar
+    indexar("lavagem", instance.lavagens.values_list("pk", flat=True))
+    indexar("agendamento", instance.agendamentos.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Lavador)
+def _indexar_busca_lavador(sender, instance, created, **kwargs):
+    if created:
+        return
+    from .busca import indexar
+    indexar("lavagem", instance.lavagens.values_list("pk", flat=True))
+    indexar("agendamento", instance.agendamentos.values_list("pk", flat=True))
+
+
+class TarefaRelatorio(models.Model):
+    """
+    Relatório pesado executado fora da requisição. A fila fica no próprio banco:
+    as tarefas são criadas pelas views/API e processadas pelo comando
+    `manage.py processar_tarefas`, que guarda o resultado em JSON.
+    """
+    STATUS_CHOICES = [
+        ("PENDENTE", "Pendente"),
+        ("PROCESSANDO", "Processando"),
+        ("CONCLUIDA", "Concluída"),
+        ("ERRO", "Erro"),
+    ]
+
+    TIPO_CHOICES = [
+        ("relatorio", "Página de Relatórios"),
+        ("relatorio_periodo", "Relatório por Período (API)"),
+    ]
+
+    tipo = models.CharField("Tipo", max_length=30, choices=TIPO_CHOICES)
+    parametros = models.JSONField("Parâmetros", default=dict, encoder=DjangoJSONEncoder)
+    chave = models.CharField("Chave", max_length=64, db_index=True, help_text="Identifica tarefas com os mesmos parâmetros")
+    status = models.CharField("Status", max_length=20, choices=STATUS_CHOICES, default="PENDENTE")
+    resultado = models.JSONField("Resultado", null=True, blank=True, encoder=DjangoJSONEncoder)
+    erro = models.TextField("Erro", blank=True)
+    solicitado_por = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="tarefas_relatorio"
+    )
+    criado_em = models.DateTimeField("Criada em", auto_now_add=True)
+    iniciado_em = models.DateTimeField("Iniciada em", null=True, blank=True)
+    concluido_em = models.DateTimeField("Concluída em", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Tarefa de Relatório"
+        verbose_name_plural = "Tarefas de Relatório"
+        ordering = ["-criado_em"]
+        indexes = [
+            models.Index(fields=["status", "criado_em"], name="tarefa_status_criado_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def finalizada(self):
+        return self.status in ("CONCLUIDA", "ERRO")
@@ -0,0 +1,324 @@
+"""
+Paginação da API.
+
+Por padrão as listagens continuam paginadas por número de página. Com
+?paginacao=cursor (ou ao seguir o link `next` que traz ?cursor=...) a
+listagem passa a ser por keyset: o cursor guarda os valores da última linha
+na ordenação da view e a próxima página é filtrada a partir deles, sem
+COUNT(*) nem OFFSET. Cada página custa o mesmo, seja a primeira ou a
+milésima, o que permite a clientes de sincronização percorrer a tabela toda.
+
+A ordenação do keyset precisa terminar em um campo único (id) e ter um
+índice composto correspondente no modelo.
+
+PaginadorComTotal serve às telas que já contam as linhas em uma consulta
+agregada e não precisam de um COUNT(*) por seção paginada.
+
+PaginadorContagemCacheada serve às listas HTML filtradas, que faziam um
+COUNT(*) exato (às vezes sobre join e distinct) a cada requisição só para
+desenhar "Página X de Y":
+
+- a contagem fica no cache, com a chave formada pelo SQL do filtro e pelas
+  marcas de alteração das tabelas (lavagens.condicional): qualquer gravação
+  nelas invalida todas as contagens de uma vez, sem apagar nada;
+- a contagem para em PAGINACAO_LIMITE_CONTAGEM linhas (COUNT sobre um
+  LIMIT). Acima disso a lista mostra uma estimativa do planejador
+  (PostgreSQL) ou, onde não há estimativa ou com
+  PAGINACAO_ACIMA_DO_LIMITE = "sem_total", só "Anterior / Próxima";
+- nesses dois modos cada página lê uma linha a mais para saber se existe a
+  próxima, e o número da página não é limitado pelo total.
+"""
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .condicional import marcas_alteracao
+
+LIMITE_CONTAGEM_PADRAO = 5000
+ACIMA_DO_LIMITE_PADRAO = "estimativa"  # ou "sem_total"
+TTL_CONTAGEM = 60 * 60  # segundos; a chave já muda quando os dados mudam
+
+# Modos da contagem de PaginadorContagemCacheada
+EXATA = "exata"
+ESTIMADA = "estimada"
+SEM_TOTAL = "sem_total"
+
+
+def _campos_ordenacao(ordering):
+    return [(campo.lstrip("-"), campo.startswith("-")) for campo in ordering]
+
+
+def filtro_apos(ordering, valores):
+    """
+    Linhas depois de `valores` na ordenação `ordering`:
+    (a > a0) OU (a = a0 E b > b0) OU ..., com < no lugar de > para os campos
+    em ordem decrescente.
+    """
+    campos = _campos_ordenacao(ordering)
+    filtro = Q()
+    iguais = {}
+    for (nome, decrescente), valor in zip(campos, valores):
+        filtro |= Q(**iguais, **{f"{nome}__{'lt' if decrescente else 'gt'}": valor})
+        iguais[nome] = valor
+    # Limite redundante no primeiro campo: deixa o banco posicionar o índice
+    # composto no cursor em vez de percorrê-lo desde o início.
+    nome, decrescente = campos[0]
+    return Q(**{f"{nome}__{'lte' if decrescente else 'gte'}": valores[0]}) & filtro
+
+
+class PaginacaoKeyset(BasePagination):
+    """Paginação por keyset sobre `ordering` (apenas para frente)."""
+
+    ordering = ()
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 500
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    mensagem_cursor_invalido = "Cursor inválido."
+
+    def get_page_size(self, request):
+        try:
+            tamanho = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(tamanho, 1), self.max_page_size)
+
+    def _campos(self):
+        return _campos_ordenacao(self.ordering)
+
+    def codificar_cursor(self, instancia):
+        valores = [
+            instancia._meta.get_field(nome).value_to_string(instancia) for nome, _ in self._campos()
+        ]
+        return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+    def decodificar_cursor(self, cursor, modelo):
+        try:
+            valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            campos = self._campos()
+            if len(valores) != len(campos):
+                raise ValueError
+            return [
+                modelo._meta.get_field(nome).to_python(valor)
+                for (nome, _), valor in zip(campos, valores)
+            ]
+        except (TypeError, ValueError, ValidationError) as erro:
+            raise NotFound(self.mensagem_cursor_invalido) from erro
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        tamanho = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(filtro_apos(self.ordering, self.decodificar_cursor(cursor, queryset.model)))
+
+        # Uma linha a mais indica se existe próxima página, sem COUNT(*).
+        itens = list(queryset[:tamanho + 1])
+        self.proximo_cursor = self.codificar_cursor(itens[tamanho - 1]) if len(itens) > tamanho else None
+        return itens[:tamanho]
+
+    def get_next_link(self):
+        if self.proximo_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.proximo_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class PaginacaoPaginaOuCursor(PageNumberPagination):
+    """
+    Paginação por número de página, ou por keyset (PaginacaoKeyset com a
+    `ordering_cursor` da subclasse) com ?paginacao=cursor ou ?cursor=.
+    Em modo cursor o parâmetro ?ordering= é ignorado.
+    """
+
+    ordering_cursor = ()
+    modo_query_param = "paginacao"
+
+    def usa_cursor(self, request):
+        return (
+            request.query_params.get(self.modo_query_param) == "cursor"
+            or PaginacaoKeyset.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.usa_cursor(request):
+            self.keyset = None
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = PaginacaoKeyset()
+        self.keyset.ordering = self.ordering_cursor
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        return self.keyset.get_paginated_response(data)
+
+
+class PaginacaoLavagens(PaginacaoPaginaOuCursor):
+    ordering_cursor = ("-data_lavagem", "-hora_inicio", "id")
+
+
+class PaginacaoAgendamentos(PaginacaoPaginaOuCursor):
+    ordering_cursor = ("data_agendamento", "hora_agendamento", "id")
+
+
+class PaginadorComTotal(Paginator):
+    """Paginator do Django com o total informado, em vez de object_list.count()."""
+
+    def __init__(self, object_list, per_page, total, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = total
+
+
+def assinatura_consulta(queryset):
+    """Hash do SQL e dos parâmetros do filtro de `queryset` (sem a ordenação)."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    return hashlib.md5(repr((sql, params)).encode()).hexdigest()
+
+
+def contagem_em_cache(queryset, tabelas, calcular=None):
+    """
+    Resultado de `calcular()` (por padrão queryset.count()) guardado pelo
+    filtro de `queryset` e pelas marcas de alteração de `tabelas`. As marcas
+    são lidas antes de contar: uma gravação no meio da contagem só deixa o
+    valor numa chave que ninguém mais vai pedir.
+    """
+    marcas = marcas_alteracao(tabelas)
+    chave = f"paginacao:contagem:{assinatura_consulta(queryset)}:{'-'.join(map(str, marcas))}"
+    valor = cache.get(chave)
+    if valor is None:
+        valor = calcular() if calcular is not None else queryset.count()
+        cache.set(chave, valor, timeout=TTL_CONTAGEM)
+    return valor
+
+
+def estimar_contagem(queryset):
+    """Linhas estimadas pelo planejador, ou None onde o banco não estima (SQLite)."""
+    if connections[queryset.db].vendor != "postgresql":
+        return None
+    plano = json.loads(queryset.order_by().explain(format="json"))
+    return int(plano[0]["Plan"]["Plan Rows"])
+
+
+class PaginaSemTotal(Page):
+    """Página que sabe se há uma próxima pela linha a mais lida, não pelo total."""
+
+    def __init__(self, object_list, number, paginator, tem_proxima):
+        super().__init__(object_list, number, paginator)
+        self.tem_proxima = tem_proxima
+
+    def has_next(self):
+        return self.tem_proxima
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+
+class PaginadorContagemCacheada(Paginator):
+    """
+    Paginator do Django com a contagem no cache e limitada (ver o docstring
+    do módulo). `tabelas` são as marcas de lavagens.condicional que invalidam
+    a contagem. `modo` diz como o total foi obtido: EXATA, ESTIMADA (count e
+    num_pages aproximados) ou SEM_TOTAL (count e num_pages None).
+    """
+
+    def __init__(self, object_list, per_page, tabelas, limite=None, acima_do_limite=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.tabelas = tabelas
+        self.limite = limite or getattr(settings, "PAGINACAO_LIMITE_CONTAGEM", LIMITE_CONTAGEM_PADRAO)
+        self.acima_do_limite = acima_do_limite or getattr(
+            settings, "PAGINACAO_ACIMA_DO_LIMITE", ACIMA_DO_LIMITE_PADRAO
+        )
+
+    def _contar(self):
+        # COUNT sobre um LIMIT: o banco para de contar em limite + 1 linhas.
+        contadas = self.object_list[:self.limite + 1].count()
+        if contadas <= self.limite:
+            return contadas, EXATA
+        if self.acima_do_limite == "estimativa":
+            estimativa = estimar_contagem(self.object_list)
+            if estimativa is not None:
+                return max(estimativa, contadas), ESTIMADA
+        return None, SEM_TOTAL
+
+    @cached_property
+    def _contagem(self):
+        return contagem_em_cache(self.object_list, self.tabelas, self._contar)
+
+    @property
+    def modo(self):
+        return self._contagem[1]
+
+    @property
+    def contagem_exata(self):
+        return self.modo == EXATA
+
+    @cached_property
+    def count(self):
+        return self._contagem[0]
+
+    @cached_property
+    def num_pages(self):
+        if self.modo == SEM_TOTAL:
+            return None
+        return super().num_pages
+
+    def validate_number(self, number):
+        if self.contagem_exata:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def page(self, number):
+        if self.contagem_exata:
+            return super().page(number)
+        number = self.validate_number(number)
+        inicio = (number - 1) * self.per_page
+        itens = list(self.object_list[inicio:inicio + self.per_page + 1])
+        if not itens and number > 1:
+            raise EmptyPage(self.error_messages["no_results"])
+        return PaginaSemTotal(itens[:self.per_page], number, self, len(itens) > self.per_page)
+
+    def get_page(self, number):
+        if self.contagem_exata:
+            return super().get_page(number)
+        try:
+            return self.page(number)
+        except (PageNotAnInteger, EmptyPage):
+            # Sem total não há "última página" para onde voltar.
+            return self.page(1)
@@ -0,0 +1,300 @@
+"""
+Cálculo dos dados da página de relatórios.
+
+Separado da view para que o mesmo resultado possa ser guardado em cache
+(lavagens.cache_relatorios) e reutilizado pela API.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .cache_relatorios import obter_ou_calcular
+from .duracoes import analise_duracoes
+from .models import Lavagem, MaterialLavagem
+from .estatisticas import STATUS_LAVAGEM, contadores_resumo, por_status
+from .resumos import resumos_periodo
+
+# Até 62 dias o gráfico é diário; até um ano, semanal; acima disso, mensal.
+SERIE_DIARIA_MAX_DIAS = 62
+SERIE_SEMANAL_MAX_DIAS = 366
+
+
+def _serie_faturamento(resumos, data_inicio, data_fim):
+    """
+    Monta os labels e valores do gráfico de faturamento com uma única consulta
+    agrupada por data_lavagem. Os dias sem faturamento são preenchidos com zero
+    e a granularidade (dia, semana ou mês) é escolhida pelo tamanho do período.
+    """
+    faturamento_por_dia = {
+        item["data_lavagem"]: item["total"] or 0
+        for item in resumos.filter(status="CONCLUIDA")
+        .values("data_lavagem")
+        .annotate(total=Sum("faturamento"))
+        .order_by()
+    }
+
+    total_dias = (data_fim - data_inicio).days + 1
+    if total_dias <= SERIE_DIARIA_MAX_DIAS:
+        def chave(dia):
+            return dia
+        formato = "%d/%m"
+    elif total_dias <= SERIE_SEMANAL_MAX_DIAS:
+        def chave(dia):
+            return max(dia - timedelta(days=dia.weekday()), data_inicio)
+        formato = "%d/%m"
+    else:
+        def chave(dia):
+            return max(dia.replace(day=1), data_inicio)
+        formato = "%m/%Y"
+
+    serie = {}
+    for i in range(max(total_dias, 0)):
+        dia = data_inicio + timedelta(days=i)
+        bucket = chave(dia)
+        serie[bucket] = serie.get(bucket, 0) + faturamento_por_dia.get(dia, 0)
+
+    labels = [bucket.strftime(formato) for bucket in serie]
+    dados = [float(valor) for valor in serie.values()]
+    return labels, dados
+
+
+def consumo_materiais(data_inicio, data_fim, base_id=None, por_mes=False):
+    """
+    Soma o valor dos materiais consumidos pelas lavagens concluídas no período.
+
+    Cada material entra uma vez por lavagem concluída do seu tipo; em vez de
+    percorrer as lavagens, o valor é multiplicado pela quantidade do resumo
+    diário em uma única consulta agrupada. Retorna {nome: total} ou, com
+    por_mes=True, {"AAAA-MM": {nome: total}}.
+    """
+    filtros = {
+        "tipo_lavagem__resumos_diarios__status": "CONCLUIDA",
+        "tipo_lavagem__resumos_diarios__data_lavagem__range": [data_inicio, data_fim],
+    }
+    if base_id:
+        filtros["tipo_lavagem__resumos_diarios__base_id"] = base_id
+
+    campos = ["nome"]
+    materiais = MaterialLavagem.objects.filter(**filtros)
+    if por_mes:
+        materiais = materiais.annotate(mes=TruncMonth("tipo_lavagem__resumos_diarios__data_lavagem"))
+        campos.insert(0, "mes")
+
+    linhas = materiais.values(*campos).annotate(
+        total=Sum(
+            F("valor") * F("tipo_lavagem__resumos_diarios__quantidade"),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+    ).order_by(*campos)
+
+    if not por_mes:
+        return {linha["nome"]: linha["total"] for linha in linhas}
+
+    consumo = {}
+    for linha in linhas:
+        consumo.setdefault(linha["mes"].strftime("%Y-%m"), {})[linha["nome"]] = linha["total"]
+    return consumo
+
+
+def calcular_relatorio(data_inicio, data_fim, base_id=None):
+    """Calcula todos os números e séries da página de relatórios para o período."""
+    # Filtrar lavagens pelo período
+    lavagens_periodo = Lavagem.objects.filter(
+        data_lavagem__range=[data_inicio, data_fim]
+    )
+
+    # Aplicar filtro de base, se houver
+    if base_id:
+        lavagens_periodo = lavagens_periodo.filter(base_id=base_id)
+
+    # Contagens, faturamento e durações vêm do resumo diário (ResumoDiarioLavagem)
+    resumos = resumos_periodo(data_inicio, data_fim, base_id)
+
+    # --- Cálculos de Estatísticas ---
+    totais = contadores_resumo(resumos)
+    lavagens_concluidas = totais["concluidas"]
+    faturamento_mes = totais["faturamento_periodo"]
+
+    # --- Dados para o Gráfico de Lavagens por Base ---
+    lavagens_por_base_query = (
+        resumos
+        .filter(base__isnull=False) # Garante que só bases válidas sejam contadas
+        .values('base__nome')
+        .annotate(total=Sum('quantidade'))
+        .order_by('-total')
+    )
+
+    # --- Dados para o Gráfico de Lavagens por Tipo ---
+    lavagens_por_tipo_query = (
+        resumos
+        .filter(tipo_lavagem__isnull=False) # Garante que só tipos válidos sejam contados
+        .values('tipo_lavagem__nome')
+        .annotate(total=Sum('quantidade'))
+        .order_by('-total')
+    )
+
+    # --- Dados para o Gráfico de Faturamento por Período (Linha) ---
+    faturamento_labels, faturamento_dados = _serie_faturamento(resumos, data_inicio, data_fim)
+
+    # --- Ticket Médio ---
+    ticket_medio = 0
+    if lavagens_concluidas > 0:
+        ticket_medio = faturamento_mes / lavagens_concluidas
+
+    # --- Performance dos Lavadores ---
+    performance_lavadores = lavagens_periodo.filter(status="CONCLUIDA", lavadores__isnull=False)\
+        .values("lavadores__nome")\
+        .annotate(total_lavagens_concluidas=Count("id"))\
+        .order_by("-total_lavagens_concluidas")
+
+    # --- Ranking de Carros/Contratos ---
+    ranking_carros_contratos = list(
+        lavagens_periodo.filter(status="CONCLUIDA")
+        .values("placa_veiculo", "contrato")
+        .annotate(total_lavagens=Count("id"))
+        .order_by("-total_lavagens")[:10] # Top 10
+    )
+
+    # --- Consumo de Materiais ---
+    materiais = consumo_materiais(data_inicio, data_fim, base_id)
+
+    # --- Lavagens por Contrato ---
+    lavagens_por_contrato = lavagens_periodo.filter(status="CONCLUIDA", contrato__isnull=False)\
+        .values("contrato")\
+        .annotate(total_lavagens=Count("id"))\
+        .order_by("-total_lavagens")
+
+    # --- Percentis e histograma de duração ---
+    duracoes = analise_duracoes(lavagens_periodo)
+
+    # --- Lavagens por Transporte/Equipamento ---
+    lavagens_por_transporte = resumos.filter(status="CONCLUIDA", transporte_equipamento__isnull=False)\
+        .values("transporte_equipamento__nome")\
+        .annotate(total_lavagens=Sum("quantidade"))\
+        .order_by("-total_lavagens")
+
+    return {
+        "estatisticas": {
+            "total_lavagens": totais["total"],
+            "lavagens_em_andamento": totais["em_andamento"],
+            "lavagens_concluidas": lavagens_concluidas,
+            "lavagens_canceladas": totais["canceladas"],
+            "faturamento_mes": faturamento_mes,
+            # Tempo médio de lavagem (apenas para lavagens concluídas com hora de início e término)
+            "tempo_medio_lavagem": totais["tempo_medio_minutos"],
+            "lavagens_por_base": {item['base__nome']: item['total'] for item in lavagens_por_base_query},
+            "lavagens_por_tipo": {item['tipo_lavagem__nome']: item['total'] for item in lavagens_por_tipo_query},
+        },
+        "ticket_medio": ticket_medio,
+        "faturamento_labels": faturamento_labels,
+        "faturamento_dados": faturamento_dados,
+        "lavadores_labels": [item['lavadores__nome'] for item in performance_lavadores],
+        "lavadores_dados": [item['total_lavagens_concluidas'] for item in performance_lavadores],
+        "ranking_carros_contratos": ranking_carros_contratos,
+        "ranking_labels": [f"{item['placa_veiculo']} ({item['contrato'] if item['contrato'] else 'N/A'})" for item in ranking_carros_contratos],
+        "ranking_dados": [item['total_lavagens'] for item in ranking_carros_contratos],
+        "materiais_labels": list(materiais.keys()),
+        "materiais_dados": [float(value) for value in materiais.values()],
+        "contrato_labels": [item["contrato"] for item in lavagens_por_contrato],
+        "contrato_dados": [item["total_lavagens"] for item in lavagens_por_contrato],
+        "transporte_labels": [item["transporte_equipamento__nome"] for item in lavagens_por_transporte],
+        "transporte_dados": [item["total_lavagens"] for item in lavagens_por_transporte],
+        "duracoes": duracoes,
+    }
+
+
+def relatorio_periodo(data_inicio, data_fim, base_id=None, apenas_cache=False):
+    """Versão em cache de calcular_relatorio (None se apenas_cache e não houver cache)."""
+    return obter_ou_calcular(
+        "relatorio",
+        {"base_id": base_id or None},
+        data_inicio,
+        data_fim,
+        lambda: calcular_relatorio(data_inicio, data_fim, base_id),
+        apenas_cache=apenas_cache,
+    )
+
+
+def consumo_materiais_periodo(data_inicio, data_fim, base_id=None):
+    """Consumo de materiais do período, total e por mês, em cache."""
+    def calcular():
+        return {
+            "total": consumo_materiais(data_inicio, data_fim, base_id),
+            "por_mes": consumo_materiais(data_inicio, data_fim, base_id, por_mes=True),
+        }
+
+    return obter_ou_calcular(
+        "consumo_materiais", {"base_id": base_id or None}, data_inicio, data_fim, calcular
+    )
+
+
+def duracoes_periodo(data_inicio, data_fim, base_id=None):
+    """Percentis e histogramas de duração das lavagens do período, em cache."""
+    def calcular():
+        lavagens = Lavagem.objects.filter(data_lavagem__range=[data_inicio, data_fim])
+        if base_id:
+            lavagens = lavagens.filter(base_id=base_id)
+        return analise_duracoes(lavagens)
+
+    return obter_ou_calcular(
+        "duracoes", {"base_id": base_id or None}, data_inicio, data_fim, calcular
+    )
+
+
+def faturamento_do_dia(dia):
+    """Faturamento das lavagens concluídas no dia, em cache."""
+    def calcular():
+        return contadores_resumo(resumos_periodo(dia, dia))["faturamento_periodo"]
+
+    return obter_ou_calcular("faturamento_dia", {}, dia, dia, calcular)
+
+
+def calcular_estatisticas_gerais(hoje):
+    """Contadores gerais, faturamento do mês/dia e tempo médio para a API."""
+    totais = contadores_resumo(resumos_periodo(), hoje)
+
+    return {
+        'total_lavagens': totais['total'],
+        'lavagens_em_andamento': totais['em_andamento'],
+        'lavagens_concluidas': totais['concluidas'],
+        'lavagens_canceladas': totais['canceladas'],
+        'faturamento_mes': totais['faturamento_mes'],
+        'faturamento_dia': totais['faturamento_dia'],
+        'tempo_medio_lavagem': totais['tempo_medio_minutos'],
+        'lavagens_por_status': por_status(totais, STATUS_LAVAGEM),
+    }
+
+
+def estatisticas_gerais(hoje):
+    """Versão em cache de calcular_estatisticas_gerais."""
+    return obter_ou_calcular(
+        "estatisticas",
+        {"hoje": hoje},
+        None,
+        None,
+        lambda: calcular_estatisticas_gerais(hoje),
+    )
+
+
+def calcular_relatorio_periodo_api(data_inicio, data_fim):
+    """Totais e lista de lavagens do período, no formato de /api/lavagens/relatorio_periodo/."""
+    from .serializers import LavagemListSerializer, otimizar_queryset_lavagens
+
+    lavagens = otimizar_queryset_lavagens(
+        Lavagem.objects.filter(data_lavagem__range=[data_inicio, data_fim])
+    )
+
+    totais = contadores_resumo(resumos_periodo(data_inicio, data_fim))
+    serializer = LavagemListSerializer(lavagens, many=True)
+
+    return {
+        'periodo': {
+            'data_inicio': data_inicio,
+            'data_fim': data_fim,
+            'total_lavagens': totais['total'],
+            'lavagens_concluidas': totais['concluidas'],
+            'faturamento_total': totais['faturamento_periodo'],
+        },
+        'lavagens': serializer.data,
+    }
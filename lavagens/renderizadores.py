@@ -0,0 +1,83 @@
+"""
+Renderizadores da API.
+
+Nas listagens grandes a serialização para JSON pesa mais que as consultas.
+JSONRapidoRenderer gera com orjson o JSON do JSONRenderer do DRF e volta
+para o json da biblioteca padrão quando o orjson não está instalado ou não
+consegue codificar o valor (inteiros acima de 64 bits, por exemplo).
+
+A saída é byte a byte a mesma, exceto em floats que o json padrão escreve
+de outro jeito:
+
+- notação exponencial: 1e20 e 1e-7 no orjson, 1e+20 e 1e-07 no json padrão
+  (mesmo valor para qualquer parser);
+- NaN e infinito: o orjson escreve null, o DRF (STRICT_JSON) levanta
+  ValueError.
+
+Detectar esses casos custa mais que a própria codificação pelo orjson
+(percorrer a resposta em Python ou procurar o expoente nos bytes), e a API
+não gera esses valores: durações e valores são arredondados e finitos.
+
+MessagePackRenderer responde em application/msgpack quando o cliente pede
+esse formato no Accept (ou ?format=msgpack). O pacote msgpack é opcional; o
+settings só inclui o renderizador se ele estiver instalado.
+
+Tipos que os dois codificadores não conhecem (datas vindas de fora de um
+serializer, Decimal, UUID, textos traduzíveis...) passam pelo mesmo
+conversor do JSONEncoder do DRF, então o resultado não muda com o formato.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depende do ambiente
+    msgpack = None
+
+_converter = JSONEncoder().default
+
+# O JSONRenderer do DRF escapa os separadores de linha U+2028/U+2029 para o
+# JSON continuar válido dentro de <script>; aqui o mesmo, direto nos bytes.
+_ESCAPES = ((b"\xe2\x80\xa8", b"\\u2028"), (b"\xe2\x80\xa9", b"\\u2029"))
+
+
+class JSONRapidoRenderer(JSONRenderer):
+    """JSONRenderer com orjson; indentação pedida no Accept usa o caminho padrão."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # Datas passam pelo conversor do DRF (milissegundos, "Z" para UTC).
+            ret = orjson.dumps(
+                data,
+                default=_converter,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        for original, escapado in _ESCAPES:
+            if original in ret:
+                ret = ret.replace(original, escapado)
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if msgpack is None:
+            raise RuntimeError("MessagePackRenderer exige o pacote msgpack.")
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_converter, datetime=False)
@@ -0,0 +1,140 @@
+"""
+Várias chamadas da API em uma requisição (POST /api/batch/).
+
+Os tablets de campo pagam ~300 ms por ida e volta; abrir a tela de uma
+lavagem pedia catálogos, a busca do veículo, agendamentos e lavadores em
+chamadas separadas. Aqui cada subrequisição é despachada direto para a view
+resolvida pela URL, na mesma thread e portanto na mesma conexão com o banco,
+e as respostas voltam juntas, na ordem recebida.
+
+- só URLs em /api/ são aceitas, e /api/batch/ não pode chamar a si mesma;
+- a subrequisição herda usuário, sessão e cabeçalhos da requisição externa,
+  então autenticação, permissões e CSRF valem como em uma chamada direta;
+- com "transacao": true tudo roda em uma transação; na primeira resposta com
+  status >= 400 o lote para, nada é gravado e as subrequisições restantes
+  voltam com 424;
+- respostas em fluxo (exportações, .ics) não são aceitas;
+- uma exceção na view vira um 500 só naquela subrequisição (e é registrada
+  no log), sem derrubar o lote.
+"""
+import json
+import logging
+from contextlib import nullcontext
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import Http404
+from django.middleware.csrf import CsrfViewMiddleware
+from django.urls import Resolver404, resolve, reverse
+
+LIMITE_REQUISICOES = 20
+PREFIXO_API = "/api/"
+METODOS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalhos da requisição externa que não fazem sentido em cada subrequisição.
+_CABECALHOS_DESCARTADOS = (
+    "HTTP_IF_NONE_MATCH", "HTTP_IF_MODIFIED_SINCE", "HTTP_ACCEPT_ENCODING",
+    "CONTENT_TYPE", "CONTENT_LENGTH",
+)
+
+_csrf = CsrfViewMiddleware(lambda request: None)
+
+
+def _erro(status, mensagem):
+    return {"status": status, "corpo": {"error": mensagem}}
+
+
+def _subrequisicao(request, metodo, caminho, query, corpo):
+    ambiente = {
+        chave: valor for chave, valor in request.META.items()
+        if chave not in _CABECALHOS_DESCARTADOS
+    }
+    dados = b"" if corpo is None else json.dumps(corpo, cls=DjangoJSONEncoder).encode()
+    ambiente.update({
+        "REQUEST_METHOD": metodo,
+        "PATH_INFO": caminho,
+        "QUERY_STRING": query,
+        "HTTP_ACCEPT": "application/json",
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(dados)),
+        "wsgi.input": BytesIO(dados),
+    })
+    sub = WSGIRequest(ambiente)
+    sub.user = request.user
+    # Marca dos testes (Client sem checagem de CSRF), repassada como veio.
+    sub._dont_enforce_csrf_checks = getattr(request, "_dont_enforce_csrf_checks", False)
+    if hasattr(request, "session"):
+        sub.session = request.session
+    return sub
+
+
+def _corpo(resposta):
+    if not resposta.content:
+        return None
+    if resposta.get("Content-Type", "").startswith("application/json"):
+        return json.loads(resposta.content)
+    return resposta.content.decode(resposta.charset or "utf-8", errors="replace")
+
+
+def _executar(request, item):
+    metodo = item["metodo"]
+    url = urlsplit(item["url"])
+    caminho = url.path
+    if not caminho.startswith(PREFIXO_API):
+        return _erro(400, f"Só URLs em {PREFIXO_API} podem ser agrupadas.")
+    if caminho == reverse("requisicoes_agrupadas"):
+        return _erro(400, "Uma requisição agrupada não pode conter outra.")
+    try:
+        rota = resolve(caminho)
+    except Resolver404:
+        return _erro(404, "URL não encontrada.")
+
+    sub = _subrequisicao(request, metodo, caminho, url.query, item.get("corpo"))
+    try:
+        resposta = None
+        if not getattr(rota.func, "csrf_exempt", False):
+            # O middleware de CSRF não passa pelas subrequisições.
+            _csrf.process_request(sub)
+            resposta = _csrf.process_view(sub, rota.func, rota.args, rota.kwargs)
+        if resposta is None:
+            resposta = rota.func(sub, *rota.args, **rota.kwargs)
+        if resposta.streaming:
+            return _erro(400, "Respostas em fluxo não podem ser agrupadas.")
+        if hasattr(resposta, "render") and not resposta.is_rendered:
+            resposta.render()
+        return {"status": resposta.status_code, "corpo": _corpo(resposta)}
+    except Http404:
+        return _erro(404, "Não encontrado.")
+    except PermissionDenied:
+        return _erro(403, "Permissão negada.")
+    except Exception:
+        # Uma subrequisição com erro não derruba o lote: vira um 500 na
+        # posição dela (e, com "transacao", reverte o lote como qualquer >= 400).
+        logger.exception("Falha na subrequisição %s %s do lote", metodo, item["url"])
+        return _erro(500, "Erro interno.")
+
+
+def executar_requisicoes(request, itens, transacao=False):
+    """
+    Executa as subrequisições (dados validados por RequisicoesAgrupadasSerializer)
+    em ordem. Retorna (respostas, revertida).
+    """
+    respostas = []
+    revertida = False
+    with transaction.atomic() if transacao else nullcontext():
+        for indice, item in enumerate(itens):
+            if revertida:
+                resposta = _erro(424, "Não executada: a transação do lote foi revertida.")
+            else:
+                resposta = _executar(request, item)
+                if transacao and resposta["status"] >= 400:
+                    transaction.set_rollback(True)
+                    revertida = True
+            respostas.append({"id": item.get("id", indice), **resposta})
+    return respostas, revertida
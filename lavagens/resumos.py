@@ -0,0 +1,98 @@
+"""
+Manutenção e consulta do resumo diário de lavagens (ResumoDiarioLavagem).
+
+O resumo é recalculado por dia: sempre que uma lavagem é gravada ou excluída,
+as linhas dos dias afetados são refeitas a partir das lavagens daquele dia,
+dentro da mesma transação. Assim o resumo nunca acumula erro, mesmo quando a
+lavagem muda de base, tipo, status ou data.
+"""
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+
+from .cache_relatorios import invalidar_dias
+
+CAMPOS_CHAVE = ("data_lavagem", "base_id", "tipo_lavagem_id", "transporte_equipamento_id", "status")
+
+# Apenas lavagens concluídas com início e término entram na duração.
+_FILTRO_DURACAO = Q(status="CONCLUIDA", hora_inicio__isnull=False, hora_termino__isnull=False)
+
+
+def _agregados_por_chave(lavagens):
+    return lavagens.order_by().values(*CAMPOS_CHAVE).annotate(
+        total=Count("id"),
+        soma_valor=Sum("valor_final"),
+        soma_duracao=Sum(
+            ExpressionWrapper(F("hora_termino") - F("hora_inicio"), output_field=DurationField()),
+            filter=_FILTRO_DURACAO,
+        ),
+        total_com_duracao=Count("id", filter=_FILTRO_DURACAO),
+    )
+
+
+def _montar_resumos(linhas):
+    from .models import ResumoDiarioLavagem
+
+    for linha in linhas:
+        duracao = linha["soma_duracao"]
+        yield ResumoDiarioLavagem(
+            data_lavagem=linha["data_lavagem"],
+            base_id=linha["base_id"],
+            tipo_lavagem_id=linha["tipo_lavagem_id"],
+            transporte_equipamento_id=linha["transporte_equipamento_id"],
+            status=linha["status"],
+            quantidade=linha["total"],
+            faturamento=linha["soma_valor"] or 0,
+            duracao_total_segundos=int(duracao.total_seconds()) if duracao else 0,
+            quantidade_com_duracao=linha["total_com_duracao"],
+        )
+
+
+def atualizar_resumo_dias(dias):
+    """Refaz as linhas do resumo para os dias informados."""
+    from .models import Lavagem, ResumoDiarioLavagem
+
+    dias = {dia for dia in dias if dia}
+    if not dias:
+        return
+    with transaction.atomic():
+        ResumoDiarioLavagem.objects.filter(data_lavagem__in=dias).delete()
+        linhas = _agregados_por_chave(Lavagem.objects.filter(data_lavagem__in=dias))
+        ResumoDiarioLavagem.objects.bulk_create(_montar_resumos(linhas))
+        # Só invalida o cache depois do commit, para que nenhum relatório
+        # calculado com os dados antigos seja guardado com a versão nova.
+        transaction.on_commit(lambda: invalidar_dias(dias))
+
+
+def reconstruir_resumos(tamanho_lote=1000):
+    """Apaga e recria o resumo inteiro a partir das lavagens. Retorna o total de linhas."""
+    from .models import Lavagem, ResumoDiarioLavagem
+
+    total = 0
+    with transaction.atomic():
+        ResumoDiarioLavagem.objects.all().delete()
+        lote = []
+        linhas = _agregados_por_chave(Lavagem.objects.all()).iterator(chunk_size=tamanho_lote)
+        for resumo in _montar_resumos(linhas):
+            lote.append(resumo)
+            if len(lote) >= tamanho_lote:
+                ResumoDiarioLavagem.objects.bulk_create(lote)
+                total += len(lote)
+                lote = []
+        ResumoDiarioLavagem.objects.bulk_create(lote)
+        total += len(lote)
+    return total
+
+
+def resumos_periodo(data_inicio=None, data_fim=None, base_id=None):
+    """Queryset do resumo filtrado por período e, opcionalmente, por base."""
+    from .models import ResumoDiarioLavagem
+
+    resumos = ResumoDiarioLavagem.objects.all()
+    if data_inicio:
+        resumos = resumos.filter(data_lavagem__gte=data_inicio)
+    if data_fim:
+        resumos = resumos.filter(data_lavagem__lte=data_fim)
+    if base_id:
+        resumos = resumos.filter(base_id=base_id)
+    return resumos
+
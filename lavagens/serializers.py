@@ -1,12 +1,18 @@
 from rest_framework import serializers
-from .models import Lavagem, MaterialLavagem, TipoLavagem
+from .anotacoes import RotuloEscolhaField, anotar_lavagens, duracao_minutos
+from .campos_dinamicos import CamposDinamicosSerializerMixin
+from .lote import LOTE_MAXIMO
+from .models import Lavagem, MaterialLavagem, TarefaRelatorio, TipoLavagem
+from .requisicoes import LIMITE_REQUISICOES, METODOS
+from .transicoes import TRANSICOES_LAVAGEM
 from clientes.models import Cliente, Veiculo, Lavador
+from clientes.placas import PLACA_VALIDA
 
 
 class ClienteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cliente
-        fields = ["id", "nome", "cpf_cnpj", "telefone", "email", "endereco"]
+        fields = ["id", "nome", "telefone", "email"]
 
 
 class VeiculoSerializer(serializers.ModelSerializer):
@@ -23,9 +29,36 @@ class LavadorSerializer(serializers.ModelSerializer):
         fields = ["id", "nome", "cpf", "telefone", "data_admissao", "salario"]
 
 
-class LavagemListSerializer(serializers.ModelSerializer):
-    lavador_nome = serializers.CharField(source="lavador.nome", read_only=True)
-    status_display = serializers.CharField(source="get_status_display", read_only=True)
+class LavadorResumoSerializer(serializers.ModelSerializer):
+    """Lavador embutido em lavagens e agendamentos: só id e nome, sem dados pessoais."""
+
+    class Meta:
+        model = Lavador
+        fields = ["id", "nome"]
+
+
+def otimizar_queryset_lavagens(queryset):
+    """
+    Joins, prefetch e anotações usados pelos serializers de lavagem: a
+    listagem custa o mesmo número de consultas qualquer que seja o tamanho da
+    página, e a duração já vem calculada pelo banco.
+    """
+    return anotar_lavagens(queryset).select_related(
+        "base", "tipo_lavagem", "transporte_equipamento", "cliente", "veiculo__cliente"
+    ).prefetch_related("lavadores")
+
+
+class LavagemListSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
+    base_nome = serializers.CharField(source="base.nome", read_only=True, default=None)
+    tipo_lavagem_nome = serializers.CharField(source="tipo_lavagem.nome", read_only=True, default=None)
+    transporte_equipamento_nome = serializers.CharField(
+        source="transporte_equipamento.nome", read_only=True, default=None
+    )
+    cliente_nome = serializers.CharField(source="cliente.nome", read_only=True, default=None)
+    lavadores_nomes = serializers.SlugRelatedField(
+        source="lavadores", slug_field="nome", many=True, read_only=True
+    )
+    status_display = RotuloEscolhaField(source="status")
     duracao_formatada = serializers.SerializerMethodField()
 
     class Meta:
@@ -33,36 +66,59 @@ class LavagemListSerializer(serializers.ModelSerializer):
         fields = [
             "id", "codigo", "placa_veiculo", "hora_inicio", "hora_termino",
             "data_lavagem", "status", "status_display", "valor_servico", "valor_final",
-            "base", "local", "tipo_lavagem", "transporte_equipamento",
-            "lavador_nome", "duracao_formatada", "observacoes"
+            "base", "base_nome", "local", "tipo_lavagem", "tipo_lavagem_nome",
+            "transporte_equipamento", "transporte_equipamento_nome",
+            "cliente", "cliente_nome", "veiculo", "lavadores", "lavadores_nomes",
+            "duracao_formatada", "observacoes"
         ]
+        expansiveis = {
+            "cliente": ClienteSerializer,
+            "veiculo": VeiculoSerializer,
+            "lavadores": LavadorResumoSerializer,
+        }
+        dependencias = {
+            "status_display": ["status"],
+            "duracao_formatada": ["hora_inicio", "hora_termino"],
+        }
 
     def get_duracao_formatada(self, obj):
-        if obj.duracao_lavagem:
-            return f"{obj.duracao_lavagem} min"
+        minutos = duracao_minutos(obj)
+        if minutos:
+            return f"{minutos} min"
         return None
 
 
-class LavagemDetailSerializer(serializers.ModelSerializer):
+class LavagemDetailSerializer(CamposDinamicosSerializerMixin, serializers.ModelSerializer):
     cliente = ClienteSerializer(read_only=True)
     veiculo = VeiculoSerializer(read_only=True)
-    lavador = LavadorSerializer(read_only=True)
-    status_display = serializers.CharField(source="get_status_display", read_only=True)
+    lavadores = LavadorResumoSerializer(many=True, read_only=True)
+    base_nome = serializers.CharField(source="base.nome", read_only=True, default=None)
+    tipo_lavagem_nome = serializers.CharField(source="tipo_lavagem.nome", read_only=True, default=None)
+    transporte_equipamento_nome = serializers.CharField(
+        source="transporte_equipamento.nome", read_only=True, default=None
+    )
+    status_display = RotuloEscolhaField(source="status")
     duracao_formatada = serializers.SerializerMethodField()
 
     class Meta:
         model = Lavagem
         fields = [
             "id", "codigo", "placa_veiculo", "hora_inicio", "hora_termino",
-            "data_lavagem", "status", "status_display", "valor_servico", "valor_final",
-            "base", "local", "tipo_lavagem", "transporte_equipamento",
-            "cliente", "veiculo", "lavador", "observacoes", "duracao_formatada",
-            "created_at", "updated_at"
+            "data_lavagem", "status", "status_display", "valor_servico", "desconto", "valor_final",
+            "base", "base_nome", "local", "tipo_lavagem", "tipo_lavagem_nome",
+            "transporte_equipamento", "transporte_equipamento_nome",
+            "cliente", "veiculo", "lavadores", "contrato", "recebimento",
+            "observacoes", "duracao_formatada"
         ]
+        dependencias = {
+            "status_display": ["status"],
+            "duracao_formatada": ["hora_inicio", "hora_termino"],
+        }
 
     def get_duracao_formatada(self, obj):
-        if obj.duracao_lavagem:
-            return f"{obj.duracao_lavagem} min"
+        minutos = duracao_minutos(obj)
+        if minutos:
+            return f"{minutos} min"
         return None
 
 
@@ -71,14 +127,14 @@ class LavagemCreateUpdateSerializer(serializers.ModelSerializer):
         model = Lavagem
         fields = [
             "placa_veiculo", "base", "local", "tipo_lavagem",
-            "transporte_equipamento", "lavador", "hora_inicio",
+            "transporte_equipamento", "lavadores", "hora_inicio",
             "hora_termino", "data_lavagem", "observacoes"
         ]
 
     def validate_placa_veiculo(self, value):
-        import re
-        if not re.match(r"^[A-Z]{3}-?\d{4}$", value.upper()):
-            raise serializers.ValidationError("Formato de placa inválido. Use ABC-1234 ou ABC1234.")
+        # Formato antigo (ABC-1234, ABC1234) ou Mercosul (ABC1D23).
+        if not PLACA_VALIDA.match(value.upper()):
+            raise serializers.ValidationError("Formato de placa inválido. Use ABC-1234, ABC1234 ou ABC1D23.")
         return value.upper()
 
     def validate(self, data):
@@ -88,6 +144,57 @@ class LavagemCreateUpdateSerializer(serializers.ModelSerializer):
         return data
 
 
+class LavagemLoteItemSerializer(LavagemCreateUpdateSerializer):
+    """
+    Item de POST /api/lavagens/lote/ (usado com many=True, partial=True).
+    Sem "id" cria uma lavagem; com "id" atualiza os campos enviados.
+    As relações chegam como ids e são conferidas por lavagens.lote em uma
+    consulta por modelo para o lote inteiro, não item a item.
+    """
+    id = serializers.IntegerField(required=False)
+    base = serializers.IntegerField(required=False, allow_null=True)
+    tipo_lavagem = serializers.IntegerField(required=False, allow_null=True)
+    transporte_equipamento = serializers.IntegerField(required=False, allow_null=True)
+    lavadores = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta(LavagemCreateUpdateSerializer.Meta):
+        fields = ["id", *LavagemCreateUpdateSerializer.Meta.fields, "valor_servico", "desconto", "contrato"]
+        extra_kwargs = {"data_lavagem": {"required": False}}
+
+    def validate(self, data):
+        if "id" not in data:
+            faltando = {
+                campo: ["Este campo é obrigatório."]
+                for campo in ("placa_veiculo", "hora_inicio")
+                if campo not in data
+            }
+            if faltando:
+                raise serializers.ValidationError(faltando)
+        return super().validate(data)
+
+
+class TransicaoLavagensSerializer(serializers.Serializer):
+    """Corpo de POST /api/lavagens/transicao/."""
+    acao = serializers.ChoiceField(choices=list(TRANSICOES_LAVAGEM))
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=LOTE_MAXIMO)
+    motivo = serializers.CharField(required=False, allow_blank=True, max_length=500, default="")
+
+
+class SubrequisicaoSerializer(serializers.Serializer):
+    id = serializers.CharField(required=False, max_length=100)
+    metodo = serializers.ChoiceField(choices=METODOS, default="GET")
+    url = serializers.CharField(max_length=2000)
+    corpo = serializers.JSONField(required=False)
+
+
+class RequisicoesAgrupadasSerializer(serializers.Serializer):
+    """Corpo de POST /api/batch/."""
+    requisicoes = serializers.ListField(
+        child=SubrequisicaoSerializer(), allow_empty=False, max_length=LIMITE_REQUISICOES
+    )
+    transacao = serializers.BooleanField(default=False)
+
+
 class EstatisticasSerializer(serializers.Serializer):
     total_lavagens = serializers.IntegerField()
     lavagens_em_andamento = serializers.IntegerField()
@@ -115,3 +222,32 @@ class TipoLavagemSerializer(serializers.ModelSerializer):
         fields = ["id", "nome", "preco_base", "materiais"]
 
 
+class TarefaRelatorioSerializer(serializers.ModelSerializer):
+    status_display = RotuloEscolhaField(source="status")
+    resultado = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TarefaRelatorio
+        fields = [
+            "id", "tipo", "parametros", "status", "status_display",
+            "criado_em", "iniciado_em", "concluido_em", "erro", "resultado"
+        ]
+        read_only_fields = ["status", "criado_em", "iniciado_em", "concluido_em", "erro"]
+
+    def get_resultado(self, obj):
+        # A lista de tarefas não repete resultados que podem ser grandes.
+        if self.context.get("incluir_resultado"):
+            return obj.resultado
+        return None
+
+    def validate_parametros(self, value):
+        from datetime import date
+
+        try:
+            data_inicio = date.fromisoformat(value["data_inicio"])
+            data_fim = date.fromisoformat(value["data_fim"])
+        except (KeyError, TypeError, ValueError):
+            raise serializers.ValidationError("Informe data_inicio e data_fim no formato YYYY-MM-DD.")
+        if data_fim < data_inicio:
+            raise serializers.ValidationError("data_fim deve ser igual ou posterior a data_inicio.")
+        return value
@@ -0,0 +1,196 @@
+"""
+Sincronização incremental para os clientes móveis e de TV (GET /api/sync/).
+
+Cada modelo sincronizado tem `atualizado_em` e um índice em
+(atualizado_em, id); exclusões ficam em RegistroExclusao. Cada um é lido como
+um fluxo por keyset nessa ordem, e o token devolvido guarda a posição de cada
+fluxo. Uma consulta sem novidades custa uma busca vazia no índice por modelo,
+qualquer que seja o tamanho das tabelas.
+
+- sem ?since= a resposta começa a carga completa; o cliente repete a chamada
+  com o token devolvido enquanto `mais` for verdadeiro;
+- os modelos de catálogo vêm antes de lavagens e agendamentos, então uma
+  linha nunca chega antes das linhas que ela referencia;
+- as linhas dos últimos MARGEM_COMMIT podem ser entregues de novo na próxima
+  chamada: `atualizado_em` é preenchido antes do commit, e recuar o token
+  evita perder uma transação que confirmou depois de outra mais recente. O
+  cliente deve aplicar as linhas como upsert por id.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from rest_framework import serializers
+
+from clientes.models import Cliente, Lavador, Veiculo
+
+from .agendamento_models import Agendamento
+from .models import Base, Lavagem, MaterialLavagem, RegistroExclusao, TipoLavagem, TransporteEquipamento
+from .paginacao import filtro_apos
+
+# Referenciados antes de quem os referencia.
+MODELOS = {
+    "bases": Base,
+    "tipos_lavagem": TipoLavagem,
+    "materiais": MaterialLavagem,
+    "transportes": TransporteEquipamento,
+    "lavadores": Lavador,
+    "clientes": Cliente,
+    "veiculos": Veiculo,
+    "lavagens": Lavagem,
+    "agendamentos": Agendamento,
+}
+EXCLUSOES = "exclusoes"
+
+# Campos enviados de cada modelo: lista explícita, para um campo novo (ou
+# sensível, como cpf e salário de lavadores) não sair na sincronização sem
+# ninguém decidir.
+CAMPOS = {
+    "bases": ("id", "nome", "atualizado_em"),
+    "tipos_lavagem": ("id", "nome", "preco_base", "atualizado_em"),
+    "materiais": ("id", "tipo_lavagem", "nome", "valor", "atualizado_em"),
+    "transportes": ("id", "nome", "multiplicador_preco", "atualizado_em"),
+    "lavadores": ("id", "nome", "telefone", "ativo", "atualizado_em"),
+    "clientes": ("id", "nome", "telefone", "email", "observacoes", "ativo", "atualizado_em"),
+    "veiculos": (
+        "id", "cliente", "placa", "placa_normalizada", "modelo", "marca", "ano", "cor", "tipo",
+        "observacoes", "ativo", "atualizado_em",
+    ),
+    "lavagens": (
+        "id", "codigo", "cliente", "veiculo", "base", "local", "tipo_lavagem", "transporte_equipamento",
+        "placa_veiculo", "placa_normalizada", "hora_inicio", "hora_termino", "data_lavagem", "status",
+        "valor_servico", "desconto", "valor_final", "observacoes", "recebimento", "contrato", "lavadores",
+        "atualizado_em",
+    ),
+    "agendamentos": (
+        "id", "codigo", "cliente", "veiculo", "base", "local", "tipo_lavagem", "transporte_equipamento",
+        "placa_veiculo", "placa_normalizada", "data_agendamento", "hora_agendamento", "duracao_estimada",
+        "status", "prioridade", "valor_estimado", "desconto_agendamento", "telefone_contato",
+        "email_contato", "observacoes", "observacoes_internas", "confirmado_em", "confirmado_por",
+        "cancelado_em", "motivo_cancelamento", "lavagem", "lavadores", "atualizado_em",
+    ),
+}
+
+ORDENACAO = ("atualizado_em", "id")
+ORDENACAO_EXCLUSOES = ("excluido_em", "id")
+
+LIMITE_PADRAO = 500
+LIMITE_MAXIMO = 1000
+MARGEM_COMMIT = timedelta(seconds=10)
+RETENCAO_EXCLUSOES = timedelta(days=30)
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+class TokenExpirado(Exception):
+    """Token mais antigo que a retenção das exclusões: é preciso recomeçar."""
+
+
+def _serializer(modelo, campos):
+    meta = type("Meta", (), {"model": modelo, "fields": campos})
+    return type(f"{modelo.__name__}SincronizacaoSerializer", (serializers.ModelSerializer,), {"Meta": meta})
+
+
+SERIALIZERS = {nome: _serializer(modelo, CAMPOS[nome]) for nome, modelo in MODELOS.items()}
+NOMES_POR_MODELO = {modelo._meta.label_lower: nome for nome, modelo in MODELOS.items()}
+
+
+def codificar_token(cursores):
+    dados = {
+        nome: [momento.isoformat(), pk]
+        for nome, (momento, pk) in cursores.items()
+    }
+    return base64.urlsafe_b64encode(json.dumps(dados).encode()).decode()
+
+
+def decodificar_token(token):
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(token.encode()))
+        cursores = {}
+        for nome, (momento, pk) in dados.items():
+            if nome not in MODELOS and nome != EXCLUSOES:
+                raise ValueError(nome)
+            momento = datetime.fromisoformat(momento)
+            if timezone.is_naive(momento):
+                raise ValueError(momento)
+            cursores[nome] = (momento, int(pk))
+        return cursores
+    except (TypeError, ValueError, AttributeError) as erro:
+        raise TokenInvalido(token) from erro
+
+
+def _ler_fluxo(queryset, ordenacao, cursor, limite):
+    """Até `limite` linhas depois de `cursor`; o bool indica se há mais."""
+    if cursor is not None:
+        queryset = queryset.filter(filtro_apos(ordenacao, cursor))
+    linhas = list(queryset.order_by(*ordenacao)[:limite + 1])
+    return linhas[:limite], len(linhas) > limite
+
+
+def _queryset(modelo):
+    queryset = modelo._default_manager.all()
+    relacoes_m2m = [campo.name for campo in modelo._meta.many_to_many]
+    return queryset.prefetch_related(*relacoes_m2m) if relacoes_m2m else queryset
+
+
+def sincronizar(since=None, limite=LIMITE_PADRAO):
+    """
+    Alterações e exclusões depois do token `since` (ou a carga completa, sem
+    token), limitadas a `limite` linhas no total.
+    Retorna {"alteracoes", "exclusoes", "since", "mais"}.
+    """
+    agora = timezone.now()
+    corte = (agora - MARGEM_COMMIT, 0)
+    if since:
+        cursores = decodificar_token(since)
+        if EXCLUSOES not in cursores or cursores[EXCLUSOES][0] < agora - RETENCAO_EXCLUSOES:
+            raise TokenExpirado(since)
+    else:
+        # Carga completa: só interessam exclusões feitas a partir de agora.
+        cursores = {EXCLUSOES: corte}
+
+    fluxos = [
+        (nome, _queryset(modelo), ORDENACAO, "atualizado_em")
+        for nome, modelo in MODELOS.items()
+    ]
+    fluxos.append((EXCLUSOES, RegistroExclusao.objects.all(), ORDENACAO_EXCLUSOES, "excluido_em"))
+
+    alteracoes, exclusoes = {}, {}
+    restante, mais = limite, False
+    for nome, queryset, ordenacao, campo_momento in fluxos:
+        linhas, mais = _ler_fluxo(queryset, ordenacao, cursores.get(nome), restante)
+        if linhas:
+            ultima = linhas[-1]
+            cursores[nome] = (getattr(ultima, campo_momento), ultima.pk)
+            restante -= len(linhas)
+            if nome == EXCLUSOES:
+                for registro in linhas:
+                    exclusoes.setdefault(NOMES_POR_MODELO[registro.modelo], []).append(registro.objeto_id)
+            else:
+                alteracoes[nome] = SERIALIZERS[nome](linhas, many=True).data
+        if mais:
+            break
+
+    if not mais:
+        # Tudo lido: recua os cursores até o corte para não perder commits
+        # atrasados. Só no fim da sequência, para que uma carga em vários
+        # lotes sempre avance.
+        for nome, *_ in fluxos:
+            cursores[nome] = min(cursores.get(nome) or corte, corte)
+
+    return {
+        "alteracoes": alteracoes,
+        "exclusoes": exclusoes,
+        "since": codificar_token(cursores),
+        "mais": mais,
+    }
+
+
+def limpar_exclusoes(agora=None):
+    """Apaga os registros de exclusão mais antigos que a retenção. Retorna quantos."""
+    limite = (agora or timezone.now()) - RETENCAO_EXCLUSOES
+    apagados, _ = RegistroExclusao.objects.filter(excluido_em__lt=limite).delete()
+    return apagados
@@ -0,0 +1,161 @@
+"""
+Fila de relatórios em segundo plano, guardada no banco (TarefaRelatorio).
+
+As views enfileiram com `enfileirar()`; o comando `manage.py processar_tarefas`
+reserva as tarefas pendentes uma a uma e grava o resultado em JSON. Não há
+broker externo: a reserva é um UPDATE condicional no status, então vários
+workers podem rodar ao mesmo tempo sem pegar a mesma tarefa.
+"""
+import hashlib
+import json
+import logging
+import traceback
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Acima deste número de dias o relatório é calculado em segundo plano.
+ASYNC_MIN_DIAS_PADRAO = 366
+
+# Tarefas em PROCESSANDO há mais tempo que isto voltam para a fila
+# (o worker que as pegou provavelmente morreu).
+TIMEOUT_PROCESSAMENTO_PADRAO = timedelta(minutes=30)
+
+_TIPOS = {}
+
+
+def tipo_tarefa(nome):
+    """Registra a função que calcula o resultado de um tipo de tarefa."""
+    def registrar(funcao):
+        _TIPOS[nome] = funcao
+        return funcao
+    return registrar
+
+
+def _datas(parametros):
+    return (
+        date.fromisoformat(parametros["data_inicio"]),
+        date.fromisoformat(parametros["data_fim"]),
+    )
+
+
+@tipo_tarefa("relatorio")
+def _relatorio(parametros):
+    from .relatorios_dados import relatorio_periodo
+
+    data_inicio, data_fim = _datas(parametros)
+    return relatorio_periodo(data_inicio, data_fim, parametros.get("base_id"))
+
+
+@tipo_tarefa("relatorio_periodo")
+def _relatorio_periodo_api(parametros):
+    from .relatorios_dados import calcular_relatorio_periodo_api
+
+    data_inicio, data_fim = _datas(parametros)
+    return calcular_relatorio_periodo_api(data_inicio, data_fim)
+
+
+def deve_rodar_em_segundo_plano(data_inicio, data_fim):
+    limite = getattr(settings, "RELATORIOS_ASYNC_MIN_DIAS", ASYNC_MIN_DIAS_PADRAO)
+    return (data_fim - data_inicio).days + 1 > limite
+
+
+def chave_tarefa(tipo, parametros):
+    conteudo = json.dumps({"tipo": tipo, **parametros}, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def enfileirar(tipo, parametros, usuario=None):
+    """
+    Cria uma tarefa pendente, ou devolve a que já está na fila com os mesmos
+    parâmetros, para que recarregar a página não enfileire de novo.
+    """
+    from .models import TarefaRelatorio
+
+    if tipo not in _TIPOS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+
+    parametros = json.loads(json.dumps(parametros, cls=DjangoJSONEncoder))
+    chave = chave_tarefa(tipo, parametros)
+    solicitado_por = usuario if usuario and usuario.is_authenticated else None
+    # Só reaproveita tarefas do mesmo usuário: as dos outros ele não pode ver.
+    existente = TarefaRelatorio.objects.filter(
+        chave=chave, status__in=["PENDENTE", "PROCESSANDO"], solicitado_por=solicitado_por
+    ).order_by("criado_em").first()
+    if existente:
+        return existente
+
+    return TarefaRelatorio.objects.create(
+        tipo=tipo,
+        parametros=parametros,
+        chave=chave,
+        solicitado_por=solicitado_por,
+    )
+
+
+def tarefas_visiveis(usuario):
+    """Tarefas que `usuario` pode acompanhar: as que ele pediu (staff vê todas)."""
+    from .models import TarefaRelatorio
+
+    tarefas = TarefaRelatorio.objects.all()
+    if usuario.is_staff:
+        return tarefas
+    return tarefas.filter(solicitado_por=usuario)
+
+
+def reservar_proxima():
+    """Marca a tarefa pendente mais antiga como PROCESSANDO e a retorna."""
+    from .models import TarefaRelatorio
+
+    agora = timezone.now()
+    timeout = getattr(settings, "RELATORIOS_TAREFA_TIMEOUT", TIMEOUT_PROCESSAMENTO_PADRAO)
+    disponiveis = TarefaRelatorio.objects.filter(
+        Q(status="PENDENTE") | Q(status="PROCESSANDO", iniciado_em__lt=agora - timeout)
+    )
+
+    while True:
+        tarefa = disponiveis.order_by("criado_em").first()
+        if tarefa is None:
+            return None
+        # Só um worker consegue mudar o status; os outros tentam a próxima.
+        reservada = TarefaRelatorio.objects.filter(
+            pk=tarefa.pk, status=tarefa.status, iniciado_em=tarefa.iniciado_em
+        ).update(status="PROCESSANDO", iniciado_em=agora)
+        if reservada:
+            tarefa.status = "PROCESSANDO"
+            tarefa.iniciado_em = agora
+            return tarefa
+
+
+def executar(tarefa):
+    """Calcula o resultado da tarefa já reservada e grava o status final."""
+    try:
+        resultado = _TIPOS[tarefa.tipo](tarefa.parametros)
+    except Exception:
+        logger.exception("Falha ao processar a tarefa de relatório %s", tarefa.pk)
+        tarefa.status = "ERRO"
+        tarefa.erro = traceback.format_exc()
+    else:
+        tarefa.status = "CONCLUIDA"
+        tarefa.resultado = json.loads(json.dumps(resultado, cls=DjangoJSONEncoder))
+        tarefa.erro = ""
+    tarefa.concluido_em = timezone.now()
+    tarefa.save(update_fields=["status", "resultado", "erro", "concluido_em"])
+    return tarefa
+
+
+def processar_pendentes(limite=None):
+    """Processa as tarefas da fila até esvaziá-la (ou até `limite`). Retorna quantas rodaram."""
+    processadas = 0
+    while limite is None or processadas < limite:
+        tarefa = reservar_proxima()
+        if tarefa is None:
+            break
+        executar(tarefa)
+        processadas += 1
+    return processadas
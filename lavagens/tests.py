@@ -1,3 +1,806 @@
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from clientes.models import Cliente, Lavador, Veiculo
+
+from .agendamento_models import Agendamento
+from .agregacoes import calcular_agregacao, ler_consulta
+from .condicional import LAVAGENS
+from .lote import gravar_lote
+from .models import (
+    Base, EventoAoVivo, Lavagem, ResumoDiarioLavagem, TarefaRelatorio, TipoLavagem, TransporteEquipamento,
+)
+from .paginacao import EXATA, SEM_TOTAL, PaginadorContagemCacheada
+from .relatorios_dados import relatorio_periodo
+from .renderizadores import JSONRapidoRenderer
+from .resumos import reconstruir_resumos
+from .transicoes import transicionar_agendamentos, transicionar_lavagens
+
+
+def linhas_resumo():
+    """Linhas atuais do resumo diário, para comparar com as de reconstruir_resumos()."""
+    return sorted(ResumoDiarioLavagem.objects.values_list(
+        "data_lavagem", "base_id", "tipo_lavagem_id", "transporte_equipamento_id", "status",
+        "quantidade", "faturamento", "duracao_total_segundos", "quantidade_com_duracao",
+    ), key=repr)
+
+
+def resumo_reconstruido():
+    reconstruir_resumos()
+    return linhas_resumo()
+
+
+class ResumoDiarioTest(TestCase):
+    """O resumo diário acompanha a lavagem quando ela muda de dia ou é excluída."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.base = Base.objects.create(nome="Base Centro")
+        cls.inicio = timezone.make_aware(datetime(2025, 3, 10, 8, 0))
+
+    def criar_lavagem(self, placa, **campos):
+        return Lavagem.objects.create(
+            placa_veiculo=placa, base=self.base, hora_inicio=self.inicio,
+            hora_termino=self.inicio + timedelta(minutes=30), data_lavagem=self.inicio.date(),
+            status="CONCLUIDA", valor_servico=Decimal("100.00"), **campos,
+        )
+
+    def resumo_por_dia(self):
+        return dict(ResumoDiarioLavagem.objects.values_list("data_lavagem", "quantidade"))
+
+    def test_mudanca_de_dia_e_exclusao(self):
+        lavagem = self.criar_lavagem("RES0001")
+        self.criar_lavagem("RES0002")
+        self.assertEqual(self.resumo_por_dia(), {date(2025, 3, 10): 2})
+
+        lavagem.data_lavagem = date(2025, 3, 12)
+        lavagem.save()
+        self.assertEqual(self.resumo_por_dia(), {date(2025, 3, 10): 1, date(2025, 3, 12): 1})
+        self.assertEqual(linhas_resumo(), resumo_reconstruido())
+
+        lavagem.delete()
+        self.assertEqual(self.resumo_por_dia(), {date(2025, 3, 10): 1})
+        # Exclusão pelo queryset também passa pelo sinal de cada lavagem.
+        Lavagem.objects.all().delete()
+        self.assertFalse(ResumoDiarioLavagem.objects.exists())
+        self.assertEqual(linhas_resumo(), resumo_reconstruido())
+
+
+class LavagemApiConsultasTest(TestCase):
+    """A listagem e o detalhe da API de lavagens usam um número fixo de consultas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.base = Base.objects.create(nome="Base Centro")
+        cls.tipo = TipoLavagem.objects.create(nome="Completa")
+        cls.transporte = TransporteEquipamento.objects.create(nome="Caminhão")
+        cls.cliente = Cliente.objects.create(nome="Transportadora")
+        cls.lavadores = [
+            Lavador.objects.create(nome=f"Lavador {i}", cpf=f"000.000.000-0{i}", data_admissao=date(2024, 1, 1))
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def criar_lavagens(self, quantidade):
+        inicio = timezone.make_aware(datetime(2025, 3, 10, 8, 0))
+        for i in range(quantidade):
+            veiculo = Veiculo.objects.create(
+                cliente=self.cliente, placa=f"ABC{Lavagem.objects.count():04d}", modelo="FH", marca="Volvo"
+            )
+            lavagem = Lavagem.objects.create(
+                placa_veiculo=veiculo.placa,
+                cliente=self.cliente,
+                veiculo=veiculo,
+                base=self.base,
+                tipo_lavagem=self.tipo,
+                transporte_equipamento=self.transporte,
+                hora_inicio=inicio + timedelta(hours=i),
+                hora_termino=inicio + timedelta(hours=i, minutes=40),
+                data_lavagem=inicio.date(),
+                status="CONCLUIDA",
+            )
+            lavagem.lavadores.set(self.lavadores)
+
+    def test_listagem_com_consultas_constantes(self):
+        self.criar_lavagens(2)
+        # count da paginação + lavagens com joins + prefetch de lavadores
+        with self.assertNumQueries(3):
+            resposta = self.client.get(reverse("lavagem-list"))
+        self.assertEqual(resposta.status_code, 200)
+
+        self.criar_lavagens(15)
+        with self.assertNumQueries(3):
+            resposta = self.client.get(reverse("lavagem-list"))
+        self.assertEqual(len(resposta.data["results"]), 17)
+
+        item = resposta.data["results"][0]
+        self.assertEqual(item["base_nome"], "Base Centro")
+        self.assertEqual(item["tipo_lavagem_nome"], "Completa")
+        self.assertEqual(item["transporte_equipamento_nome"], "Caminhão")
+        self.assertEqual(item["cliente_nome"], "Transportadora")
+        self.assertEqual(sorted(item["lavadores_nomes"]), ["Lavador 0", "Lavador 1"])
+
+    def test_expand_lavadores_sem_dados_pessoais(self):
+        self.criar_lavagens(1)
+        resposta = self.client.get(reverse("lavagem-list"), {"expand": "lavadores"})
+        lavadores = resposta.data["results"][0]["lavadores"]
+        self.assertEqual(sorted(lavador["nome"] for lavador in lavadores), ["Lavador 0", "Lavador 1"])
+        self.assertEqual(set(lavadores[0]), {"id", "nome"})
+
+    def test_detalhe_com_consultas_constantes(self):
+        self.criar_lavagens(1)
+        lavagem = Lavagem.objects.get()
+        with self.assertNumQueries(2):
+            resposta = self.client.get(reverse("lavagem-detail", args=[lavagem.pk]))
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["veiculo"]["cliente_nome"], "Transportadora")
+        self.assertEqual(len(resposta.data["lavadores"]), 2)
+        # Sem login: nada de cpf ou salário dos lavadores.
+        self.assertEqual(set(resposta.data["lavadores"][0]), {"id", "nome"})
+
+
+class DashboardConsultasTest(TestCase):
+    """O dashboard usa o mesmo número de consultas com poucas lavagens ou com várias páginas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("operador", password="senha")
+        cls.base = Base.objects.create(nome="Base Centro")
+        cls.tipo = TipoLavagem.objects.create(nome="Completa")
+        cls.transporte = TransporteEquipamento.objects.create(nome="Caminhão")
+        cls.cliente = Cliente.objects.create(nome="Transportadora")
+        cls.lavador = Lavador.objects.create(nome="Lavador 0", cpf="000.000.000-00", data_admissao=date(2024, 1, 1))
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def criar_lavagens(self, quantidade, status):
+        inicio = timezone.make_aware(datetime(2025, 3, 10, 8, 0))
+        # Executa os on_commit: as marcas de alteração invalidam os contadores em cache.
+        with self.captureOnCommitCallbacks(execute=True):
+            self._criar_lavagens(inicio, quantidade, status)
+
+    def _criar_lavagens(self, inicio, quantidade, status):
+        for i in range(quantidade):
+            lavagem = Lavagem.objects.create(
+                placa_veiculo=f"ABC{Lavagem.objects.count():04d}",
+                cliente=self.cliente,
+                base=self.base,
+                tipo_lavagem=self.tipo,
+                transporte_equipamento=self.transporte,
+                hora_inicio=inicio + timedelta(hours=i),
+                hora_termino=inicio + timedelta(hours=i, minutes=40) if status == "CONCLUIDA" else None,
+                data_lavagem=inicio.date(),
+                status=status,
+            )
+            lavagem.lavadores.add(self.lavador)
+
+    def test_consultas_nao_crescem_com_as_paginas(self):
+        self.criar_lavagens(1, "EM_ANDAMENTO")
+        self.criar_lavagens(1, "CONCLUIDA")
+        # sessão + usuário + contadores + uma página de cada seção + lavadores
+        with self.assertNumQueries(6):
+            resposta = self.client.get(reverse("dashboard"))
+        self.assertEqual(resposta.status_code, 200)
+
+        # Mais de uma página em cada seção (10 em andamento, 20 concluídas).
+        self.criar_lavagens(14, "EM_ANDAMENTO")
+        self.criar_lavagens(29, "CONCLUIDA")
+        with self.assertNumQueries(6):
+            resposta = self.client.get(reverse("dashboard"))
+
+        self.assertEqual(resposta.context["total_andamento"], 15)
+        self.assertEqual(resposta.context["total_concluidas"], 30)
+        self.assertEqual(resposta.context["lavagens_andamento"].paginator.num_pages, 2)
+        self.assertEqual(len(resposta.context["lavagens_concluidas"]), 20)
+        self.assertContains(resposta, "Base Centro")
+        self.assertContains(resposta, "Caminhão")
+
+
+class PaginadorContagemCacheadaTest(TestCase):
+    """A contagem das listas HTML vem do cache até a próxima gravação e para no limite."""
+
+    def criar_lavagens(self, quantidade):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(quantidade):
+                Lavagem.objects.create(
+                    placa_veiculo=f"PAG{i:04d}", hora_inicio=timezone.now(), data_lavagem=timezone.localdate()
+                )
+
+    def paginador(self, **kwargs):
+        return PaginadorContagemCacheada(Lavagem.objects.order_by("id"), 2, (LAVAGENS,), **kwargs)
+
+    def test_contagem_em_cache_invalidada_por_gravacao(self):
+        self.criar_lavagens(7)
+        self.assertEqual(self.paginador().count, 7)
+        with self.assertNumQueries(0):
+            paginador = self.paginador()
+            self.assertEqual((paginador.count, paginador.modo, paginador.num_pages), (7, EXATA, 4))
+
+        self.criar_lavagens(1)
+        self.assertEqual(self.paginador().count, 8)
+
+    def test_acima_do_limite_so_anterior_e_proxima(self):
+        self.criar_lavagens(7)
+        # No SQLite não há estimativa do planejador: cai no modo sem total.
+        paginador = self.paginador(limite=5)
+        self.assertEqual((paginador.count, paginador.num_pages, paginador.modo), (None, None, SEM_TOTAL))
+
+        primeira = paginador.get_page(1)
+        self.assertEqual((len(primeira), primeira.has_previous(), primeira.has_next()), (2, False, True))
+        self.assertEqual(primeira.next_page_number(), 2)
+        ultima = paginador.get_page(4)
+        self.assertEqual((len(ultima), ultima.has_next(), ultima.end_index()), (1, False, 7))
+        self.assertEqual(paginador.get_page(99).number, 1)
+
+
+class EventosAoVivoTest(TestCase):
+    """Mudanças de status viram eventos no feed SSE, filtrados por base."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("operador", password="senha")
+        cls.base = Base.objects.create(nome="Base Centro")
+        cls.outra_base = Base.objects.create(nome="Base Porto")
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def criar_lavagem(self, base):
+        return Lavagem.objects.create(
+            placa_veiculo="ABC1234", base=base, hora_inicio=timezone.now(), data_lavagem=timezone.localdate()
+        )
+
+    def test_eventos_apenas_quando_o_status_muda(self):
+        lavagem = self.criar_lavagem(self.base)
+        lavagem.observacoes = "Sem mudança de status"
+        lavagem.save()
+        lavagem.concluir_lavagem()
+
+        eventos = EventoAoVivo.objects.filter(tipo="lavagem", objeto_id=lavagem.pk).order_by("id")
+        self.assertEqual(
+            [(evento.acao, evento.status) for evento in eventos],
+            [("criado", "EM_ANDAMENTO"), ("alterado", "CONCLUIDA")],
+        )
+
+    def test_fluxo_por_base(self):
+        lavagem = self.criar_lavagem(self.base)
+        self.criar_lavagem(self.outra_base)
+        transicionar_lavagens(Lavagem.objects.filter(pk=lavagem.pk), "concluir")
+
+        resposta = self.client.get(reverse("eventos_ao_vivo"), {"base": self.base.pk})
+        self.assertEqual(resposta["Content-Type"], "text/event-stream")
+        conteudo = iter(resposta.streaming_content)
+        self.assertTrue(next(conteudo).startswith(b"retry:"))
+        eventos = [next(conteudo).decode() for _ in range(2)]
+        resposta.close()
+
+        dados = [json.loads(evento.split("data: ", 1)[1]) for evento in eventos]
+        self.assertEqual([(d["id"], d["status"]) for d in dados], [(lavagem.pk, "EM_ANDAMENTO"), (lavagem.pk, "CONCLUIDA")])
+        self.assertEqual(dados[1]["status_display"], "Lavagem Concluída")
+        self.assertTrue(eventos[0].startswith("event: lavagem\n"))
+
+
+class BuscaTextualTest(TestCase):
+    """A busca da API usa o índice FTS5, mantido em dia pelas gravações."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.cliente = Cliente.objects.create(nome="José Transportes", telefone="(92) 99999-1234")
+        cls.lavador = Lavador.objects.create(nome="Raimundo", cpf="000.000.000-00", data_admissao=date(2024, 1, 1))
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def criar_lavagem(self, placa, **campos):
+        return Lavagem.objects.create(
+            placa_veiculo=placa, hora_inicio=timezone.now(), data_lavagem=timezone.localdate(), **campos
+        )
+
+    def buscar(self, texto):
+        resposta = self.client.get(reverse("lavagem-list"), {"search": texto})
+        return [item["id"] for item in resposta.data["results"]]
+
+    def test_prefixos_sem_acento_e_sem_pontuacao(self):
+        com_cliente = self.criar_lavagem("ABC-1234", cliente=self.cliente)
+        com_lavador = self.criar_lavagem("XYZ9876")
+        com_lavador.lavadores.add(self.lavador)
+
+        self.assertEqual(self.buscar("abc1234"), [com_cliente.pk])
+        self.assertEqual(self.buscar("ABC-12"), [com_cliente.pk])
+        self.assertEqual(self.buscar("jose trans"), [com_cliente.pk])
+        self.assertEqual(self.buscar("99999-1234"), [com_cliente.pk])
+        self.assertEqual(self.buscar("raim"), [com_lavador.pk])
+
+    def test_indice_acompanha_as_alteracoes(self):
+        lavagem = self.criar_lavagem("XYZ9876")
+        lavagem.lavadores.add(self.lavador)
+
+        self.lavador.nome = "Severino"
+        self.lavador.save()
+        self.assertEqual(self.buscar("raimundo"), [])
+        self.assertEqual(self.buscar("sever"), [lavagem.pk])
+
+        lavagem.lavadores.clear()
+        self.assertEqual(self.buscar("sever"), [])
+
+        lavagem.delete()
+        self.assertEqual(self.buscar("xyz"), [])
+
+
+class PlacaNormalizadaTest(TestCase):
+    """Placas antigas, com traço e Mercosul são a mesma; um erro de digitação é opcional."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_filtro_placa_da_api(self):
+        lavagem = Lavagem.objects.create(
+            placa_veiculo="QWE-1234", hora_inicio=timezone.now(), data_lavagem=timezone.localdate()
+        )
+        self.assertEqual(lavagem.placa_normalizada, "QWE1234")
+
+        def buscar(**parametros):
+            resposta = self.client.get(reverse("lavagem-list"), parametros)
+            return [item["id"] for item in resposta.data["results"]]
+
+        self.assertEqual(buscar(placa="qwe1234"), [lavagem.pk])
+        self.assertEqual(buscar(placa="QWE1C34"), [lavagem.pk])
+        self.assertEqual(buscar(placa="QWE1243"), [])
+        self.assertEqual(buscar(placa="QWE1243", placa_aproximada="1"), [lavagem.pk])
+
+
+class SincronizacaoTest(TestCase):
+    """O /api/sync/ exige login e não envia dados pessoais de lavadores."""
+
+    def setUp(self):
+        self.client = APIClient()
+        Lavador.objects.create(
+            nome="Raimundo", cpf="111.111.111-11", data_admissao=date(2024, 1, 1), salario="2500.00"
+        )
+
+    def test_login_obrigatorio_e_campos_restritos(self):
+        resposta = self.client.get(reverse("sincronizacao"))
+        self.assertIn(resposta.status_code, (401, 403))
+
+        self.client.force_authenticate(User.objects.create_user("tablet", password="senha"))
+        resposta = self.client.get(reverse("sincronizacao"))
+        self.assertEqual(resposta.status_code, 200)
+        lavador = resposta.data["alteracoes"]["lavadores"][0]
+        self.assertEqual(lavador["nome"], "Raimundo")
+        self.assertNotIn("cpf", lavador)
+        self.assertNotIn("salario", lavador)
+
+
+class AgregacaoLavadorTest(TestCase):
+    """Cada lavagem conta uma vez: filtro por lavador sem agrupar por ele, só percentis."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.base = Base.objects.create(nome="Base Centro")
+        cls.lavadores = [
+            Lavador.objects.create(nome=f"Lavador {i}", cpf=f"000.000.000-1{i}", data_admissao=date(2024, 1, 1))
+            for i in range(2)
+        ]
+        inicio = timezone.make_aware(datetime(2025, 3, 10, 8, 0))
+        for i in range(3):
+            lavagem = Lavagem.objects.create(
+                placa_veiculo=f"AGR{i:04d}",
+                base=cls.base,
+                hora_inicio=inicio + timedelta(hours=i),
+                hora_termino=inicio + timedelta(hours=i, minutes=30),
+                data_lavagem=inicio.date(),
+                status="CONCLUIDA",
+                valor_servico=Decimal("100.00"),
+            )
+            lavagem.lavadores.set(cls.lavadores)
+
+    def agregar(self, **parametros):
+        return calcular_agregacao(ler_consulta(parametros))["linhas"]
+
+    def test_filtro_por_lavador(self):
+        ids = ",".join(str(lavador.pk) for lavador in self.lavadores)
+        metricas = "quantidade,valor_total,duracao_p50"
+
+        [total] = self.agregar(metrics=metricas, lavador=ids)
+        self.assertEqual((total["quantidade"], total["valor_total"], total["duracao_p50"]), (3, 300.0, 30.0))
+        [por_base] = self.agregar(group_by="base", metrics=metricas, lavador=ids)
+        self.assertEqual((por_base["quantidade"], por_base["valor_total"]), (3, 300.0))
+
+        # Só percentis (calculados em Python no SQLite): ainda uma linha por grupo.
+        linhas = self.agregar(group_by="base", metrics="duracao_p50", limit="2")
+        self.assertEqual(linhas, [{"base": self.base.pk, "base_nome": "Base Centro", "duracao_p50": 30.0}])
+        self.assertFalse(calcular_agregacao(ler_consulta({"group_by": "base", "metrics": "duracao_p50", "limit": "1"}))["truncado"])
+
+        # Agrupando por lavador, cada lavagem conta para cada um dos dois.
+        por_lavador = self.agregar(group_by="lavador", metrics="quantidade", lavador=str(self.lavadores[0].pk))
+        self.assertEqual([(linha["lavador"], linha["quantidade"]) for linha in por_lavador], [(self.lavadores[0].pk, 3)])
+
+
+class RequisicoesAgrupadasTest(TestCase):
+    """POST /api/batch/ repassa usuário e CSRF, reverte em transação e isola erros."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("tablet", password="senha")
+        cls.lavagem = Lavagem.objects.create(
+            placa_veiculo="LOT1234", hora_inicio=timezone.now(), data_lavagem=timezone.localdate()
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def lote(self, *requisicoes, transacao=False):
+        resposta = self.client.post(
+            reverse("requisicoes_agrupadas"),
+            {"requisicoes": list(requisicoes), "transacao": transacao},
+            format="json",
+        )
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.data
+
+    def test_usuario_da_requisicao_externa(self):
+        agendamentos = {"metodo": "GET", "url": "/api/agendamentos/"}
+        [anonima] = self.lote(agendamentos)["respostas"]
+        self.assertIn(anonima["status"], (401, 403))
+
+        self.client.force_login(self.usuario)
+        [autenticada] = self.lote(agendamentos)["respostas"]
+        self.assertEqual(autenticada["status"], 200)
+
+    def test_csrf_da_requisicao_externa(self):
+        self.client = APIClient(enforce_csrf_checks=True)
+        self.client.force_login(self.usuario)
+        token = "a" * 32
+        self.client.cookies["csrftoken"] = token
+        alteracao = {"metodo": "PATCH", "url": f"/api/lavagens/{self.lavagem.pk}/", "corpo": {"observacoes": "Ok"}}
+
+        resposta = self.client.post(reverse("requisicoes_agrupadas"), {"requisicoes": [alteracao]}, format="json")
+        self.assertEqual(resposta.status_code, 403)
+
+        resposta = self.client.post(
+            reverse("requisicoes_agrupadas"), {"requisicoes": [alteracao]}, format="json", HTTP_X_CSRFTOKEN=token
+        )
+        self.assertEqual(resposta.data["respostas"][0]["status"], 200)
+        self.lavagem.refresh_from_db()
+        self.assertEqual(self.lavagem.observacoes, "Ok")
+
+    def test_transacao_revertida_no_primeiro_erro(self):
+        dados = self.lote(
+            {"metodo": "PATCH", "url": f"/api/lavagens/{self.lavagem.pk}/", "corpo": {"observacoes": "Revertida"}},
+            {"metodo": "GET", "url": "/api/lavagens/999999/"},
+            {"metodo": "GET", "url": "/api/lavagens/"},
+            transacao=True,
+        )
+        self.assertTrue(dados["revertida"])
+        self.assertEqual([resposta["status"] for resposta in dados["respostas"]], [200, 404, 424])
+        self.lavagem.refresh_from_db()
+        self.assertEqual(self.lavagem.observacoes, "")
+
+    def test_erro_interno_aninhada_e_fluxo(self):
+        with self.assertLogs("lavagens.requisicoes", level="ERROR"):
+            dados = self.lote(
+                {"metodo": "GET", "url": "/api/lavagens/?data_inicio=abc"},
+                {"metodo": "POST", "url": "/api/batch/", "corpo": {"requisicoes": []}},
+                {"metodo": "GET", "url": "/api/lavagens/exportar/"},
+                {"metodo": "GET", "url": "/api/lavagens/"},
+            )
+        self.assertFalse(dados["revertida"])
+        self.assertEqual([resposta["status"] for resposta in dados["respostas"]], [500, 400, 400, 200])
+
+
+class ExportacaoFiltrosTest(TestCase):
+    """Filtros mal formados na exportação respondem 400 antes de abrir o fluxo."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("operador", password="senha"))
+
+    def test_ids_e_datas_invalidos(self):
+        for rota, parametros in [
+            ("lavagem-exportar", {"data_inicio": "abc"}),
+            ("lavagem-exportar", {"base": "x"}),
+            ("agendamento-exportar", {"base": "x"}),
+            ("agendamento-exportar", {"data_fim": "2025-13-01"}),
+        ]:
+            resposta = self.client.get(reverse(rota), parametros)
+            self.assertEqual(resposta.status_code, 400, (rota, parametros))
+            self.assertIn("error", resposta.data)
+
+        resposta = self.client.get(reverse("lavagem-exportar"), {"base": "1", "data_inicio": "2025-01-01"})
+        self.assertEqual(resposta.status_code, 200)
+        resposta.close()
+
+
+class RelatorioTarefaTest(TestCase):
+    """O resultado de uma tarefa só aparece com o período e a base dela."""
+
+    def setUp(self):
+        self.usuario = User.objects.create_user("gerente", password="senha")
+        self.client.force_login(self.usuario)
+        resultado = relatorio_periodo(date(2024, 1, 1), date(2024, 1, 31))
+        resultado = json.loads(json.dumps({**resultado, "ticket_medio": "123.45"}, cls=DjangoJSONEncoder))
+        self.tarefa = TarefaRelatorio.objects.create(
+            tipo="relatorio",
+            parametros={"data_inicio": "2024-01-01", "data_fim": "2024-01-31", "base_id": None},
+            chave="teste",
+            status="CONCLUIDA",
+            resultado=resultado,
+            solicitado_por=self.usuario,
+        )
+
+    def test_periodo_da_tarefa(self):
+        resposta = self.client.get(reverse("relatorios"), {"tarefa": "abc"})
+        self.assertEqual(resposta.status_code, 200)
+
+        resposta = self.client.get(reverse("relatorios"), {"tarefa": self.tarefa.pk})
+        self.assertEqual((resposta.context["data_inicio"], resposta.context["data_fim"]), ("2024-01-01", "2024-01-31"))
+        self.assertEqual(resposta.context["ticket_medio"], "123.45")
+
+        resposta = self.client.get(
+            reverse("relatorios"), {"tarefa": self.tarefa.pk, "data_inicio": "2024-02-01", "data_fim": "2024-02-29"}
+        )
+        self.assertEqual(resposta.context["data_inicio"], "2024-02-01")
+        self.assertNotEqual(resposta.context["ticket_medio"], "123.45")
+
+    def test_tarefas_de_outro_usuario(self):
+        api = APIClient()
+        api.force_authenticate(User.objects.create_user("outro", password="senha"))
+        self.assertEqual(api.get(reverse("tarefarelatorio-list")).data["results"], [])
+        self.assertEqual(api.get(reverse("tarefarelatorio-detail", args=[self.tarefa.pk])).status_code, 404)
+
+        api.force_authenticate(User.objects.create_user("admin", password="senha", is_staff=True))
+        self.assertEqual(api.get(reverse("tarefarelatorio-detail", args=[self.tarefa.pk])).status_code, 200)
+
+        api.force_authenticate(self.usuario)
+        self.assertEqual(api.get(reverse("tarefarelatorio-detail", args=[self.tarefa.pk])).status_code, 200)
+
+
+class PeriodoBaseInvalidaTest(TestCase):
+    """Relatórios da API com ?base= não numérico respondem 400."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_base_invalida(self):
+        periodo = {"data_inicio": "2025-01-01", "data_fim": "2025-01-31"}
+        for rota in ("lavagem-consumo-materiais", "lavagem-duracoes"):
+            resposta = self.client.get(reverse(rota), {**periodo, "base": "x"})
+            self.assertEqual(resposta.status_code, 400, rota)
+            resposta = self.client.get(reverse(rota), periodo)
+            self.assertEqual(resposta.status_code, 200, rota)
+
+
+class CalendarioCondicionalTest(TestCase):
+    """O ETag do .ics sem janela muda com o dia, mesmo sem gravações."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user("agenda", password="senha"))
+
+    def test_etag_muda_com_o_dia(self):
+        resposta = self.client.get(reverse("agendamento-calendario"), {"formato": "ics"})
+        self.assertEqual(resposta.status_code, 200)
+        etag = resposta["ETag"]
+
+        amanha = timezone.localtime() + timedelta(days=1)
+        with mock.patch("lavagens.condicional.timezone.localtime", return_value=amanha):
+            resposta = self.client.get(
+                reverse("agendamento-calendario"), {"formato": "ics"}, HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta["ETag"], etag)
+
+
+class JSONRapidoRendererTest(TestCase):
+    """JSONRapidoRenderer escreve os mesmos bytes do JSONRenderer do DRF."""
+
+    def test_mesmos_bytes(self):
+        dados = {
+            "id": 1,
+            "valor": Decimal("12.50"),
+            "duracao": 42.5,
+            "inicio": timezone.make_aware(datetime(2025, 3, 10, 8, 0, 0, 123456)),
+            "data": date(2025, 3, 10),
+            "obs": "linha\u2028nova, ação",
+            "nada": None,
+            "lista": [1, 2.25, "três"],
+        }
+        self.assertEqual(JSONRapidoRenderer().render(dados), JSONRenderer().render(dados))
+
+
+class LoteLavagensTest(TestCase):
+    """POST /api/lavagens/lote/ grava o lote inteiro ou nada."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.base = Base.objects.create(nome="Base Centro")
+        cls.tipo = TipoLavagem.objects.create(nome="Completa")
+        cls.lavador = Lavador.objects.create(nome="Lavador 0", cpf="000.000.000-20", data_admissao=date(2024, 1, 1))
+        cls.inicio = timezone.make_aware(datetime(2025, 3, 10, 8, 0))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.existente = Lavagem.objects.create(
+            placa_veiculo="OLD0001", base=self.base, hora_inicio=self.inicio, data_lavagem=self.inicio.date()
+        )
+
+    def item(self, placa, **campos):
+        return {"placa_veiculo": placa, "hora_inicio": self.inicio.isoformat(), "base": self.base.pk, **campos}
+
+    def assertNadaGravado(self, resumo):
+        self.assertEqual(list(Lavagem.objects.values_list("pk", "placa_veiculo", "data_lavagem")), [
+            (self.existente.pk, "OLD0001", date(2025, 3, 10)),
+        ])
+        self.assertFalse(Lavagem.lavadores.through.objects.exists())
+        self.assertEqual(linhas_resumo(), resumo)
+
+    def test_item_invalido_desfaz_o_lote(self):
+        resumo = linhas_resumo()
+        atualizacao = {"id": self.existente.pk, "placa_veiculo": "NEW0001", "data_lavagem": "2025-03-11"}
+        lotes = [
+            # Referência inexistente: recusada por gravar_lote antes de gravar.
+            [atualizacao, self.item("LOT0001", lavadores=[self.lavador.pk]), self.item("LOT0002", base=999999)],
+            [atualizacao, self.item("LOT0001"), self.item("LOT0002", lavadores=[999999])],
+            # Item novo sem hora_inicio: recusado pelo serializer.
+            [atualizacao, self.item("LOT0001"), {"placa_veiculo": "LOT0002"}],
+        ]
+        for itens in lotes:
+            resposta = self.client.post(reverse("lavagem-lote"), itens, format="json")
+            self.assertEqual(resposta.status_code, 400)
+            self.assertEqual([erro["indice"] for erro in resposta.data["itens"]], [2])
+            self.assertNadaGravado(resumo)
+
+    def test_falha_ao_gravar_desfaz_o_lote(self):
+        resumo = linhas_resumo()
+        itens = [
+            {"id": self.existente.pk, "placa_veiculo": "NEW0001", "data_lavagem": date(2025, 3, 11)},
+            {"placa_veiculo": "LOT0001", "hora_inicio": self.inicio, "base": self.base.pk, "lavadores": [self.lavador.pk]},
+        ]
+        # Falha depois do insert, dos vínculos e do resumo: tudo é desfeito.
+        with mock.patch("lavagens.lote.indexar", side_effect=RuntimeError("falha no índice")):
+            with self.assertRaises(RuntimeError):
+                gravar_lote(itens)
+        self.assertNadaGravado(resumo)
+
+    def test_lote_valido(self):
+        itens = [
+            {"id": self.existente.pk, "placa_veiculo": "new-0001", "data_lavagem": "2025-03-11"},
+            self.item("lot-0001", lavadores=[self.lavador.pk], valor_servico="80.00"),
+            self.item("LOT0002", tipo_lavagem=self.tipo.pk, status="CONCLUIDA",
+                      hora_termino=(self.inicio + timedelta(minutes=45)).isoformat()),
+        ]
+        resposta = self.client.post(reverse("lavagem-lote"), itens, format="json")
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual([r["acao"] for r in resposta.data["resultados"]], ["atualizada", "criada", "criada"])
+
+        self.assertEqual(
+            sorted(Lavagem.objects.values_list("placa_normalizada", "data_lavagem")),
+            [("LOT0001", date(2025, 3, 10)), ("LOT0002", date(2025, 3, 10)), ("NEW0001", date(2025, 3, 11))],
+        )
+        nova = Lavagem.objects.get(placa_normalizada="LOT0001")
+        self.assertEqual(list(nova.lavadores.all()), [self.lavador])
+        self.assertEqual(nova.valor_final, Decimal("80.00"))
+        # O resumo mantido pelo lote (inclusive o dia de onde a lavagem saiu) é o mesmo de uma reconstrução.
+        self.assertEqual(linhas_resumo(), resumo_reconstruido())
+
+
+class TransicoesTest(TestCase):
+    """Transições em conjunto mantêm o resumo diário e os agendamentos de origem."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.base = Base.objects.create(nome="Base Centro")
+        cls.tipo = TipoLavagem.objects.create(nome="Completa")
+        cls.transporte = TransporteEquipamento.objects.create(nome="Caminhão")
+        cls.cliente = Cliente.objects.create(nome="Transportadora")
+        cls.inicio = timezone.make_aware(datetime(2025, 3, 10, 8, 0))
+
+    def criar_lavagem(self, horas, **campos):
+        hora_inicio = self.inicio + timedelta(hours=horas)
+        return Lavagem.objects.create(
+            placa_veiculo=f"TRN{Lavagem.objects.count():04d}", base=self.base, tipo_lavagem=self.tipo,
+            hora_inicio=hora_inicio, data_lavagem=hora_inicio.date(), **campos,
+        )
+
+    def criar_agendamento(self, horas, lavagem=None, **campos):
+        return Agendamento.objects.create(
+            cliente=self.cliente, base=self.base, tipo_lavagem=self.tipo, transporte_equipamento=self.transporte,
+            placa_veiculo="AGD0001", data_agendamento=date(2025, 3, 10),
+            hora_agendamento=(self.inicio + timedelta(hours=horas)).time(), lavagem=lavagem, **campos,
+        )
+
+    def test_transicionar_lavagens(self):
+        # Dois dias, uma já concluída (fica de fora) e uma com agendamento de origem.
+        com_agendamento = self.criar_lavagem(0, valor_servico=Decimal("50.00"))
+        outra = self.criar_lavagem(26)
+        concluida = self.criar_lavagem(1, status="CONCLUIDA", hora_termino=self.inicio + timedelta(hours=2))
+        agendamento = self.criar_agendamento(0, lavagem=com_agendamento, status="EM_ANDAMENTO")
+
+        alteradas = transicionar_lavagens(Lavagem.objects.all(), "concluir")
+        self.assertEqual(sorted(alteradas), sorted([com_agendamento.pk, outra.pk]))
+        self.assertEqual(set(Lavagem.objects.values_list("status", flat=True)), {"CONCLUIDA"})
+        self.assertIsNotNone(Lavagem.objects.get(pk=outra.pk).hora_termino)
+        self.assertEqual(Lavagem.objects.get(pk=concluida.pk).hora_termino, self.inicio + timedelta(hours=2))
+        agendamento.refresh_from_db()
+        self.assertEqual(agendamento.status, "CONCLUIDO")
+        self.assertEqual(linhas_resumo(), resumo_reconstruido())
+
+    def test_cancelar_lavagem(self):
+        lavagem = self.criar_lavagem(0, observacoes="Chegou sujo")
+        agendamento = self.criar_agendamento(0, lavagem=lavagem, status="EM_ANDAMENTO")
+
+        self.assertEqual(transicionar_lavagens(Lavagem.objects.all(), "cancelar", motivo="chuva"), [lavagem.pk])
+        lavagem.refresh_from_db()
+        self.assertEqual((lavagem.status, lavagem.observacoes), ("CANCELADA", "Chegou sujo\nCancelada: chuva"))
+        agendamento.refresh_from_db()
+        self.assertEqual(agendamento.status, "CANCELADO")
+        self.assertEqual(linhas_resumo(), resumo_reconstruido())
+
+    def test_transicionar_agendamentos(self):
+        agendado = self.criar_agendamento(0)
+        confirmado = self.criar_agendamento(1, status="CONFIRMADO")
+        cancelado = self.criar_agendamento(2, status="CANCELADO")
+
+        alterados = transicionar_agendamentos(Agendamento.objects.all(), "confirmar", confirmado_por="Ana")
+        self.assertEqual(alterados, [agendado.pk])
+        alterados = transicionar_agendamentos(Agendamento.objects.all(), "cancelar", motivo="Sem vaga")
+        self.assertEqual(sorted(alterados), sorted([agendado.pk, confirmado.pk]))
+
+        agendado.refresh_from_db()
+        self.assertEqual(
+            (agendado.status, agendado.confirmado_por, agendado.motivo_cancelamento),
+            ("CANCELADO", "Ana", "Sem vaga"),
+        )
+        self.assertIsNotNone(agendado.cancelado_em)
+        cancelado.refresh_from_db()
+        self.assertIsNone(cancelado.cancelado_em)
+
+
+class RespostaCondicionalTest(TestCase):
+    """GET da API responde 304 com o ETag atual e um ETag novo depois de uma gravação."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.base = Base.objects.create(nome="Base Centro")
+        cls.lavagem = Lavagem.objects.create(
+            placa_veiculo="ETG0001", base=cls.base, hora_inicio=timezone.now(), data_lavagem=timezone.localdate()
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_304_e_etag_novo_apos_gravacao(self):
+        rota = reverse("lavagem-detail", args=[self.lavagem.pk])
+        resposta = self.client.get(rota)
+        self.assertEqual(resposta.status_code, 200)
+        etag = resposta["ETag"]
+
+        # Sem gravação, nem o banco é consultado.
+        with self.assertNumQueries(0):
+            resposta = self.client.get(rota, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta["ETag"], etag)
+        self.assertEqual(resposta.content, b"")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.patch(rota, {"observacoes": "Retorno amanhã"}, format="json")
+        self.assertEqual(resposta.status_code, 200)
 
-# Create your tests here.
+        resposta = self.client.get(rota, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta["ETag"], etag)
+        self.assertEqual(resposta.data["observacoes"], "Retorno amanhã")
+        self.assertEqual(self.client.get(rota, HTTP_IF_NONE_MATCH=resposta["ETag"]).status_code, 304)
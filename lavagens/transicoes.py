@@ -0,0 +1,118 @@
+"""
+Transições de status em conjunto (admin e POST /api/.../transicao/).
+
+concluir_lavagem(), confirmar_agendamento() etc. gravam uma linha por vez, e
+cada Lavagem.save() ainda busca o agendamento de origem e pode salvá-lo. Aqui
+cada transição vira poucos UPDATE ... WHERE status IN (...) para o conjunto
+inteiro:
+
+- as linhas fora do status de origem são ignoradas (o mesmo filtro vale no
+  UPDATE, então uma linha alterada por outra requisição no meio do caminho
+  não é sobrescrita);
+- os agendamentos ligados às lavagens recebem o status correspondente em um
+  único UPDATE, com o mesmo mapeamento de Lavagem.save();
+- o resumo diário é refeito uma vez para os dias afetados.
+
+Como save() e os sinais não são chamados, as marcas de alteração da API e os
+eventos do feed ao vivo (lavagens.ao_vivo) são registrados aqui.
+"""
+from django.db import transaction
+from django.db.models import Case, TextField, Value, When
+from django.db.models.functions import Coalesce, Concat
+from django.utils import timezone
+
+from .agendamento_models import Agendamento
+from .ao_vivo import registrar_eventos
+from .condicional import AGENDAMENTOS, LAVAGENS, registrar_alteracao
+from .models import Lavagem
+from .resumos import atualizar_resumo_dias
+
+# ação: (status de origem aceitos, status de destino)
+TRANSICOES_LAVAGEM = {
+    "concluir": (("EM_ANDAMENTO",), "CONCLUIDA"),
+    "cancelar": (("EM_ANDAMENTO",), "CANCELADA"),
+}
+TRANSICOES_AGENDAMENTO = {
+    "confirmar": (("AGENDADO",), "CONFIRMADO"),
+    "cancelar": (("AGENDADO", "CONFIRMADO"), "CANCELADO"),
+    "nao_compareceu": (("AGENDADO", "CONFIRMADO"), "NAO_COMPARECEU"),
+}
+
+# Status do agendamento de origem para cada status de destino da lavagem.
+STATUS_AGENDAMENTO_DA_LAVAGEM = {
+    "CONCLUIDA": "CONCLUIDO",
+    "CANCELADA": "CANCELADO",
+}
+
+
+def _anexar_observacao(texto):
+    # Mesmo formato de Lavagem.cancelar_lavagem(): f"{observacoes}\n{texto}".strip()
+    return Case(
+        When(observacoes="", then=Value(texto)),
+        default=Concat("observacoes", Value(f"\n{texto}"), output_field=TextField()),
+        output_field=TextField(),
+    )
+
+
+def transicionar_lavagens(lavagens, acao, motivo=""):
+    """
+    Aplica `acao` ("concluir" ou "cancelar") às lavagens do queryset que
+    estiverem no status de origem. Retorna os ids alterados.
+    """
+    origens, destino = TRANSICOES_LAVAGEM[acao]
+    agora = timezone.now()
+    # update() não preenche campos auto_now.
+    campos = {"status": destino, "atualizado_em": agora}
+    if acao == "concluir":
+        campos["hora_termino"] = Coalesce("hora_termino", Value(agora))
+    elif motivo:
+        campos["observacoes"] = _anexar_observacao(f"Cancelada: {motivo}")
+
+    with transaction.atomic():
+        linhas = list(lavagens.filter(status__in=origens).values_list("pk", "data_lavagem", "base_id"))
+        ids = [pk for pk, _, _ in linhas]
+        if not ids:
+            return []
+
+        Lavagem.objects.filter(pk__in=ids, status__in=origens).update(**campos)
+        status_agendamento = STATUS_AGENDAMENTO_DA_LAVAGEM[destino]
+        agendamentos = list(
+            Agendamento.objects.filter(lavagem_id__in=ids).exclude(status=status_agendamento).values_list("pk", "base_id")
+        )
+        Agendamento.objects.filter(pk__in=[pk for pk, _ in agendamentos]).update(
+            status=status_agendamento, atualizado_em=agora
+        )
+
+        atualizar_resumo_dias({dia for _, dia, _ in linhas})
+        registrar_alteracao(LAVAGENS, AGENDAMENTOS)
+        registrar_eventos("lavagem", [(pk, base_id, destino) for pk, _, base_id in linhas])
+        registrar_eventos("agendamento", [(pk, base_id, status_agendamento) for pk, base_id in agendamentos])
+    return ids
+
+
+def transicionar_agendamentos(agendamentos, acao, motivo="", confirmado_por=""):
+    """
+    Aplica `acao` ("confirmar", "cancelar" ou "nao_compareceu") aos
+    agendamentos do queryset que estiverem no status de origem. Retorna os
+    ids alterados.
+
+    Os status de origem são anteriores a iniciar_lavagem(), então esses
+    agendamentos ainda não têm lavagem para sincronizar.
+    """
+    origens, destino = TRANSICOES_AGENDAMENTO[acao]
+    agora = timezone.now()
+    campos = {"status": destino, "atualizado_em": agora}
+    if acao == "confirmar":
+        campos.update(confirmado_em=agora, confirmado_por=confirmado_por)
+    elif acao == "cancelar":
+        campos.update(cancelado_em=agora, motivo_cancelamento=motivo)
+
+    with transaction.atomic():
+        linhas = list(agendamentos.filter(status__in=origens).values_list("pk", "base_id"))
+        ids = [pk for pk, _ in linhas]
+        if not ids:
+            return []
+        Agendamento.objects.filter(pk__in=ids, status__in=origens).update(**campos)
+        registrar_alteracao(AGENDAMENTOS)
+        registrar_eventos("agendamento", [(pk, base_id, destino) for pk, base_id in linhas])
+    return ids
@@ -26,6 +26,9 @@ urlpatterns = [
     # APIs AJAX para lavagens (usam lavagens_views)
     path('api/locais-por-base/', lavagens_views.api_locais_por_base, name='api_locais_por_base'),
     path('api/buscar-veiculo/', lavagens_views.api_buscar_veiculo, name='api_buscar_veiculo'),
+
+    # Feed ao vivo (SSE) das telas de lavagens e agendamentos
+    path('eventos/', lavagens_views.eventos_ao_vivo, name='eventos_ao_vivo'),
     
     # URLs de agendamentos (usam agendamento_views)
     # path('', include('lavagens.agendamento_urls')), <-- REMOVA esta linha, é redundante
@@ -2,19 +2,26 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.db.models import Q
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.paginator import Paginator
 from .models import Lavagem, TipoLavagem, Base, TransporteEquipamento, Agendamento, MaterialLavagem
 from clientes.models import Cliente, Veiculo, Lavador
+from clientes.placas import filtrar_placa, variantes_placa
 from .forms import BaseForm, TipoLavagemForm, TransporteEquipamentoForm, MaterialLavagemFormSet
+from .ao_vivo import INTERVALO_KEEPALIVE, abrir_fluxo
+from .busca import filtrar as filtrar_busca
+from .estatisticas import contadores_lavagens
+from .condicional import CATALOGO, LAVAGENS
+from .paginacao import PaginadorComTotal, contagem_em_cache
+from .relatorios_dados import faturamento_do_dia, relatorio_periodo
+from .tarefas import deve_rodar_em_segundo_plano, enfileirar, tarefas_visiveis
 import json
 # Alternativa recomendada
 from django.db import models
 from django.db.models import Q, Count, Sum, Avg
 
 from decimal import Decimal
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from django.contrib.auth.decorators import login_required
 # Linha CORRIGIDA para colocar no seu views.py
 
@@ -24,26 +31,28 @@ def dashboard(request):
     search_query = request.GET.get("search", "")
     status_filter = request.GET.get("status", "")
     
-    lavagens = Lavagem.objects.prefetch_related(
-        "lavadores"
-    ).select_related("cliente")
+    lavagens = Lavagem.objects.all()
     
     if search_query:
-        lavagens = lavagens.filter(
-            Q(codigo__icontains=search_query) |
-            Q(placa_veiculo__icontains=search_query) |
-            Q(cliente__nome__icontains=search_query) |
-            Q(lavadores__nome__icontains=search_query)
-        ).distinct() # .distinct() evita resultados duplicados na busca ManyToMany
+        # Índice FTS5 (lavagens.busca): sem join com lavadores nem distinct().
+        lavagens = filtrar_busca(lavagens, "lavagem", search_query, placa_aproximada=True)
     
     if status_filter:
         lavagens = lavagens.filter(status=status_filter)
     
+    # Uma consulta conta as duas seções; os paginadores usam esses totais em
+    # vez de um COUNT(*) cada. Cada página traz os joins que a tabela exibe.
+    # A contagem fica no cache até a próxima gravação em lavagens ou catálogo.
+    contadores = contagem_em_cache(lavagens, (LAVAGENS, CATALOGO), lambda: contadores_lavagens(lavagens))
+    lavagens = lavagens.select_related("base", "tipo_lavagem", "transporte_equipamento")
+    
     lavagens_andamento = lavagens.filter(status="EM_ANDAMENTO").order_by("-hora_inicio")
-    lavagens_concluidas = lavagens.filter(status="CONCLUIDA").order_by("-data_lavagem", "-hora_termino")
+    lavagens_concluidas = lavagens.filter(status="CONCLUIDA").prefetch_related(
+        "lavadores"
+    ).order_by("-data_lavagem", "-hora_termino")
     
-    paginator_andamento = Paginator(lavagens_andamento, 10)
-    paginator_concluidas = Paginator(lavagens_concluidas, 20)
+    paginator_andamento = PaginadorComTotal(lavagens_andamento, 10, contadores["em_andamento"])
+    paginator_concluidas = PaginadorComTotal(lavagens_concluidas, 20, contadores["concluidas"])
     
     page_andamento = request.GET.get("page_andamento", 1)
     page_concluidas = request.GET.get("page_concluidas", 1)
@@ -56,8 +65,8 @@ def dashboard(request):
         "lavagens_concluidas": lavagens_concluidas,
         "search_query": search_query,
         "status_filter": status_filter,
-        "total_andamento": lavagens.filter(status="EM_ANDAMENTO").count(),
-        "total_concluidas": lavagens.filter(status="CONCLUIDA").count(),
+        "total_andamento": contadores["em_andamento"],
+        "total_concluidas": contadores["concluidas"],
     }
     
     return render(request, "lavagens/dashboard.html", context)
@@ -174,10 +183,11 @@ def api_locais_por_base(request):
 @csrf_exempt
 def api_buscar_veiculo(request):
     if request.method == "GET":
-        placa = request.GET.get("placa", "").upper()
+        placa = request.GET.get("placa", "")
         if placa:
-            try:
-                veiculo = Veiculo.objects.select_related("cliente").get(placa=placa)
+            # "ABC-1234", "abc1234" e "ABC1C34" (Mercosul) encontram o mesmo veículo.
+            veiculo = filtrar_placa(Veiculo.objects.select_related("cliente"), placa).first()
+            if veiculo is not None:
                 return JsonResponse({
                     "found": True,
                     "veiculo": {
@@ -194,12 +204,39 @@ def api_buscar_veiculo(request):
                         "telefone": veiculo.cliente.telefone,
                     } if veiculo.cliente else None
                 })
-            except Veiculo.DoesNotExist:
-                return JsonResponse({"found": False})
+            # Placa com um erro de digitação: sugere as cadastradas mais próximas.
+            sugestoes = Veiculo.objects.filter(placa_normalizada__in=variantes_placa(placa))
+            return JsonResponse({"found": False, "sugestoes": list(sugestoes.values_list("placa", flat=True)[:5])})
     
     return JsonResponse({"found": False})
 
 
+def _inteiro_ou_none(valor):
+    try:
+        return int(valor) if valor else None
+    except ValueError:
+        return None
+
+
+@login_required
+def eventos_ao_vivo(request):
+    """Fluxo SSE de status de lavagens e agendamentos (ver lavagens.ao_vivo)."""
+    fluxo = abrir_fluxo(
+        ultimo_id=_inteiro_ou_none(request.headers.get("Last-Event-ID") or request.GET.get("ultimo")),
+        base_id=_inteiro_ou_none(request.GET.get("base")),
+    )
+    if fluxo is None:
+        resposta = HttpResponse("Muitas conexões ao vivo abertas.", status=503, content_type="text/plain")
+        resposta["Retry-After"] = str(INTERVALO_KEEPALIVE)
+        return resposta
+
+    resposta = StreamingHttpResponse(fluxo, content_type="text/event-stream")
+    resposta["Cache-Control"] = "no-cache"
+    # Sem buffer em proxies (nginx), senão os eventos chegam em blocos.
+    resposta["X-Accel-Buffering"] = "no"
+    return resposta
+
+
 
 @login_required
 def relatorios(request):
@@ -217,146 +254,57 @@ def relatorios(request):
         data_inicio = datetime.strptime(data_inicio_str, "%Y-%m-%d").date()
         data_fim = datetime.strptime(data_fim_str, "%Y-%m-%d").date()
     
-    # Filtrar lavagens pelo período
-    lavagens_periodo = Lavagem.objects.filter(
-        data_lavagem__range=[data_inicio, data_fim]
-    )
-
-    # Aplicar filtro de base, se houver
-    if base_filtro_id:
-        lavagens_periodo = lavagens_periodo.filter(base_id=base_filtro_id)
-    
-    # --- Cálculos de Estatísticas ---
-    total_lavagens = lavagens_periodo.count()
-    lavagens_em_andamento = lavagens_periodo.filter(status="EM_ANDAMENTO").count()
-    lavagens_concluidas = lavagens_periodo.filter(status="CONCLUIDA").count()
-    lavagens_canceladas = lavagens_periodo.filter(status="CANCELADA").count()
+    # Os números do período vêm do cache versionado (ver lavagens.cache_relatorios).
+    # Períodos longos sem cache são calculados pelo worker em segundo plano.
+    relatorio = None
+    tarefa_id = request.GET.get("tarefa", "")
+    tarefa = None
+    if tarefa_id.isdigit():
+        tarefa = tarefas_visiveis(request.user).filter(pk=tarefa_id, tipo="relatorio", status="CONCLUIDA").first()
+    if tarefa:
+        parametros = tarefa.parametros
+        if not data_inicio_str or not data_fim_str:
+            # Link só com ?tarefa=: o período e a base são os da tarefa.
+            data_inicio = date.fromisoformat(parametros["data_inicio"])
+            data_fim = date.fromisoformat(parametros["data_fim"])
+            base_filtro_id = parametros.get("base_id")
+        # O resultado só vale para o período e a base com que foi calculado;
+        # um link antigo ou editado cai no cálculo do período pedido.
+        periodo_da_tarefa = (
+            data_inicio.isoformat() == parametros["data_inicio"]
+            and data_fim.isoformat() == parametros["data_fim"]
+            and str(base_filtro_id or "") == str(parametros.get("base_id") or "")
+        )
+        if periodo_da_tarefa:
+            relatorio = tarefa.resultado
     
-    faturamento_mes = lavagens_periodo.filter(status="CONCLUIDA").aggregate(
-        total=Sum("valor_final")
-    )["total"] or Decimal("0.00")
-    
-    faturamento_dia = Lavagem.objects.filter(
-        status="CONCLUIDA",
-        data_lavagem=hoje # Faturamento do dia atual
-    ).aggregate(total=Sum("valor_final"))["total"] or Decimal("0.00")
-    
-    # Tempo médio de lavagem (apenas para lavagens concluídas com hora de início e término)
-    tempo_medio_lavagem_segundos = lavagens_periodo.filter(
-        status="CONCLUIDA",
-        hora_inicio__isnull=False,
-        hora_termino__isnull=False
-    ).annotate(
-        duracao_segundos=(models.F('hora_termino') - models.F('hora_inicio'))
-    ).aggregate(
-        avg_duracao=Avg('duracao_segundos')
-    )['avg_duracao']
-
-    tempo_medio = int(tempo_medio_lavagem_segundos.total_seconds() / 60) if tempo_medio_lavagem_segundos else 0
-    
-    # --- Dados para o Gráfico de Lavagens por Base ---
-    lavagens_por_base_query = (
-        lavagens_periodo
-        .filter(base__isnull=False) # Garante que só bases válidas sejam contadas
-        .values('base__nome')
-        .annotate(total=Count('id'))
-        .order_by('-total')
-    )
-    lavagens_por_base = {item['base__nome']: item['total'] for item in lavagens_por_base_query}
-
-    # --- Dados para o Gráfico de Lavagens por Tipo (se você for usar) ---
-    lavagens_por_tipo_query = (
-        lavagens_periodo
-        .filter(tipo_lavagem__isnull=False) # Garante que só tipos válidos sejam contados
-        .values('tipo_lavagem__nome')
-        .annotate(total=Count('id'))
-        .order_by('-total')
-    )
-    lavagens_por_tipo = {item['tipo_lavagem__nome']: item['total'] for item in lavagens_por_tipo_query}
-    
-    # --- Dados para o Gráfico de Faturamento por Período (Linha) ---
-    faturamento_labels = []
-    faturamento_dados = []
-    
-    # Gerar labels e dados para cada dia no período selecionado
-    delta = data_fim - data_inicio
-    for i in range(delta.days + 1):
-        dia = data_inicio + timedelta(days=i)
-        faturamento_dia_grafico = lavagens_periodo.filter(
-            status="CONCLUIDA",
-            data_lavagem=dia
-        ).aggregate(total=Sum("valor_final"))["total"] or 0
-        
-        faturamento_labels.append(dia.strftime("%d/%m"))
-        faturamento_dados.append(float(faturamento_dia_grafico))
-    
-    # --- Ticket Médio ---
-    ticket_medio = 0
-    if lavagens_concluidas > 0:
-        ticket_medio = faturamento_mes / lavagens_concluidas
+    if relatorio is None and deve_rodar_em_segundo_plano(data_inicio, data_fim):
+        relatorio = relatorio_periodo(data_inicio, data_fim, base_filtro_id, apenas_cache=True)
+        if relatorio is None:
+            tarefa = enfileirar(
+                "relatorio",
+                {"data_inicio": data_inicio, "data_fim": data_fim, "base_id": base_filtro_id or None},
+                request.user,
+            )
+            return render(request, "lavagens/relatorio_processando.html", {
+                "tarefa": tarefa,
+                "data_inicio": data_inicio.strftime('%Y-%m-%d'),
+                "data_fim": data_fim.strftime('%Y-%m-%d'),
+                "base_filtro": base_filtro_id or "",
+            })
     
-    # --- Performance dos Lavadores ---
-    performance_lavadores = lavagens_periodo.filter(status="CONCLUIDA", lavadores__isnull=False)\
-        .values("lavadores__nome")\
-        .annotate(total_lavagens_concluidas=Count("id"))\
-        .order_by("-total_lavagens_concluidas")
-
-    lavadores_labels = [item['lavadores__nome'] for item in performance_lavadores]
-    lavadores_dados = [item['total_lavagens_concluidas'] for item in performance_lavadores]
-    # --- Ranking de Carros/Contratos ---
-    ranking_carros_contratos = lavagens_periodo.filter(status="CONCLUIDA")\
-        .values("placa_veiculo", "contrato")\
-        .annotate(total_lavagens=Count("id"))\
-        .order_by("-total_lavagens")[:10] # Top 10
-
-    ranking_labels = [f"{item['placa_veiculo']} ({item['contrato'] if item['contrato'] else 'N/A'})" for item in ranking_carros_contratos]
-    ranking_dados = [item['total_lavagens'] for item in ranking_carros_contratos]
-
-    # --- Consumo de Materiais por Mês ---
-    # Esta parte será mais complexa e precisará de um loop ou agregação mais avançada
-    # para somar os materiais de cada tipo de lavagem associada às lavagens concluídas.
-    # Por enquanto, vamos deixar como um placeholder.
-    consumo_materiais = {}
-    # Para cada lavagem concluída no período, somar os materiais do tipo de lavagem associado
-    for lavagem in lavagens_periodo.filter(status="CONCLUIDA").select_related("tipo_lavagem").prefetch_related("tipo_lavagem__materiais"):
-        if lavagem.tipo_lavagem:
-            for material in lavagem.tipo_lavagem.materiais.all():
-                consumo_materiais[material.nome] = consumo_materiais.get(material.nome, Decimal('0.00')) + material.valor
-
-    materiais_labels = list(consumo_materiais.keys())
-    materiais_dados = [float(value) for value in consumo_materiais.values()]
-
-    # --- Lavagens por Contrato ---
-    lavagens_por_contrato = lavagens_periodo.filter(status="CONCLUIDA", contrato__isnull=False)\
-        .values("contrato")\
-        .annotate(total_lavagens=Count("id"))\
-        .order_by("-total_lavagens")
-
-    contrato_labels = [item["contrato"] for item in lavagens_por_contrato]
-    contrato_dados = [item["total_lavagens"] for item in lavagens_por_contrato]
-
-    # --- Lavagens por Transporte/Equipamento ---
-    lavagens_por_transporte = lavagens_periodo.filter(status="CONCLUIDA", transporte_equipamento__isnull=False)\
-        .values("transporte_equipamento__nome")\
-        .annotate(total_lavagens=Count("id"))\
-        .order_by("-total_lavagens")
-
-    transporte_labels = [item["transporte_equipamento__nome"] for item in lavagens_por_transporte]
-    transporte_dados = [item["total_lavagens"] for item in lavagens_por_transporte]
+    if relatorio is None:
+        relatorio = relatorio_periodo(data_inicio, data_fim, base_filtro_id)
 
     # --- Contexto para o Template ---
     estatisticas = {
-        "total_lavagens": total_lavagens,
-        "lavagens_em_andamento": lavagens_em_andamento,
-        "lavagens_concluidas": lavagens_concluidas,
-        "lavagens_canceladas": lavagens_canceladas,
-        "faturamento_mes": faturamento_mes,
-        "faturamento_dia": faturamento_dia,
-        "tempo_medio_lavagem": tempo_medio,
-        "lavagens_por_base": lavagens_por_base,
-        "lavagens_por_tipo": lavagens_por_tipo,
+        **relatorio["estatisticas"],
+        "faturamento_dia": faturamento_do_dia(hoje),
     }
     
+    # Relatórios guardados antes da análise de durações não têm essa chave.
+    duracoes = relatorio.get("duracoes")
+    
     # Obter todas as bases para o filtro do template
     bases_disponiveis = Base.objects.all().order_by('nome')
 
@@ -364,22 +312,25 @@ def relatorios(request):
         "estatisticas": estatisticas,
         "data_inicio": data_inicio.strftime('%Y-%m-%d'),
         "data_fim": data_fim.strftime('%Y-%m-%d'),
-        "ticket_medio": ticket_medio,
-        "faturamento_labels": json.dumps(faturamento_labels),
-        "faturamento_dados": json.dumps(faturamento_dados),
+        "ticket_medio": relatorio["ticket_medio"],
+        "faturamento_labels": json.dumps(relatorio["faturamento_labels"]),
+        "faturamento_dados": json.dumps(relatorio["faturamento_dados"]),
         "bases": bases_disponiveis,
         "base_filtro": base_filtro_id,
-        "lavadores_labels": json.dumps(lavadores_labels),
-        "lavadores_dados": json.dumps(lavadores_dados),
-        "ranking_labels": json.dumps(ranking_labels),
-        "ranking_dados": json.dumps(ranking_dados),
-        "materiais_labels": json.dumps(materiais_labels),
-        "materiais_dados": json.dumps(materiais_dados),
-        "contrato_labels": json.dumps(contrato_labels),
-        "contrato_dados": json.dumps(contrato_dados),
-        "transporte_labels": json.dumps(transporte_labels),
-        "transporte_dados": json.dumps(transporte_dados),
-        "ranking_carros_contratos": ranking_carros_contratos,
+        "lavadores_labels": json.dumps(relatorio["lavadores_labels"]),
+        "lavadores_dados": json.dumps(relatorio["lavadores_dados"]),
+        "ranking_labels": json.dumps(relatorio["ranking_labels"]),
+        "ranking_dados": json.dumps(relatorio["ranking_dados"]),
+        "materiais_labels": json.dumps(relatorio["materiais_labels"]),
+        "materiais_dados": json.dumps(relatorio["materiais_dados"]),
+        "contrato_labels": json.dumps(relatorio["contrato_labels"]),
+        "contrato_dados": json.dumps(relatorio["contrato_dados"]),
+        "transporte_labels": json.dumps(relatorio["transporte_labels"]),
+        "transporte_dados": json.dumps(relatorio["transporte_dados"]),
+        "ranking_carros_contratos": relatorio["ranking_carros_contratos"],
+        "duracoes": duracoes,
+        "duracoes_faixas": json.dumps(duracoes["faixas"] if duracoes else []),
+        "duracoes_histograma": json.dumps(duracoes["geral"]["histograma"] if duracoes else []),
 
     }
     
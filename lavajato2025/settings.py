@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import tempfile
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -91,6 +93,43 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Baseado em arquivos para ser compartilhado entre os workers do gunicorn
+# (o cache em memória é por processo e não veria as invalidações dos outros).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'lavajato2025-cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    }
+}
+
+# Tempo de vida do cache de relatórios (segundos): períodos que incluem o mês
+# corrente e períodos já fechados. As chaves são versionadas, então períodos
+# fechados só são recalculados quando alguma lavagem deles é alterada.
+RELATORIOS_CACHE_TTL = 5 * 60
+RELATORIOS_CACHE_TTL_FECHADO = 30 * 24 * 60 * 60
+
+# Relatórios com mais dias que isto são calculados em segundo plano pelo
+# worker `python manage.py processar_tarefas` (fila no próprio banco).
+RELATORIOS_ASYNC_MIN_DIAS = 366
+
+# Conexões simultâneas do feed ao vivo (/eventos/, SSE) por processo; cada uma
+# ocupa uma thread, então o gunicorn deve rodar com --worker-class gthread e
+# mais threads que isto. Ver lavagens.ao_vivo.
+AO_VIVO_CONEXOES_POR_PROCESSO = 8
+
+# Listas HTML paginadas contam até este número de linhas; acima dele mostram
+# uma estimativa do banco ("estimativa", só no PostgreSQL) ou apenas
+# Anterior/Próxima ("sem_total"). Ver lavagens.paginacao.
+PAGINACAO_LIMITE_CONTAGEM = 5000
+PAGINACAO_ACIMA_DO_LIMITE = "estimativa"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -145,14 +184,23 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 # Django REST Framework
+# Perfil de produção da API: sem DEBUG, a API navegável (BrowsableAPIRenderer)
+# sai da lista de renderizadores.
+API_PRODUCAO = not DEBUG
+
+# JSON via orjson (com volta para o json padrão) e MessagePack pelo Accept
+# quando o pacote opcional msgpack estiver instalado; ver lavagens.renderizadores.
+API_RENDERIZADORES = ['lavagens.renderizadores.JSONRapidoRenderer']
+if find_spec('msgpack') is not None:
+    API_RENDERIZADORES.append('lavagens.renderizadores.MessagePackRenderer')
+if not API_PRODUCAO:
+    API_RENDERIZADORES.append('rest_framework.renderers.BrowsableAPIRenderer')
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
-    'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ],
+    'DEFAULT_RENDERER_CLASSES': API_RENDERIZADORES,
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }